@@ -0,0 +1,269 @@
+#!/usr/bin/env python3
+"""
+Reproducible benchmarks of the PDF extractor on generated documents.
+
+Each scenario builds its input with PyMuPDF (fixed seeds, so every run sees
+the same bytes) and times one stage of extract_pdf.py in a fresh process,
+reporting the best wall time of --repeat runs, the peak RSS of that process
+and a digest of the output, so two versions can be checked for identical
+results as well as compared for speed:
+
+    classify     post-processing of 1.5M characters of thesis text
+                 (classify_lines, or mark_formulas + detect_table_structure
+                 in versions before it)
+    scan         6 pages, each one 2000x2800 JPEG (layout pass decoding images)
+    thesis       240 text-heavy pages with headings and ruled tables
+    vector_grid  4 pages, a 150x150 ruled grid on page 3 (table detection),
+                 with the default stage budgets, tables=2 and tables=0 (unlimited)
+
+Usage:
+    python benchmark.py [--scenario NAME ...] [--repeat N] [--json]
+
+To compare with an earlier version, check it out next to this one and point
+--scripts-dir at its scripts directory; options an older extract_pdf does
+not know (e.g. stage_budgets) are left out and listed in the result:
+
+    git worktree add /tmp/before <commit>
+    python benchmark.py --scripts-dir /tmp/before/scripts
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import hashlib
+import inspect
+import argparse
+import resource
+import tempfile
+import subprocess
+
+import fitz
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+CJK_FONT = "china-s"
+
+CLASSIFY_CHARS = 1_500_000
+CLASSIFY_LINES = [
+    "本文提出了一种基于注意力机制的图像识别方法，在多个公开数据集上取得了较好的效果。",
+    "The proposed model is trained end to end with stochastic gradient descent.",
+    "4.2 实验结果与分析",
+    "𝐿= −",
+    "𝑁",
+    "∑",
+    "𝑖=1",
+    "𝑦𝑖log(𝑝𝑖)",
+    "其中 𝛼 是学习率，𝑁 是样本数量。",
+    "数据集 类别数 训练集 测试集",
+    "CIFAR-10 10 50,000 10,000",
+    "ImageNet 1,000 1,281,167 50,000",
+    "Accuracy",
+    "95.6%",
+    "1. 这是一个列表项目",
+    "",
+]
+
+
+def classify_text() -> str:
+    """Thesis-like extracted text: body, headings, formula fragments and aligned table rows"""
+    rng = random.Random(11)
+    lines = []
+    length = 0
+    while length < CLASSIFY_CHARS:
+        line = rng.choice(CLASSIFY_LINES)
+        lines.append(line)
+        length += len(line) + 1
+    return "\n".join(lines)
+
+
+def noise_jpeg(width: int, height: int, seed: int) -> bytes:
+    samples = random.Random(seed).randbytes(width * height * 3)
+    return fitz.Pixmap(fitz.csRGB, width, height, samples, False).tobytes("jpg", jpg_quality=90)
+
+
+def make_scan_pdf(path: str) -> None:
+    doc = fitz.open()
+    for p in range(6):
+        page = doc.new_page()
+        page.insert_image(page.rect, stream=noise_jpeg(2000, 2800, p))
+        page.insert_text((72, 72), f"Scanned page {p + 1}")
+    doc.save(path)
+    doc.close()
+
+
+def make_thesis_pdf(path: str) -> None:
+    font = fitz.Font(CJK_FONT)
+    doc = fitz.open()
+    for p in range(240):
+        page = doc.new_page()
+        writer = fitz.TextWriter(page.rect)
+        y = 80
+        if p % 20 == 0:
+            writer.append((72, y), f"第{p // 20 + 1}章 研究内容", font=font, fontsize=18)
+            y += 30
+        for i in range(38):
+            writer.append((72, y), f"这是第{p + 1}页的第{i + 1}行正文内容，用于测试提取和版面分析的速度。",
+                          font=font, fontsize=11)
+            y += 16
+        if p % 10 == 5:
+            shape = page.new_shape()
+            for r in range(4):
+                shape.draw_line((72, y + r * 18), (372, y + r * 18))
+            for c in range(4):
+                shape.draw_line((72 + c * 100, y), (72 + c * 100, y + 54))
+            shape.finish(color=(0, 0, 0), width=0.5)
+            shape.commit()
+            for r, row in enumerate([["数据集", "类别数", "训练集"], ["CIFAR-10", "10", "50,000"],
+                                     ["ImageNet", "1,000", "1,281,167"]]):
+                for c, text in enumerate(row):
+                    writer.append((76 + c * 100, y + r * 18 + 13), text, font=font, fontsize=10)
+        writer.write_text(page)
+    doc.save(path)
+    doc.close()
+
+
+def make_vector_grid_pdf(path: str, size: int = 150) -> None:
+    font = fitz.Font(CJK_FONT)
+    doc = fitz.open()
+    for p in range(4):
+        page = doc.new_page()
+        writer = fitz.TextWriter(page.rect)
+        writer.append((72, 60), f"第{p + 1}页 正文内容，用于测试。", font=font, fontsize=11)
+        if p == 2:
+            shape = page.new_shape()
+            for i in range(size):
+                y = 100 + i * 600 / size
+                shape.draw_line((60, y), (540, y))
+                x = 60 + i * 480 / size
+                shape.draw_line((x, 100), (x, 700))
+            shape.finish(color=(0, 0, 0), width=0.3)
+            shape.commit()
+            for i in range(0, size, 3):
+                for j in range(0, size, 10):
+                    writer.append((62 + j * 480 / size, 100 + (i + 1) * 600 / size - 0.5), "8",
+                                  font=font, fontsize=2)
+        writer.write_text(page)
+    doc.save(path)
+    doc.close()
+
+
+# name -> (input builder or None for classify, [(variant, extract_pdf_with_layout options)])
+SCENARIOS = {
+    "classify": (None, [("", {})]),
+    "scan": (make_scan_pdf, [("", {})]),
+    "thesis": (make_thesis_pdf, [("", {})]),
+    "vector_grid": (make_vector_grid_pdf, [("default budgets", {}),
+                                           ("tables=2", {"stage_budgets": {"tables": 2}}),
+                                           ("tables=0", {"stage_budgets": {"tables": 0}})]),
+}
+
+
+def peak_rss_mb() -> float:
+    """Peak RSS of this process; ru_maxrss also counts the parent's peak before exec on Linux"""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+def run_job(job: dict) -> dict:
+    """Time one scenario variant in this process, with job["scripts_dir"] first on sys.path"""
+    sys.path.insert(0, job["scripts_dir"])
+    import extract_pdf
+
+    if job["scenario"] == "classify":
+        text = classify_text()
+        if hasattr(extract_pdf, "classify_lines"):
+            classify = extract_pdf.classify_lines
+        else:
+            def classify(text):
+                return extract_pdf.detect_table_structure(extract_pdf.mark_formulas(text))
+        started = time.perf_counter()
+        output = classify(text)
+        elapsed = time.perf_counter() - started
+        record = {"chars": len(text), "mchars_per_s": round(len(text) / elapsed / 1e6, 2)}
+        digest_of = output
+        dropped = []
+    else:
+        accepted = inspect.signature(extract_pdf.extract_pdf_with_layout).parameters
+        options = {k: v for k, v in job["options"].items() if k in accepted}
+        dropped = sorted(set(job["options"]) - set(options))
+        with tempfile.TemporaryDirectory() as output_dir:
+            started = time.perf_counter()
+            result = extract_pdf.extract_pdf_with_layout(job["pdf"], output_dir, **options)
+            elapsed = time.perf_counter() - started
+            images = hashlib.sha256()
+            for name in sorted(os.listdir(output_dir)):
+                with open(os.path.join(output_dir, name), 'rb') as f:
+                    images.update(name.encode('utf-8') + hashlib.sha256(f.read()).digest())
+        record = {"images": len(result["images"]), "images_sha256": images.hexdigest()[:16],
+                  "degraded_pages": [page["page"] for page in result.get("degraded_pages", [])]}
+        digest_of = result["text_with_images"]
+
+    record.update(
+        elapsed_s=round(elapsed, 3),
+        peak_rss_mb=peak_rss_mb(),
+        output_sha256=hashlib.sha256(digest_of.encode('utf-8')).hexdigest()[:16],
+    )
+    if dropped:
+        record["unsupported_options"] = dropped
+    return record
+
+
+def run_scenario(name: str, work_dir: str, scripts_dir: str, repeat: int):
+    """Yield the best of repeat fresh-process runs of each variant of a scenario"""
+    build, variants = SCENARIOS[name]
+    pdf = None
+    if build:
+        pdf = os.path.join(work_dir, f"{name}.pdf")
+        build(pdf)
+    for variant, options in variants:
+        job = {"scenario": name, "pdf": pdf, "options": options, "scripts_dir": scripts_dir}
+        runs = []
+        for _ in range(repeat):
+            completed = subprocess.run([sys.executable, os.path.abspath(__file__), "--job", json.dumps(job)],
+                                       capture_output=True, text=True, check=True)
+            runs.append(json.loads(completed.stdout.splitlines()[-1]))
+        best = min(runs, key=lambda run: run["elapsed_s"])
+        yield {"scenario": name, "variant": variant, **best}
+
+
+def format_record(record: dict) -> str:
+    name = record["scenario"] + (f" ({record['variant']})" if record["variant"] else "")
+    line = f"{name:<32} {record['elapsed_s']:>8.3f}s {record['peak_rss_mb']:>8.1f}MB"
+    details = {k: v for k, v in record.items()
+               if k not in ("scenario", "variant", "elapsed_s", "peak_rss_mb")}
+    return line + "  " + " ".join(f"{k}={v}" for k, v in details.items())
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the PDF extractor on generated documents')
+    parser.add_argument('--scenario', action='append', choices=sorted(SCENARIOS),
+                        help='Run only this scenario (repeatable; default all)')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='Runs per scenario, each in a fresh process; the fastest is reported')
+    parser.add_argument('--scripts-dir', default=SCRIPTS_DIR,
+                        help='scripts directory of the extract_pdf.py version to benchmark')
+    parser.add_argument('--json', action='store_true', help='Print one JSON record per result')
+    parser.add_argument('--job', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.job:
+        print(json.dumps(run_job(json.loads(args.job))))
+        return
+
+    scripts_dir = os.path.abspath(args.scripts_dir)
+    with tempfile.TemporaryDirectory() as work_dir:
+        for name in args.scenario or SCENARIOS:
+            for record in run_scenario(name, work_dir, scripts_dir, max(1, args.repeat)):
+                print(json.dumps(record, ensure_ascii=False) if args.json else format_record(record),
+                      flush=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,661 @@
+#!/usr/bin/env python3
+"""
+DOCX extraction script
+Extracts text with the markers of extract_pdf.py ([FIGURE:docximgN],
+[TABLE_START]...[TABLE_END], [FORMULA: ...]) for LLM processing, in one
+streaming pass over word/document.xml
+"""
+
+import sys
+import os
+import re
+import json
+import zipfile
+import argparse
+import contextlib
+import posixpath
+import xml.etree.ElementTree as ET
+from io import BytesIO
+
+from extract_pdf import FrameWriter, directory_writer, format_table_as_markers
+from progress import ProgressReporter, NO_PROGRESS
+from token_budget import TokenEstimator, DEFAULT_TOKEN_BUDGET, plan_chunks
+
+W_NS = 'http://schemas.openxmlformats.org/wordprocessingml/2006/main'
+M_NS = 'http://schemas.openxmlformats.org/officeDocument/2006/math'
+R_NS = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships'
+A_NS = 'http://schemas.openxmlformats.org/drawingml/2006/main'
+V_NS = 'urn:schemas-microsoft-com:vml'
+MC_NS = 'http://schemas.openxmlformats.org/markup-compatibility/2006'
+PKG_REL_NS = 'http://schemas.openxmlformats.org/package/2006/relationships'
+
+
+def _w(name: str) -> str:
+    return f'{{{W_NS}}}{name}'
+
+
+def _m(name: str) -> str:
+    return f'{{{M_NS}}}{name}'
+
+
+W_BODY = _w('body')
+W_P = _w('p')
+W_TBL = _w('tbl')
+W_TR = _w('tr')
+W_TC = _w('tc')
+W_T = _w('t')
+W_VAL = _w('val')
+W_PPR = _w('pPr')
+W_TCPR = _w('tcPr')
+W_TRPR = _w('trPr')
+A_BLIP = f'{{{A_NS}}}blip'
+V_IMAGEDATA = f'{{{V_NS}}}imagedata'
+R_EMBED = f'{{{R_NS}}}embed'
+R_LINK = f'{{{R_NS}}}link'
+R_ID = f'{{{R_NS}}}id'
+
+# Deleted revisions (and the source of moved text, kept at its destination),
+# field instructions, alternate (VML) renderings of drawings,
+# footnote/comment anchors and run/paragraph properties carry no document text
+SKIPPED_TAGS = frozenset([
+    _w('del'), _w('delText'), _w('moveFrom'), _w('instrText'), _w('pPr'), _w('rPr'), _w('sectPr'),
+    _w('footnoteReference'), _w('endnoteReference'), _w('commentReference'),
+    f'{{{MC_NS}}}Fallback',
+])
+LINE_BREAK_TAGS = frozenset([_w('br'), _w('cr')])
+
+HEADING_STYLE_PATTERN = re.compile(r'^heading\s*(\d)$', re.IGNORECASE)
+TOC_STYLE_PATTERN = re.compile(r'^toc\s*(\d)$', re.IGNORECASE)
+# Body text outline level (w:outlineLvl 9)
+BODY_OUTLINE_LEVEL = 9
+FIGURE_MARKER_PATTERN = re.compile(r'\n?\[FIGURE:[^\]]*\]\n?')
+BLANK_LINES_PATTERN = re.compile(r'\n{2,}')
+# TOC entries end in a tab (or leader) and the page number
+TOC_PAGE_PATTERN = re.compile(r'[\t.…·\s]+([\dIVXivx]+)\s*$')
+
+# Progress events are emitted every this fraction of document.xml
+PROGRESS_STEP = 0.02
+
+
+def read_paragraph_styles(zf: zipfile.ZipFile) -> dict:
+    """
+    Paragraph style id -> ("heading", level) or ("toc", level), from the
+    style names ("heading 1", "toc 2") or outline levels in word/styles.xml,
+    following basedOn for custom styles. Other styles are left out.
+    """
+    try:
+        root = ET.fromstring(zf.read('word/styles.xml'))
+    except (KeyError, ET.ParseError):
+        return {}
+
+    raw = {}
+    for style in root.iter(_w('style')):
+        if style.get(_w('type')) != 'paragraph':
+            continue
+        name = style.find(_w('name'))
+        based_on = style.find(_w('basedOn'))
+        outline = style.find(f'{W_PPR}/{_w("outlineLvl")}')
+        raw[style.get(_w('styleId'))] = (
+            name.get(W_VAL, '') if name is not None else '',
+            based_on.get(W_VAL) if based_on is not None else None,
+            int(outline.get(W_VAL)) if outline is not None else None,
+        )
+
+    def resolve(style_id, seen):
+        if style_id not in raw or style_id in seen:
+            return None
+        seen.add(style_id)
+        name, based_on, outline = raw[style_id]
+        match = TOC_STYLE_PATTERN.match(name)
+        if match:
+            return ("toc", int(match.group(1)))
+        match = HEADING_STYLE_PATTERN.match(name)
+        if match:
+            return ("heading", int(match.group(1)))
+        if outline is not None:
+            return ("heading", outline + 1) if outline < BODY_OUTLINE_LEVEL else None
+        return resolve(based_on, seen)
+
+    styles = {}
+    for style_id in raw:
+        resolved = resolve(style_id, set())
+        if resolved:
+            styles[style_id] = resolved
+    return styles
+
+
+def read_relationships(zf: zipfile.ZipFile) -> dict:
+    """Relationship id of document.xml -> zip member it targets, or None for external targets"""
+    try:
+        root = ET.fromstring(zf.read('word/_rels/document.xml.rels'))
+    except (KeyError, ET.ParseError):
+        return {}
+    relationships = {}
+    for rel in root.iter(f'{{{PKG_REL_NS}}}Relationship'):
+        target = rel.get('Target', '')
+        if rel.get('TargetMode') == 'External':
+            relationships[rel.get('Id')] = None
+        elif target.startswith('/'):
+            relationships[rel.get('Id')] = target.lstrip('/')
+        else:
+            relationships[rel.get('Id')] = posixpath.normpath(posixpath.join('word', target))
+    return relationships
+
+
+# OMML (Office Math) to LaTeX
+
+LATEX_SYMBOLS = {
+    'α': r'\alpha', 'β': r'\beta', 'γ': r'\gamma', 'δ': r'\delta', 'ε': r'\epsilon',
+    'ϵ': r'\epsilon', 'ζ': r'\zeta', 'η': r'\eta', 'θ': r'\theta', 'ι': r'\iota',
+    'κ': r'\kappa', 'λ': r'\lambda', 'μ': r'\mu', 'ν': r'\nu', 'ξ': r'\xi', 'π': r'\pi',
+    'ρ': r'\rho', 'σ': r'\sigma', 'τ': r'\tau', 'υ': r'\upsilon', 'φ': r'\varphi',
+    'ϕ': r'\phi', 'χ': r'\chi', 'ψ': r'\psi', 'ω': r'\omega',
+    'Γ': r'\Gamma', 'Δ': r'\Delta', 'Θ': r'\Theta', 'Λ': r'\Lambda', 'Ξ': r'\Xi',
+    'Π': r'\Pi', 'Σ': r'\Sigma', 'Φ': r'\Phi', 'Ψ': r'\Psi', 'Ω': r'\Omega',
+    '≤': r'\leq', '≥': r'\geq', '≠': r'\neq', '≈': r'\approx', '≡': r'\equiv',
+    '×': r'\times', '÷': r'\div', '±': r'\pm', '∓': r'\mp', '·': r'\cdot', '⋅': r'\cdot',
+    '∞': r'\infty', '∈': r'\in', '∉': r'\notin', '⊂': r'\subset', '⊆': r'\subseteq',
+    '∪': r'\cup', '∩': r'\cap', '→': r'\rightarrow', '←': r'\leftarrow',
+    '⇒': r'\Rightarrow', '⇔': r'\Leftrightarrow', '∂': r'\partial', '∇': r'\nabla',
+    '∀': r'\forall', '∃': r'\exists', '¬': r'\neg', '∧': r'\wedge', '∨': r'\vee',
+    '−': '-', '…': r'\ldots', '⋯': r'\cdots', '′': "'", '∑': r'\sum', '∏': r'\prod', '∫': r'\int',
+    '%': r'\%', '#': r'\#', '{': r'\{', '}': r'\}',
+}
+LATEX_SYMBOL_TABLE = str.maketrans(
+    {char: (command + ' ' if command[-1].isalpha() else command) for char, command in LATEX_SYMBOLS.items()}
+)
+NARY_OPERATORS = {
+    '∑': r'\sum', '∏': r'\prod', '∐': r'\coprod', '∫': r'\int', '∬': r'\iint',
+    '∭': r'\iiint', '∮': r'\oint', '⋃': r'\bigcup', '⋂': r'\bigcap',
+}
+ACCENTS = {
+    '̂': r'\hat', '^': r'\hat', '̃': r'\tilde', '~': r'\tilde',
+    '̄': r'\bar', '̅': r'\bar', '⃗': r'\vec', '→': r'\vec',
+    '̇': r'\dot', '̈': r'\ddot',
+}
+DELIMITERS = {'{': r'\{', '}': r'\}', '⟨': r'\langle', '⟩': r'\rangle', '‖': r'\|', '|': '|', '': '.'}
+FUNCTION_NAMES = frozenset([
+    'sin', 'cos', 'tan', 'cot', 'sec', 'csc', 'arcsin', 'arccos', 'arctan', 'sinh', 'cosh',
+    'tanh', 'log', 'ln', 'lg', 'exp', 'lim', 'max', 'min', 'sup', 'inf', 'det', 'arg', 'deg',
+])
+
+
+def omml_to_latex(math) -> str:
+    """LaTeX for an m:oMath (or m:oMathPara) element"""
+    return re.sub(r'\s+', ' ', _omml_children(math)).strip()
+
+
+def _omml_children(element) -> str:
+    return ''.join(_omml(child) for child in element)
+
+
+def _omml_arg(element, name: str) -> str:
+    child = element.find(_m(name))
+    return _omml_children(child).strip() if child is not None else ''
+
+
+def _omml_prop(element, prop: str, name: str, default=None):
+    node = element.find(f'{_m(prop)}/{_m(name)}')
+    if node is None:
+        return default
+    return node.get(_m('val'), default)
+
+
+def _function_name(name: str) -> str:
+    return '\\' + name + ' ' if name.strip() in FUNCTION_NAMES else name
+
+
+def _omml(element) -> str:
+    tag = element.tag
+    if not tag.startswith(f'{{{M_NS}}}'):
+        # Word run properties and the like inside math
+        return ''
+    name = tag[len(M_NS) + 2:]
+    if name.endswith('Pr'):
+        return ''
+
+    if name == 'r':
+        text = ''.join(t.text or '' for t in element.iter(_m('t')))
+        return text.translate(LATEX_SYMBOL_TABLE)
+    if name == 'f':
+        num, den = _omml_arg(element, 'num'), _omml_arg(element, 'den')
+        fraction_type = _omml_prop(element, 'fPr', 'type')
+        if fraction_type == 'lin':
+            return f'{num}/{den}'
+        if fraction_type == 'noBar':
+            return rf'\binom{{{num}}}{{{den}}}'
+        return rf'\frac{{{num}}}{{{den}}}'
+    if name == 'sSup':
+        return f"{{{_omml_arg(element, 'e')}}}^{{{_omml_arg(element, 'sup')}}}"
+    if name == 'sSub':
+        return f"{{{_omml_arg(element, 'e')}}}_{{{_omml_arg(element, 'sub')}}}"
+    if name == 'sSubSup':
+        return (f"{{{_omml_arg(element, 'e')}}}_{{{_omml_arg(element, 'sub')}}}"
+                f"^{{{_omml_arg(element, 'sup')}}}")
+    if name == 'sPre':
+        return (f"{{}}_{{{_omml_arg(element, 'sub')}}}^{{{_omml_arg(element, 'sup')}}}"
+                f"{{{_omml_arg(element, 'e')}}}")
+    if name == 'rad':
+        degree = _omml_arg(element, 'deg')
+        base = _omml_arg(element, 'e')
+        return rf'\sqrt[{degree}]{{{base}}}' if degree else rf'\sqrt{{{base}}}'
+    if name == 'nary':
+        operator = _omml_prop(element, 'naryPr', 'chr', '∫')
+        latex = NARY_OPERATORS.get(operator, operator)
+        sub, sup = _omml_arg(element, 'sub'), _omml_arg(element, 'sup')
+        if sub:
+            latex += f'_{{{sub}}}'
+        if sup:
+            latex += f'^{{{sup}}}'
+        return f"{latex} {_omml_arg(element, 'e')} "
+    if name == 'd':
+        begin = _omml_prop(element, 'dPr', 'begChr', '(')
+        end = _omml_prop(element, 'dPr', 'endChr', ')')
+        separator = _omml_prop(element, 'dPr', 'sepChr', '|')
+        items = [_omml_children(e).strip() for e in element.findall(_m('e'))]
+        return (rf'\left{DELIMITERS.get(begin, begin)} '
+                + f' {DELIMITERS.get(separator, separator)} '.join(items)
+                + rf' \right{DELIMITERS.get(end, end)}')
+    if name == 'func':
+        return f"{_function_name(_omml_arg(element, 'fName'))}{{{_omml_arg(element, 'e')}}}"
+    if name == 'acc':
+        accent = ACCENTS.get(_omml_prop(element, 'accPr', 'chr', '̂'), r'\hat')
+        return f"{accent}{{{_omml_arg(element, 'e')}}}"
+    if name == 'bar':
+        command = r'\overline' if _omml_prop(element, 'barPr', 'pos', 'bot') == 'top' else r'\underline'
+        return f"{command}{{{_omml_arg(element, 'e')}}}"
+    if name == 'limLow':
+        return f"{_function_name(_omml_arg(element, 'e'))}_{{{_omml_arg(element, 'lim')}}}"
+    if name == 'limUpp':
+        return rf"\overset{{{_omml_arg(element, 'lim')}}}{{{_omml_arg(element, 'e')}}}"
+    if name == 'groupChr':
+        base = _omml_arg(element, 'e')
+        if _omml_prop(element, 'groupChrPr', 'pos', 'bot') == 'top':
+            return rf'\overbrace{{{base}}}'
+        return rf'\underbrace{{{base}}}'
+    if name == 'eqArr':
+        rows = [_omml_children(e).strip() for e in element.findall(_m('e'))]
+        return r'\begin{aligned}' + r' \\ '.join(rows) + r'\end{aligned}'
+    if name == 'm':
+        rows = [' & '.join(_omml_children(e).strip() for e in row.findall(_m('e')))
+                for row in element.findall(_m('mr'))]
+        return r'\begin{matrix}' + r' \\ '.join(rows) + r'\end{matrix}'
+    # oMath, e, num, box, borderBox, phant, ...
+    return _omml_children(element)
+
+
+class DocxExtractor:
+    """
+    Extracts a DOCX in document order from one iterparse pass over
+    word/document.xml.
+
+    Each outermost paragraph or table is converted once its end tag has
+    been parsed and is then dropped from the tree, so memory holds one block
+    at a time. Images are written (to output_dir, or through
+    image_writer(filename, data)) as docximgN in order of first occurrence;
+    a picture used again keeps its id.
+
+    Paragraphs with a heading style (by name, outline level or basedOn)
+    become outline headings; paragraphs with a TOC style are collected as
+    toc entries and left out of the text unless keep_boilerplate is set.
+    """
+
+    def __init__(self, zf: zipfile.ZipFile, image_writer, keep_boilerplate: bool = False,
+                 progress: ProgressReporter = None):
+        self.zf = zf
+        self.write_image = image_writer
+        self.keep_boilerplate = keep_boilerplate
+        self.progress = progress or NO_PROGRESS
+        self.styles = read_paragraph_styles(zf)
+        self.relationships = read_relationships(zf)
+        self.text_parts = []
+        self.text_length = 0
+        self.images = []
+        self.images_by_target = {}
+        self.image_counter = 0
+        self.duplicate_images = 0
+        self.tables = []
+        self.headings = []
+        self.toc_entries = []
+        self.equation_count = 0
+
+    def run(self) -> None:
+        total = self.zf.getinfo('word/document.xml').file_size
+        step = max(1, int(total * PROGRESS_STEP))
+        next_report = step
+        open_blocks = 0
+        body = None
+
+        with self.zf.open('word/document.xml') as stream:
+            for event, element in ET.iterparse(stream, events=('start', 'end')):
+                tag = element.tag
+                if event == 'start':
+                    if tag == W_P or tag == W_TBL:
+                        open_blocks += 1
+                    elif tag == W_BODY:
+                        body = element
+                    continue
+                if tag != W_P and tag != W_TBL:
+                    continue
+
+                open_blocks -= 1
+                if open_blocks:
+                    # Inside a table or a text box; converted with its outermost block
+                    continue
+                if tag == W_P:
+                    self.add_paragraph(element)
+                else:
+                    self.add_table(element)
+                element.clear()
+                if body is not None:
+                    body.clear()
+
+                if self.progress.enabled and stream.tell() >= next_report:
+                    next_report = stream.tell() + step
+                    self.progress.emit("extract", bytes_done=stream.tell(), bytes_total=total,
+                                       images=len(self.images), tables=len(self.tables))
+
+    def _append(self, text: str) -> None:
+        self.text_parts.append(text)
+        self.text_length += len(text)
+
+    def paragraph_style(self, paragraph):
+        """("heading", level), ("toc", level) or None for a w:p element"""
+        ppr = paragraph.find(W_PPR)
+        if ppr is None:
+            return None
+        outline = ppr.find(_w('outlineLvl'))
+        if outline is not None:
+            level = int(outline.get(W_VAL, BODY_OUTLINE_LEVEL))
+            return ("heading", level + 1) if level < BODY_OUTLINE_LEVEL else None
+        style = ppr.find(_w('pStyle'))
+        return self.styles.get(style.get(W_VAL)) if style is not None else None
+
+    def inline_text(self, element) -> str:
+        """Text of a paragraph (or any element) with figure and formula markers"""
+        out = []
+        self._inline(element, out)
+        return BLANK_LINES_PATTERN.sub('\n', ''.join(out)).strip('\n')
+
+    def _inline(self, element, out: list) -> None:
+        for child in element:
+            tag = child.tag
+            if tag == W_T:
+                out.append(child.text or '')
+            elif tag in SKIPPED_TAGS:
+                continue
+            elif tag == _w('tab'):
+                out.append('\t')
+            elif tag in LINE_BREAK_TAGS:
+                if child.get(_w('type')) in (None, 'textWrapping'):
+                    out.append('\n')
+            elif tag == _w('noBreakHyphen'):
+                out.append('-')
+            elif tag == _w('sym'):
+                code = int(child.get(_w('char'), '0'), 16)
+                # Symbol-font characters live in the private use area and have no text value
+                if code and not 0xE000 <= code <= 0xF8FF:
+                    out.append(chr(code))
+            elif tag == _m('oMathPara'):
+                self.equation_count += 1
+                out.append(f'\n[FORMULA_BLOCK: {omml_to_latex(child)} :END_FORMULA_BLOCK]\n')
+            elif tag == _m('oMath'):
+                self.equation_count += 1
+                out.append(f'[FORMULA: {omml_to_latex(child)} :END_FORMULA]')
+            elif tag == A_BLIP:
+                out.append(self.figure_marker(child.get(R_EMBED) or child.get(R_LINK)))
+            elif tag == V_IMAGEDATA:
+                out.append(self.figure_marker(child.get(R_ID)))
+            elif tag == W_P:
+                # Text box paragraph
+                self._inline(child, out)
+                out.append('\n')
+            else:
+                self._inline(child, out)
+
+    def figure_marker(self, relationship_id: str) -> str:
+        """Write the image a relationship points to (once) and return its marker"""
+        target = self.relationships.get(relationship_id)
+        known = self.images_by_target.get(target) if target else None
+        if known is not None:
+            known["occurrences"] += 1
+            self.duplicate_images += 1
+            return f"\n[FIGURE:{known['id']}]\n"
+
+        self.image_counter += 1
+        img_id = f"docximg{self.image_counter}"
+        if target is None:
+            # Linked (external) picture: there are no bytes to extract
+            return f"\n[FIGURE:{img_id}:no_xref]\n"
+        try:
+            data = self.zf.read(target)
+            ext = posixpath.splitext(target)[1].lstrip('.').lower() or 'png'
+            filename = f"{img_id}.{ext}"
+            self.write_image(filename, data)
+        except Exception as e:
+            sys.stderr.write(f"Warning: Failed to extract image {img_id}: {e}\n")
+            return f"\n[FIGURE:{img_id}:extraction_failed]\n"
+
+        image_entry = {"id": img_id, "filename": filename, "source": target, "occurrences": 1}
+        self.images.append(image_entry)
+        self.images_by_target[target] = image_entry
+        return f"\n[FIGURE:{img_id}]\n"
+
+    def add_paragraph(self, paragraph) -> None:
+        style = self.paragraph_style(paragraph)
+        text = self.inline_text(paragraph)
+        if not text.strip():
+            return
+
+        if style and style[0] == "toc":
+            title = FIGURE_MARKER_PATTERN.sub('', text).strip()
+            match = TOC_PAGE_PATTERN.search(title)
+            self.toc_entries.append({
+                "level": style[1],
+                "title": title[:match.start()].strip() if match else title,
+                "page_label": match.group(1) if match else None
+            })
+            if not self.keep_boilerplate:
+                return
+
+        if style and style[0] == "heading":
+            title = FIGURE_MARKER_PATTERN.sub(' ', text).strip()
+            if title:
+                self.headings.append({"level": style[1], "title": title, "offset": self.text_length})
+        self._append(text + "\n")
+
+    def add_table(self, table) -> None:
+        figures = []
+        table_data = self.table_data(table, figures)
+        if not table_data["rows"]:
+            return
+        table_data["id"] = f"table_{len(self.tables) + 1}"
+        self.tables.append(table_data)
+        # Figures in cells follow the table, the markers do not nest
+        self._append(f"\n{format_table_as_markers(table_data)}\n" + "".join(f"{marker}\n" for marker in figures))
+
+    def table_data(self, table, figures: list) -> dict:
+        """
+        Rows of a w:tbl as a grid of cell texts, plus its cells with their
+        spans: gridSpan gives colspan, vMerge continuation rows add to the
+        rowspan of the cell they continue. Covered grid positions are "".
+        Figure markers in cells are appended to figures instead.
+        """
+        cells = []
+        # Grid column -> vertically merged cell that is still open
+        merging = {}
+        row_count = col_count = 0
+
+        for row in table.iterfind(W_TR):
+            trpr = row.find(W_TRPR)
+            grid_before = trpr.find(_w('gridBefore')) if trpr is not None else None
+            col = int(grid_before.get(W_VAL, 0)) if grid_before is not None else 0
+
+            for cell in row.iterfind(W_TC):
+                tcpr = cell.find(W_TCPR)
+                span = vmerge = None
+                if tcpr is not None:
+                    span = tcpr.find(_w('gridSpan'))
+                    vmerge = tcpr.find(_w('vMerge'))
+                colspan = int(span.get(W_VAL, 1)) if span is not None else 1
+
+                if vmerge is not None and vmerge.get(W_VAL, 'continue') == 'continue' and col in merging:
+                    merging[col]["rowspan"] += 1
+                else:
+                    entry = {"row": row_count, "col": col, "rowspan": 1, "colspan": colspan,
+                             "text": self.cell_text(cell, figures)}
+                    cells.append(entry)
+                    if vmerge is not None:
+                        merging[col] = entry
+                    else:
+                        merging.pop(col, None)
+                col += colspan
+
+            col_count = max(col_count, col)
+            row_count += 1
+
+        rows = [[""] * col_count for _ in range(row_count)]
+        for entry in cells:
+            rows[entry["row"]][entry["col"]] = entry["text"]
+        return {"rows": rows, "row_count": row_count, "col_count": col_count, "cells": cells}
+
+    def cell_text(self, cell, figures: list) -> str:
+        """
+        Paragraphs of a table cell, one per line, without figure markers
+        (appended to figures); nested tables are flattened
+        """
+        # Text box paragraphs are part of their enclosing paragraph's text
+        boxed = {id(p) for box in cell.iter(_w('txbxContent')) for p in box.iter(W_P)}
+        lines = []
+        for paragraph in cell.iter(W_P):
+            if id(paragraph) in boxed:
+                continue
+            text = self.inline_text(paragraph)
+            figures.extend(marker.strip() for marker in FIGURE_MARKER_PATTERN.findall(text))
+            text = BLANK_LINES_PATTERN.sub('\n', FIGURE_MARKER_PATTERN.sub('\n', text)).strip()
+            if text:
+                lines.append(text)
+        return '\n'.join(lines)
+
+    def result(self) -> dict:
+        return {
+            "text_with_images": "".join(self.text_parts),
+            "images": self.images,
+            "duplicate_images": self.duplicate_images,
+            "tables": self.tables,
+            "outline": {"source": "styles", "headings": self.headings},
+            "toc": self.toc_entries,
+            "equation_count": self.equation_count
+        }
+
+
+def open_docx(docx) -> zipfile.ZipFile:
+    """Open a DOCX from a path or the file bytes"""
+    if isinstance(docx, bytes):
+        docx = BytesIO(docx)
+    return zipfile.ZipFile(docx)
+
+
+def extract_docx(docx, output_dir: str = None, image_writer=None, keep_boilerplate: bool = False,
+                 progress: ProgressReporter = None, token_budget: int = DEFAULT_TOKEN_BUDGET,
+                 token_rates: dict = None) -> dict:
+    """
+    Extract DOCX content with image, table and formula markers.
+
+    Args:
+        docx: Path to the DOCX file, or the DOCX bytes
+        output_dir: Directory to save extracted images
+        image_writer: Called as image_writer(filename, data) for each image
+                      instead of writing it into output_dir
+        keep_boilerplate: Keep table of contents paragraphs in the text; they
+                          are still listed in "toc"
+        progress: Reports "extract" (bytes_done, bytes_total, images, tables)
+                  and "done" events
+        token_budget: Tokens per chunk of the token_plan
+        token_rates: Token estimator rates (see token_budget.TokenEstimator)
+
+    Returns:
+        dict with text_with_images, images ([{"id", "filename", "source",
+        "occurrences"}]), duplicate_images, tables ([{"id", "rows",
+        "row_count", "col_count", "cells": [{"row", "col", "rowspan",
+        "colspan", "text"}]}]), outline ({"source": "styles", "headings":
+        [{"level", "title", "offset"}]}), toc ([{"level", "title",
+        "page_label"}]), equation_count and token_plan (see
+        token_budget.plan_chunks)
+
+    Raises:
+        ValueError: not a DOCX file
+    """
+    progress = progress or NO_PROGRESS
+    try:
+        zf = open_docx(docx)
+    except zipfile.BadZipFile as e:
+        raise ValueError(f"Not a DOCX file: {e}") from None
+    with zf:
+        if 'word/document.xml' not in zf.namelist():
+            raise ValueError("Not a DOCX file: word/document.xml is missing")
+        extractor = DocxExtractor(zf, image_writer or directory_writer(output_dir),
+                                  keep_boilerplate=keep_boilerplate, progress=progress)
+        extractor.run()
+        result = extractor.result()
+    result["token_plan"] = plan_chunks(result["text_with_images"], result["outline"]["headings"],
+                                       token_budget, TokenEstimator(token_rates))
+    progress.emit("done", images=len(result["images"]), tables=len(result["tables"]),
+                  chars=len(result["text_with_images"]))
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Extract DOCX text with image, table and formula markers')
+    parser.add_argument('docx_path', help='Path to the DOCX file, or - to read the DOCX from stdin')
+    parser.add_argument('output_dir', nargs='?',
+                        help='Directory to save extracted images (not used with --archive)')
+    parser.add_argument('--archive', action='store_true',
+                        help='Write the result and all images to stdout as one framed binary stream '
+                             '(see extract_pdf.FrameWriter) instead of JSON plus image files')
+    parser.add_argument('--keep-boilerplate', action='store_true',
+                        help='Keep table of contents paragraphs in the text')
+    parser.add_argument('--progress-fd', type=int, metavar='FD',
+                        help='Write JSON-lines progress events to this open file descriptor')
+    parser.add_argument('--token-budget', type=int, default=DEFAULT_TOKEN_BUDGET,
+                        help=f'Tokens per chunk of the result\'s token_plan (default: {DEFAULT_TOKEN_BUDGET})')
+    parser.add_argument('--token-rates', metavar='FILE',
+                        help='Token estimator rates written by token_budget.py calibrate')
+    args = parser.parse_args()
+
+    if args.docx_path == '-':
+        docx = sys.stdin.buffer.read()
+    elif not os.path.exists(args.docx_path):
+        print(f"Error: DOCX file not found: {args.docx_path}", file=sys.stderr)
+        sys.exit(1)
+    else:
+        docx = args.docx_path
+
+    if not args.archive:
+        if not args.output_dir:
+            print("Error: output_dir is required unless --archive is given", file=sys.stderr)
+            sys.exit(1)
+        os.makedirs(args.output_dir, exist_ok=True)
+
+    try:
+        progress = ProgressReporter(args.progress_fd) if args.progress_fd is not None else None
+        options = {"keep_boilerplate": args.keep_boilerplate, "progress": progress,
+                   "token_budget": args.token_budget}
+        if args.token_rates:
+            options["token_rates"] = TokenEstimator.from_file(args.token_rates).rates
+        if args.archive:
+            archive = FrameWriter(sys.stdout.buffer)
+            with contextlib.redirect_stdout(sys.stderr):
+                result = extract_docx(docx, image_writer=archive.write_image, **options)
+            archive.write_json("result", result)
+            archive.close()
+        else:
+            result = extract_docx(docx, args.output_dir, **options)
+            print(json.dumps(result, ensure_ascii=False))
+    except Exception as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -8,8 +8,29 @@ import sys
 import json
 import os
 import re
+import gc
+import hashlib
+import struct
+import argparse
+import resource
+import signal
+import threading
+import time
+import contextlib
+import unicodedata
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
 import fitz  # PyMuPDF
 
+from extraction_cache import ExtractionCache, PageStore
+from image_normalizer import ImageNormalizer, DEFAULT_MAX_SIDE, DEFAULT_MAX_DPI
+from progress import ProgressReporter, NO_PROGRESS
+from token_budget import TokenEstimator, DEFAULT_TOKEN_BUDGET, plan_chunks
+
+# Bump when a change alters extraction output, so cached results are not reused
+EXTRACTOR_VERSION = "14"
+
 # Unicode math symbols that indicate potential formulas
 UNICODE_MATH_CHARS = set('𝛼𝛽𝛾𝛿𝜀𝜁𝜂𝜃𝜄𝜅𝜆𝜇𝜈𝜉𝜊𝜋𝜌𝜎𝜏𝜐𝜑𝜒𝜓𝜔'
                          '𝛢𝛣𝛤𝛥𝛦𝛧𝛨𝛩𝛪𝛫𝛬𝛭𝛮𝛯𝛰𝛱𝛲𝛳𝛴𝛵𝛶𝛷𝛸𝛹𝛺'
@@ -19,75 +40,120 @@ UNICODE_MATH_CHARS = set('𝛼𝛽𝛾𝛿𝜀𝜁𝜂𝜃𝜄𝜅𝜆𝜇𝜈
                          '∑∏∫∬∭∮∯∰∇∂∆∀∃∈∉⊂⊃⊆⊇∪∩∧∨¬⊕⊗⊙'
                          '≤≥≠≈≡≢∝∞±×÷√∛∜')
 
+# Precompiled character classes and line patterns for classify_lines()
+MATH_CHARS = frozenset(UNICODE_MATH_CHARS)
+MATH_SYMBOL_PATTERN = re.compile('[∑∏∫∂∇=±×÷]')
+FORMULA_PART_PATTERN = re.compile(r'^[𝑎-𝑧𝐴-𝑍a-zA-Z]=')
+SUBSCRIPT_PART_PATTERN = re.compile(r'^[𝑖𝑗𝑘ijk]=\d')
+
+SECTION_HEADER_PATTERN = re.compile(r'^[\d]+\.\d+\s+.+$')
+LIST_ITEM_PATTERN = re.compile(r'^[\d]+[.、]\s+.{5,}')
+NUMERIC_CELL_PATTERN = re.compile(r'^[\d,.\-+%]+$')
+IDENTIFIER_CELL_PATTERN = re.compile(r'^[A-Za-z][\w\-]+$')
+ENGLISH_HEADER_PATTERN = re.compile(r'^[A-Za-z][A-Za-z\s\-]{0,40}$')
+CHINESE_START_PATTERN = re.compile(r'^[\u4e00-\u9fa5]+')
+PERCENT_CELL_PATTERN = re.compile(r'^[\d,.]+%$')
+NUMBER_TOKEN_PATTERN = re.compile(r'^[\d,.]+$')
+
+# Lines that already carry markers are passed through unclassified
+FORMULA_MARKER_PREFIXES = ('[FORMULA: ', '[FORMULA_BLOCK: ')
+TABLE_REGION_START = '[TABLE_START]'
+TABLE_REGION_END = '[TABLE_END]'
+
+
 def is_formula_line(line: str) -> bool:
     """Check if a line is part of a formula"""
     stripped = line.strip()
     if not stripped:
         return False
 
-    # Count Unicode math characters
-    math_count = sum(1 for c in stripped if c in UNICODE_MATH_CHARS)
-
-    # Check for formula indicators
-    has_math_symbol = any(c in stripped for c in '∑∏∫∂∇=±×÷')
-    has_significant_math = math_count >= 2
-
-    # Short lines with math chars (like "𝑁", "𝑖=1", "𝐿= −")
-    is_short_math = len(stripped) <= 10 and math_count >= 1
+    # Formula symbols, or lines that look like formula parts ("𝑖=1", "𝐿= −")
+    if MATH_SYMBOL_PATTERN.search(stripped):
+        return True
+    if FORMULA_PART_PATTERN.match(stripped) or SUBSCRIPT_PART_PATTERN.match(stripped):
+        return True
 
-    # Lines that look like formula parts
-    is_formula_part = re.match(r'^[𝑎-𝑧𝐴-𝑍a-zA-Z]=', stripped) is not None
-    is_subscript_part = re.match(r'^[𝑖𝑗𝑘ijk]=\d', stripped) is not None
-
-    return has_math_symbol or has_significant_math or is_short_math or is_formula_part or is_subscript_part
+    # Two or more Unicode math characters, or one in a short line (like "𝑁")
+    if MATH_CHARS.isdisjoint(stripped):
+        return False
+    return len(stripped) <= 10 or sum(1 for c in stripped if c in MATH_CHARS) >= 2
 
 
-def mark_formulas(text: str) -> str:
+def is_table_cell_candidate(stripped: str) -> bool:
+    """Check if a stripped line looks like a single table cell from PDF extraction"""
+    if not stripped or len(stripped) > 100:  # Empty or too long for a cell
+        return False
+    # Exclude section headers (e.g., "4.2 实验结果", "第一章")
+    if stripped.startswith('第') or SECTION_HEADER_PATTERN.match(stripped):
+        return False
+    # Exclude numbered list items (e.g., "1. xxx", "• xxx")
+    if stripped.startswith(('•', '–')) or LIST_ITEM_PATTERN.match(stripped):
+        return False
+    # Numeric patterns (including comma-separated numbers like "50,000")
+    if NUMERIC_CELL_PATTERN.match(stripped):
+        return True
+    # Dataset names like CIFAR-10, ImageNet
+    if len(stripped) <= 15 and IDENTIFIER_CELL_PATTERN.match(stripped):
+        return True
+    # Short Chinese text that could be a header (not ending with sentence punctuation)
+    if len(stripped) <= 10 and not stripped.endswith(('。', '：', '；')):
+        return True
+    # Medium-length English text (headers like "Accuracy", "Model Parameters")
+    if ENGLISH_HEADER_PATTERN.match(stripped):
+        return True
+    # Chinese text up to 20 chars
+    if len(stripped) <= 20 and CHINESE_START_PATTERN.match(stripped):
+        return True
+    # Percentage values
+    return PERCENT_CELL_PATTERN.match(stripped) is not None
+
+
+def _group_formulas(lines):
     """
-    Detect and mark potential formulas containing Unicode math symbols.
-    Groups consecutive formula lines into a single block.
+    Formula stage of classify_lines(): groups consecutive formula lines into a
+    single [FORMULA: ...] or [FORMULA_BLOCK: ...] marker.
+
+    Yields (line, marked) pairs. Marked lines - formula markers and
+    [TABLE_START]...[TABLE_END] regions - are not classified any further.
     """
-    lines = text.split('\n')
-    result = []
     formula_buffer = []
+    in_table_region = False
 
-    def flush_formula_buffer():
-        """Output the formula buffer as a single block"""
-        nonlocal formula_buffer
-        if not formula_buffer:
-            return
-
+    def flush():
         if len(formula_buffer) == 1:
             # Single line formula
-            result.append(f'[FORMULA: {formula_buffer[0].strip()} :END_FORMULA]')
+            marker = f'[FORMULA: {formula_buffer[0].strip()} :END_FORMULA]'
         else:
             # Multi-line formula block - join with special separator
             content = ' '.join(line.strip() for line in formula_buffer if line.strip())
-            result.append(f'[FORMULA_BLOCK: {content} :END_FORMULA_BLOCK]')
-
-        formula_buffer = []
+            marker = f'[FORMULA_BLOCK: {content} :END_FORMULA_BLOCK]'
+        formula_buffer.clear()
+        return marker, True
 
-    for i, line in enumerate(lines):
-        stripped = line.strip()
+    for line in lines:
+        if in_table_region or line == TABLE_REGION_START or line.startswith(FORMULA_MARKER_PREFIXES):
+            if formula_buffer:
+                yield flush()
+            in_table_region = (in_table_region or line == TABLE_REGION_START) and line != TABLE_REGION_END
+            yield line, True
+            continue
 
         if is_formula_line(line):
             formula_buffer.append(line)
-        else:
-            # Not a formula line
-            if formula_buffer:
-                # Check if this non-formula line is "其中" which often follows formulas
-                if stripped.startswith('其中') and any(c in stripped for c in UNICODE_MATH_CHARS):
-                    formula_buffer.append(line)
-                    continue
+            continue
 
-                flush_formula_buffer()
+        if formula_buffer:
+            # "其中" with math symbols often continues a formula
+            stripped = line.strip()
+            if stripped.startswith('其中') and not MATH_CHARS.isdisjoint(stripped):
+                formula_buffer.append(line)
+                continue
+            yield flush()
 
-            result.append(line)
+        yield line, False
 
-    # Flush any remaining formula content
-    flush_formula_buffer()
-
-    return '\n'.join(result)
+    if formula_buffer:
+        yield flush()
 
 
 def extract_tables_with_pymupdf(page) -> list:
@@ -109,6 +175,73 @@ def extract_tables_with_pymupdf(page) -> list:
         return []
 
 
+# find_tables() defaults: edges shorter than this are dropped, and line
+# endpoints within the snap tolerance count as horizontal/vertical
+TABLE_EDGE_MIN_LENGTH = 3
+TABLE_SNAP_TOLERANCE = 3
+
+
+def may_contain_table(page, blocks: list) -> bool:
+    """
+    Cheap pre-filter deciding whether find_tables() is worth running.
+
+    find_tables() (lines strategy) builds cells from vector edges only, and
+    extract_tables_with_pymupdf() keeps tables with at least two non-empty
+    rows. That needs at least three horizontal and three vertical edges and
+    at least two lines of text inside the ruled area. Edges are counted from
+    page.get_cdrawings(), which is much cheaper than the drawing analysis in
+    find_tables().
+    """
+    horizontal = vertical = 0
+    x0 = y0 = float('inf')
+    x1 = y1 = float('-inf')
+
+    for path in page.get_cdrawings():
+        for item in path["items"]:
+            if item[0] == "l":
+                (ax, ay), (bx, by) = item[1], item[2]
+                if abs(ay - by) <= TABLE_SNAP_TOLERANCE and abs(ax - bx) >= TABLE_EDGE_MIN_LENGTH:
+                    horizontal += 1
+                elif abs(ax - bx) <= TABLE_SNAP_TOLERANCE and abs(ay - by) >= TABLE_EDGE_MIN_LENGTH:
+                    vertical += 1
+                else:
+                    continue
+                points = (item[1], item[2])
+            elif item[0] in ("re", "qu"):
+                if item[0] == "re":
+                    rx0, ry0, rx1, ry1 = item[1]
+                    points = ((rx0, ry0), (rx1, ry1))
+                else:
+                    points = item[1]
+                width = max(p[0] for p in points) - min(p[0] for p in points)
+                height = max(p[1] for p in points) - min(p[1] for p in points)
+                if width >= TABLE_EDGE_MIN_LENGTH:
+                    horizontal += 2
+                if height >= TABLE_EDGE_MIN_LENGTH:
+                    vertical += 2
+            else:
+                continue
+            x0 = min(x0, *(p[0] for p in points))
+            y0 = min(y0, *(p[1] for p in points))
+            x1 = max(x1, *(p[0] for p in points))
+            y1 = max(y1, *(p[1] for p in points))
+
+    if horizontal < 3 or vertical < 3:
+        return False
+
+    lines_inside = 0
+    for block in blocks:
+        if block["type"] != 0:
+            continue
+        for line in block["lines"]:
+            lx0, ly0, lx1, ly1 = line["bbox"]
+            if lx0 < x1 and lx1 > x0 and ly0 < y1 and ly1 > y0:
+                lines_inside += 1
+                if lines_inside >= 2:
+                    return True
+    return False
+
+
 def format_table_as_markers(table_data: dict) -> str:
     """Convert detected table to [TABLE_START]...[TABLE_END] format with row hints."""
     lines = ['[TABLE_START]']
@@ -121,251 +254,2468 @@ def format_table_as_markers(table_data: dict) -> str:
     return '\n'.join(lines)
 
 
-def detect_table_structure(text: str) -> str:
+def _group_tables(items):
     """
-    Detect potential table data based on patterns:
+    Table stage of classify_lines(): detects potential table data and wraps it
+    in [TABLE_START] [TABLE_CELL: ...] [TABLE_END] markers:
     - Multiple numbers/values separated by spaces on a line
-    - Lines with consistent columnar structure
     - PDF-extracted tables where each cell is on its own line
     """
-    lines = text.split('\n')
-    result = []
     table_buffer = []
-    in_potential_table = False
 
-    def is_table_cell_candidate(line: str) -> bool:
-        """Check if a line looks like a single table cell from PDF extraction"""
+    def flush():
+        # A real table has 4+ cells, or at least 2 with one of them a number
+        if len(table_buffer) >= 4 or (
+                len(table_buffer) >= 2 and any(NUMBER_TOKEN_PATTERN.match(row) for row in table_buffer)):
+            yield TABLE_REGION_START
+            for row in table_buffer:
+                yield f'[TABLE_CELL: {row}]'
+            yield TABLE_REGION_END
+        else:
+            # Not enough table-like content, output normally
+            yield from table_buffer
+        table_buffer.clear()
+
+    def is_candidate(item) -> bool:
+        return not item[1] and is_table_cell_candidate(item[0].strip())
+
+    items = iter(items)
+    current = next(items, None)
+    current_is_candidate = current is not None and is_candidate(current)
+
+    while current is not None:
+        following = next(items, None)
+        following_is_candidate = following is not None and is_candidate(following)
+        line, marked = current
         stripped = line.strip()
-        if not stripped or len(stripped) > 100:  # Empty or too long for a cell
-            return False
-        # Exclude section headers (e.g., "4.2 实验结果", "第一章")
-        if re.match(r'^[\d]+\.\d+\s+.+$', stripped) or stripped.startswith('第'):
-            return False
-        # Exclude numbered list items (e.g., "1. xxx", "• xxx")
-        if re.match(r'^[\d]+[.、]\s+.{5,}', stripped) or stripped.startswith(('•', '–')):
+
+        # Traditional table row with multiple columns
+        parts = () if marked else stripped.split()
+        if len(parts) >= 3 and any(NUMBER_TOKEN_PATTERN.match(p) for p in parts):
+            table_buffer.append(stripped)
+        # Single table cells: continue a sequence, or start one if the next line is a cell too
+        elif current_is_candidate and (table_buffer or following_is_candidate):
+            table_buffer.append(stripped)
+        else:
+            if table_buffer:
+                yield from flush()
+            yield line
+
+        current, current_is_candidate = following, following_is_candidate
+
+    # Handle remaining buffer
+    if len(table_buffer) >= 4:
+        yield from flush()
+    else:
+        yield from table_buffer
+
+
+def classify_lines(text: str) -> str:
+    """
+    Mark formulas and table-like data in extracted text, in one streaming pass
+    over its lines (the formula stage feeds the table stage line by line).
+
+    Already-marked regions - native [TABLE_START]...[TABLE_END] tables from
+    find_tables() and existing formula markers - are passed through untouched.
+    """
+    return '\n'.join(_group_tables(_group_formulas(text.split('\n'))))
+
+
+class ImageMemo:
+    """
+    Remembers doc.extract_image() results for images used on several pages
+    (logos in headers and the like), so each is decoded once per process.
+    """
+
+    def __init__(self, doc):
+        counts = {}
+        for page_num in range(len(doc)):
+            for xref in {img[0] for img in doc.get_page_images(page_num)}:
+                counts[xref] = counts.get(xref, 0) + 1
+        self.repeated = {xref for xref, count in counts.items() if count > 1}
+        self.images = {}
+        self.digests = {}
+
+    def extract(self, doc, xref: int) -> dict:
+        if xref not in self.repeated:
+            return doc.extract_image(xref)
+        if xref not in self.images:
+            self.images[xref] = doc.extract_image(xref)
+        return self.images[xref]
+
+    def digest(self, doc, xref: int) -> str:
+        if xref not in self.repeated:
+            return raw_image_digest(doc, xref)
+        if xref not in self.digests:
+            self.digests[xref] = raw_image_digest(doc, xref)
+        return self.digests[xref]
+
+
+class ImageBBoxIndex:
+    """
+    Grid index over a page's get_image_info() entries, used to match image
+    blocks to their xrefs when image dimensions alone are ambiguous (see
+    page_image_blocks).
+
+    Blocks are matched to the unused entry with the largest bbox overlap, so
+    side-by-side subfigures sharing a vertical center each get their own
+    image. Lookups only visit the grid cells a bbox covers.
+    """
+
+    CELL_SIZE = 64.0
+    TOLERANCE = 50.0  # pt, for blocks that overlap no entry (previous center-distance rule)
+
+    def __init__(self, image_infos: list, page_rect):
+        self.entries = image_infos
+        self.used = [False] * len(image_infos)
+        self.bounds = (page_rect.x0 - self.TOLERANCE, page_rect.y0 - self.TOLERANCE,
+                       page_rect.x1 + self.TOLERANCE, page_rect.y1 + self.TOLERANCE)
+        self.grid = {}
+        for index, info in enumerate(image_infos):
+            for cell in self._cells(info["bbox"]):
+                self.grid.setdefault(cell, []).append(index)
+
+    def _cells(self, bbox, margin: float = 0.0):
+        # Clip to the page so huge or off-page bboxes touch a bounded number of cells
+        bx0, by0, bx1, by1 = self.bounds
+        x0 = min(max(bbox[0] - margin, bx0), bx1)
+        y0 = min(max(bbox[1] - margin, by0), by1)
+        x1 = min(max(bbox[2] + margin, bx0), bx1)
+        y1 = min(max(bbox[3] + margin, by0), by1)
+        for cx in range(int(x0 // self.CELL_SIZE), int(x1 // self.CELL_SIZE) + 1):
+            for cy in range(int(y0 // self.CELL_SIZE), int(y1 // self.CELL_SIZE) + 1):
+                yield (cx, cy)
+
+    def match(self, bbox):
+        """Return the best matching unused image info for bbox, or None."""
+        candidates = set()
+        for cell in self._cells(bbox, self.TOLERANCE):
+            candidates.update(self.grid.get(cell, ()))
+
+        best = None
+        best_score = None
+        for index in sorted(candidates):
+            if self.used[index]:
+                continue
+            other = self.entries[index]["bbox"]
+            overlap_w = min(bbox[2], other[2]) - max(bbox[0], other[0])
+            overlap_h = min(bbox[3], other[3]) - max(bbox[1], other[1])
+            overlap = overlap_w * overlap_h if overlap_w > 0 and overlap_h > 0 else 0.0
+            if overlap > 0:
+                area = ((bbox[2] - bbox[0]) * (bbox[3] - bbox[1])
+                        + (other[2] - other[0]) * (other[3] - other[1]) - overlap)
+                score = (1, overlap / area if area > 0 else 1.0)
+            else:
+                dx = (bbox[0] + bbox[2] - other[0] - other[2]) / 2
+                dy = (bbox[1] + bbox[3] - other[1] - other[3]) / 2
+                distance = (dx * dx + dy * dy) ** 0.5
+                if distance >= self.TOLERANCE:
+                    continue
+                score = (0, -distance)
+            if best_score is None or score > best_score:
+                best, best_score = index, score
+
+        if best is None:
+            return None
+        self.used[best] = True
+        return self.entries[best]
+
+
+# Layout pass flags: get_text("dict") defaults without TEXT_PRESERVE_IMAGES,
+# which would put every image's binary (PNG-encoded unless stored as JPEG)
+# into the dict
+LAYOUT_TEXT_FLAGS = fitz.TEXTFLAGS_DICT & ~fitz.TEXT_PRESERVE_IMAGES
+
+
+def page_image_blocks(page) -> list:
+    """
+    Image blocks of a page with their xrefs, without decoding any image.
+
+    Blocks come from a text page built with the get_text("dict") flags, so
+    they are the image blocks get_text("dict") would return, but only their
+    geometry is read. Each block is matched to the page image with the same
+    pixel dimensions; only when several images on the page share dimensions
+    are xrefs matched by content hash, which decodes the page's images.
+
+    Returns:
+        [{"type": 1, "number", "bbox", "xref", "width", "height"}] in text
+        page order; xref is 0 when no page image matches (e.g. inline images)
+    """
+    textpage = page.get_textpage(flags=fitz.TEXTFLAGS_DICT)
+    bounds = textpage.rect
+    infos = [info for info in textpage.extractIMGINFO() if fitz.Rect(info["bbox"]) in bounds]
+    del textpage
+    if not infos:
+        return []
+
+    xrefs_by_size = {}
+    for item in page.get_images(full=True):
+        xrefs_by_size.setdefault((item[2], item[3]), set()).add(item[0])
+
+    image_index = None
+    if any(len(xrefs_by_size.get((info["width"], info["height"]), ())) > 1 for info in infos):
+        image_index = ImageBBoxIndex(page.get_image_info(xrefs=True), page.rect)
+
+    blocks = []
+    for info in infos:
+        if image_index is not None:
+            matched = image_index.match(info["bbox"])
+            xref = matched.get("xref", 0) if matched else 0
+        else:
+            xrefs = xrefs_by_size.get((info["width"], info["height"]))
+            xref = next(iter(xrefs)) if xrefs else 0
+        blocks.append({"type": 1, "number": info["number"], "bbox": info["bbox"], "xref": xref,
+                       "width": info["width"], "height": info["height"]})
+    return blocks
+
+
+def _in_textpage_order(text_blocks: list, image_blocks: list) -> list:
+    """Interleave image blocks with text blocks as get_text("dict") orders them"""
+    blocks = []
+    text_blocks = iter(text_blocks)
+    for image_block in image_blocks:
+        while len(blocks) < image_block["number"]:
+            block = next(text_blocks, None)
+            if block is None:
+                break
+            blocks.append(block)
+        blocks.append(image_block)
+    blocks.extend(text_blocks)
+    return blocks
+
+
+# MuPDF decodes JPEG 2000 images on load, so extract_image() returns them as
+# (often very large) PNGs; image normalization re-encodes them as JPEG
+JPX_FILTER = 'JPXDecode'
+
+
+# Image dictionary entries that, with the raw stream, determine the decoded image
+IMAGE_DIGEST_KEYS = ("Width", "Height", "BitsPerComponent", "ColorSpace", "Decode",
+                     "DecodeParms", "Filter", "ImageMask", "Mask")
+
+
+def raw_image_digest(doc, xref: int) -> str:
+    """
+    Content hash of an image that does not decode it: the raw (still
+    compressed) stream and decoding parameters of the image and of its soft
+    mask. The same picture stored under several xrefs hashes equal, as its
+    extracted bytes do; differently encoded copies of a picture do not.
+    """
+    digest = hashlib.sha256()
+    smask_type, smask = doc.xref_get_key(xref, "SMask")
+    for obj in (xref, int(smask.split()[0]) if smask_type == "xref" else None):
+        if obj is None:
+            continue
+        for key in IMAGE_DIGEST_KEYS:
+            digest.update(f"/{key} {doc.xref_get_key(obj, key)[1]}\n".encode())
+        digest.update(doc.xref_stream_raw(obj) or b"")
+    return digest.hexdigest()
+
+
+def extract_figure_image(doc, xref: int, image_memo: ImageMemo = None) -> dict:
+    """Image bytes of xref as figure fields: {"ext", "image"[, "source_format"]}"""
+    if image_memo is not None:
+        img_data = image_memo.extract(doc, xref)
+    else:
+        img_data = doc.extract_image(xref)
+    figure = {"ext": img_data.get("ext", "png"), "image": img_data["image"]}
+    if JPX_FILTER in doc.xref_get_key(xref, "Filter")[1]:
+        figure["source_format"] = "jpx"
+    return figure
+
+
+def _compatibility_table() -> dict:
+    """
+    str.translate() table folding compatibility characters some PDF producers
+    emit to what they stand for: Kangxi and CJK supplement radicals and CJK
+    compatibility ideographs to unified ideographs, full-width digits and
+    letters to ASCII, and Latin ligatures to their letters. Full-width CJK
+    punctuation is kept.
+    """
+    ranges = [(0x2E80, 0x2EFF), (0x2F00, 0x2FDF), (0xF900, 0xFAFF), (0xFB00, 0xFB06),
+              (0xFF10, 0xFF19), (0xFF21, 0xFF3A), (0xFF41, 0xFF5A)]
+    table = {}
+    for first, last in ranges:
+        for code in range(first, last + 1):
+            normalized = unicodedata.normalize('NFKC', chr(code))
+            if normalized != chr(code):
+                table[code] = normalized
+    return table
+
+
+COMPATIBILITY_TABLE = _compatibility_table()
+
+# Reflow: characters written without spaces between them (CJK ideographs,
+# kana, hangul and full-width punctuation)
+CJK_PATTERN = re.compile(r'[\u2e80-\u9fff\uac00-\ud7af\uf900-\ufaff\uff00-\uffef]')
+# A line starting a list item starts a new paragraph
+LIST_START_PATTERN = re.compile(r'^\s*([•·▪◦●○■□\-–—*]\s|\(?\d{1,2}[.)、]\s*\S|[（(]\d{1,2}[）)]|[a-z][.)]\s)')
+HYPHENATED_END_PATTERN = re.compile(r'[A-Za-z]-$')
+# Slack, in characters, past the next line's first word when deciding whether
+# that word would have fit on the previous line
+REFLOW_SLACK_CHARS = 1.0
+
+
+def _is_table_row(stripped: str) -> bool:
+    """Whether a line is mostly numbers separated by spaces, like a row of an unruled table"""
+    parts = stripped.split()
+    if len(parts) < 3:
+        return False
+    numbers = sum(1 for part in parts if NUMBER_TOKEN_PATTERN.match(part))
+    return numbers >= 2 and numbers * 2 >= len(parts)
+
+
+def reflow_lines(lines: list) -> str:
+    """
+    Join the lines of a text block into paragraphs.
+
+    lines is [(text, bbox)]. A line continues the previous one unless the
+    previous line ended short of the block's right edge by more than the
+    width of the line's first word (it ended a paragraph), the line is
+    indented, starts a list item, or either line is a formula line or a
+    table row (left for classify_lines()). CJK
+    lines are joined without a space, Latin words hyphenated across lines
+    are rejoined, other lines are joined with a space.
+
+    Returns:
+        The paragraphs, each ended by a newline
+    """
+    right = max(bbox[2] for _, bbox in lines)
+    left = min(bbox[0] for _, bbox in lines)
+    paragraphs = []
+    current = None
+    previous_bbox = None
+    previous_formula = False
+
+    for text, bbox in lines:
+        stripped = text.strip()
+        formula = is_formula_line(text) or _is_table_row(stripped)
+        if current is not None and stripped and current.strip() and not formula and not previous_formula:
+            char_width = (bbox[2] - bbox[0]) / max(1, len(text))
+            first_word = stripped[:1] if CJK_PATTERN.match(stripped) else stripped.split()[0]
+            fits_before = right - previous_bbox[2] > (len(first_word) + REFLOW_SLACK_CHARS) * char_width
+            indented = bbox[0] - left > char_width
+            if not (fits_before or indented or LIST_START_PATTERN.match(text)):
+                tail = current.rstrip()
+                if HYPHENATED_END_PATTERN.search(tail) and stripped[0].islower():
+                    current = tail[:-1] + stripped
+                elif CJK_PATTERN.match(tail[-1]) or CJK_PATTERN.match(stripped[0]):
+                    current = tail + stripped
+                else:
+                    current = tail + " " + stripped
+                previous_bbox = bbox
+                continue
+        if current is not None:
+            paragraphs.append(current)
+        current = text
+        previous_bbox = bbox
+        previous_formula = formula
+    paragraphs.append(current)
+    return "".join(paragraph + "\n" for paragraph in paragraphs)
+
+
+# Reflow across blocks: LaTeX (xeCJK) output often puts every line in a text
+# block of its own. Such a line continues the block above when it starts at
+# the column's left edge (or the block is one line indented by up to
+# REFLOW_MAX_INDENT line heights, a paragraph's first line), the line above
+# is full (reaches the right edge of the text around it, give or take a
+# glyph) and does not end a sentence, both have the same style and they are at most
+# REFLOW_MAX_LINE_GAP line heights apart.
+REFLOW_MAX_LINE_GAP = 1.5
+REFLOW_MAX_INDENT = 4.0
+SENTENCE_END_PATTERN = re.compile(r'[。！？.!?…][\'"’”）)]*\s*$')
+
+
+def _line_style(line: dict):
+    """(size, bold) of a layout line, as heading_style() rates them"""
+    spans = [span for span in line["spans"] if span["text"].strip()]
+    if not spans:
+        return None
+    longest = max(spans, key=lambda span: len(span["text"].strip()))
+    bold = all(span["flags"] & BOLD_FLAG or BOLD_FONT_PATTERN.search(span["font"]) for span in spans)
+    return round(longest["size"] * 2) / 2, bool(bold)
+
+
+def _glyph_width(line: dict) -> float:
+    """Average glyph width of the last non-blank span of a layout line"""
+    for span in reversed(line["spans"]):
+        text = span["text"].strip()
+        if text:
+            return (span["bbox"][2] - span["bbox"][0]) / len(span["text"])
+    return 0.0
+
+
+def _continues_block(lines: list, line: dict, right: float) -> bool:
+    """
+    Whether line, alone in its block, continues the paragraph of lines;
+    right is the right edge of the text around the last of lines
+    """
+    last = lines[-1]
+    height = last["bbox"][3] - last["bbox"][1]
+    last_text = "".join(span["text"] for span in last["spans"])
+    if height <= 0 or not last_text.strip() or SENTENCE_END_PATTERN.search(last_text):
+        return False
+    gap = line["bbox"][1] - last["bbox"][3]
+    if not -height / 2 < gap <= REFLOW_MAX_LINE_GAP * height:
+        return False
+    # Justified CJK lines can stop up to a glyph short of the column edge
+    if last["bbox"][2] < right - max(height / 2, _glyph_width(last)):
+        return False
+    left = min(l["bbox"][0] for l in lines)
+    indent = left - line["bbox"][0]
+    if abs(indent) > height / 2 and not (len(lines) == 1 and 0 < indent <= REFLOW_MAX_INDENT * height):
+        return False
+    style = _line_style(line)
+    return style is not None and style == _line_style(last)
+
+
+def merge_line_blocks(blocks: list) -> list:
+    """
+    blocks (in reading order) with runs of single-line text blocks that
+    continue each other (see _continues_block) merged into one block, so that
+    reflow_lines() sees the whole paragraph
+    """
+    line_bboxes = [line["bbox"] for block in blocks if block["type"] == 0 for line in block["lines"]]
+
+    def right_edge(bbox) -> float:
+        """Right edge of the lines overlapping bbox horizontally"""
+        return max(other[2] for other in line_bboxes if other[0] < bbox[2] and other[2] > bbox[0])
+
+    merged = []
+    group = None  # block being built from single-line blocks
+    for block in blocks:
+        single = block["type"] == 0 and len(block.get("lines", ())) == 1
+        if single and group is not None and group is merged[-1] and _continues_block(
+                group["lines"], block["lines"][0], right_edge(group["lines"][-1]["bbox"])):
+            bbox = group["bbox"]
+            other = block["bbox"]
+            group["bbox"] = (min(bbox[0], other[0]), min(bbox[1], other[1]),
+                             max(bbox[2], other[2]), max(bbox[3], other[3]))
+            group["lines"].append(block["lines"][0])
+            continue
+        if single:
+            group = {**block, "lines": list(block["lines"])}
+            block = group
+        merged.append(block)
+    return merged
+
+
+# Per-page time budgets (seconds) of the extraction stages: the layout pass
+# (get_text("dict") and image geometry), native table detection and figure
+# extraction. A page with a stage over budget is degraded to plain text.
+DEFAULT_STAGE_BUDGETS = {"layout": 30.0, "tables": 10.0, "figures": 30.0}
+STAGE_NAMES = tuple(DEFAULT_STAGE_BUDGETS)
+
+
+class StageTimeout(BaseException):
+    """
+    A page extraction stage ran over its budget.
+
+    Derives from BaseException so that the blanket except Exception handlers
+    around table detection (here and inside PyMuPDF) do not swallow it.
+    """
+
+    def __init__(self, stage: str, elapsed: float, budget: float):
+        super().__init__(f"{stage} stage took over {budget:g}s")
+        self.stage = stage
+        self.elapsed = elapsed
+        self.budget = budget
+
+
+class StageWatchdog:
+    """
+    Enforces per-stage time budgets on one page.
+
+    Time spent in a stage accumulates over the page (figure extraction runs
+    once per figure). In the main thread a SIGALRM timer interrupts a stage
+    when its budget runs out; MuPDF calls are C code and are only
+    interrupted once they return, as are stages run in other threads, where
+    the overrun is detected after the stage finishes.
+    """
+
+    def __init__(self, budgets: dict = None):
+        self.budgets = DEFAULT_STAGE_BUDGETS if budgets is None else budgets
+        self.spent = Counter()
+        self.use_alarm = (hasattr(signal, "setitimer")
+                          and threading.current_thread() is threading.main_thread())
+
+    @contextlib.contextmanager
+    def stage(self, name: str):
+        budget = self.budgets.get(name)
+        if not budget:
+            yield
+            return
+
+        def on_alarm(signum, frame):
+            raise StageTimeout(name, self.spent[name] + time.perf_counter() - started, budget)
+
+        started = time.perf_counter()
+        armed = False
+        try:
+            if self.use_alarm:
+                previous = signal.signal(signal.SIGALRM, on_alarm)
+                armed = True
+                signal.setitimer(signal.ITIMER_REAL, max(budget - self.spent[name], 1e-3))
+            yield
+        finally:
+            # The alarm may go off until it is cancelled; the handler is
+            # restored even when it does
+            try:
+                if armed:
+                    signal.setitimer(signal.ITIMER_REAL, 0)
+            finally:
+                if armed:
+                    signal.signal(signal.SIGALRM, signal.SIG_DFL if previous is None else previous)
+                self.spent[name] += time.perf_counter() - started
+        if self.spent[name] > budget:
+            raise StageTimeout(name, self.spent[name], budget)
+
+
+def degraded_page_content(page, page_num: int, timeout: StageTimeout) -> dict:
+    """
+    Fallback content of a page whose extraction ran over a stage budget:
+    plain get_text("text") without tables, figures, headings or margin
+    detection, with the stage and its timing as "degraded".
+    """
+    text = page.get_text("text").translate(COMPATIBILITY_TABLE)
+    sys.stderr.write(f"Warning: Page {page_num + 1} degraded to plain text: {timeout}\n")
+    return {
+        "page": page_num + 1,
+        "parts": [("text", text)] if text.strip() else [],
+        "font_sizes": [],
+        "degraded": {
+            "stage": timeout.stage,
+            "elapsed_ms": round(timeout.elapsed * 1000),
+            "budget_ms": round(timeout.budget * 1000)
+        }
+    }
+
+
+def parse_stage_budgets(specs: list) -> dict:
+    """
+    Stage budgets from STAGE=SECONDS specs (e.g. ["tables=2"]), on top of
+    DEFAULT_STAGE_BUDGETS
+
+    Raises:
+        ValueError: unknown stage or malformed spec
+    """
+    budgets = dict(DEFAULT_STAGE_BUDGETS)
+    for spec in specs or ():
+        stage, _, seconds = spec.partition('=')
+        if stage not in budgets:
+            raise ValueError(f"Unknown stage {stage!r} (stages: {', '.join(STAGE_NAMES)})")
+        try:
+            budgets[stage] = float(seconds)
+        except ValueError:
+            raise ValueError(f"Invalid stage budget: {spec!r}") from None
+        if budgets[stage] < 0:
+            raise ValueError(f"Invalid stage budget: {spec!r}")
+    return budgets
+
+
+def extract_page_content(doc, page_num: int, image_memo: ImageMemo = None,
+                         table_prefilter: bool = True, defer_images: bool = False,
+                         reflow: bool = True, stage_budgets: dict = None,
+                         front_matter: int = None) -> dict:
+    """
+    Extract one page into an ordered list of parts.
+
+    Image bytes are returned rather than written so that pages can be extracted
+    in any process and assembled in page order afterwards (see LayoutAssembler).
+    Text lines inside a natively detected table are dropped; the table itself
+    is placed at its position in reading order.
+    With defer_images, figures only carry their xref and pixel size; bytes are
+    extracted later by materialize_images().
+    Compatibility characters are folded (see COMPATIBILITY_TABLE) and, with
+    reflow, the lines of each text block are joined into paragraphs (see
+    reflow_lines), after merging runs of single-line blocks that continue
+    each other (see merge_line_blocks).
+
+    Returns:
+        dict with page number, parts and font_sizes. Each part is
+        ("text", str), ("table", table dict from extract_tables_with_pymupdf),
+        ("heading", {"size", "bold", "text"}) - a heading candidate for the
+        text part following it, see heading_style() -, ("margin", {"key",
+        "text"}) - a line in the top or bottom margin, see margin_key() - or
+        ("figure", {"bbox", "ext", "image"[, "source_format"]} | {"bbox", "error"}
+        | {"bbox", "xref", "width", "height"[, "digest"]} | {"bbox"})
+        where a figure without image, error or xref had no matching xref,
+        source_format names a PDF codec MuPDF decoded to PNG (see JPX_FILTER)
+        and digest is the raw_image_digest() of a deferred figure.
+        font_sizes is [[size, chars], ...]: the page's character count per
+        font size, for finding the body text size. Boilerplate pages have a
+        "kind" (see classify_page; front_matter defaults to
+        FRONT_MATTER_MAX_PAGES), and TOC pages their entries as "toc" (see
+        parse_toc_lines). A page with a stage over its stage_budgets
+        entry (default DEFAULT_STAGE_BUDGETS) comes back from
+        degraded_page_content() instead.
+    """
+    page = doc[page_num]
+    try:
+        return _page_layout_content(doc, page, page_num, image_memo, table_prefilter,
+                                    defer_images, reflow, StageWatchdog(stage_budgets),
+                                    FRONT_MATTER_MAX_PAGES if front_matter is None else front_matter)
+    except StageTimeout as timeout:
+        return degraded_page_content(page, page_num, timeout)
+
+
+def _page_layout_content(doc, page, page_num: int, image_memo: ImageMemo, table_prefilter: bool,
+                         defer_images: bool, reflow: bool, watchdog: StageWatchdog,
+                         front_matter: int) -> dict:
+    parts = []
+    font_sizes = Counter()
+    page_lines = []
+
+    # Text and block geometry only; image bytes are extracted once, by xref
+    with watchdog.stage("layout"):
+        blocks = page.get_text("dict", flags=LAYOUT_TEXT_FLAGS)["blocks"]
+        image_blocks = page_image_blocks(page)
+
+    # Extract tables using PyMuPDF native detection, skipping pages that
+    # cannot contain a ruled table unless full detection is forced
+    with watchdog.stage("tables"):
+        if not table_prefilter or may_contain_table(page, blocks):
+            page_tables = extract_tables_with_pymupdf(page)
+        else:
+            page_tables = []
+    table_bboxes = [t['bbox'] for t in page_tables]
+
+    # Sort blocks and tables by y coordinate (top to bottom); at equal y a
+    # block comes before a table
+    sorted_blocks = sorted(
+        _in_textpage_order(blocks, image_blocks)
+        + [{"type": "table", "bbox": t['bbox'], "table": t} for t in page_tables],
+        key=lambda b: b["bbox"][1]
+    )
+    if reflow:
+        sorted_blocks = merge_line_blocks(sorted_blocks)
+    bounds = margin_bounds([line["bbox"] for block in blocks if block["type"] == 0
+                            for line in block["lines"]]
+                           + [block["bbox"] for block in image_blocks] + table_bboxes, page.rect)
+
+    for block in sorted_blocks:
+        bbox = block["bbox"]
+
+        if block["type"] == "table":
+            parts.append(("table", block["table"]))
+
+        elif block["type"] == 0:  # Text block
+            block_parts = []
+            text_lines = []
+            block_lines = []
+
+            def flush_text():
+                if text_lines:
+                    if reflow:
+                        block_parts.append(("text", reflow_lines(text_lines)))
+                    else:
+                        block_parts.append(("text", "".join(text + "\n" for text, _ in text_lines)))
+                    text_lines.clear()
+
+            for line in block["lines"]:
+                # Table cells are emitted with the table markers
+                if table_bboxes and _inside_any(line["bbox"], table_bboxes):
+                    continue
+                line_text = ""
+                for span in line["spans"]:
+                    line_text += span["text"]
+                    font_sizes[round(span["size"] * 2) / 2] += len(span["text"].strip())
+                line_text = line_text.translate(COMPATIBILITY_TABLE)
+                key = margin_key(line["bbox"], line_text, page.rect, bounds)
+                if key is not False:
+                    flush_text()
+                    block_parts.append(("margin", {"key": key, "text": line_text + "\n"}))
+                    continue
+                text_lines.append((line_text, line["bbox"]))
+                block_lines.append(line)
+                page_lines.append(line_text)
+            flush_text()
+            if block_lines:
+                heading = heading_style(block_lines, "".join(
+                    value for kind, value in block_parts if kind == "text"))
+                if heading:
+                    first_text = next(i for i, (kind, _) in enumerate(block_parts) if kind == "text")
+                    block_parts.insert(first_text, ("heading", heading))
+            parts.extend(block_parts)
+
+        elif block["type"] == 1:  # Image block
+            xref = block["xref"]
+            figure = {"bbox": list(bbox)}
+            if xref > 0 and defer_images:
+                figure.update(xref=xref, width=block["width"], height=block["height"])
+                try:
+                    with watchdog.stage("figures"):
+                        figure["digest"] = (image_memo.digest(doc, xref) if image_memo is not None
+                                            else raw_image_digest(doc, xref))
+                except Exception:
+                    pass  # deduplicated by xref only
+            elif xref > 0:
+                try:
+                    with watchdog.stage("figures"):
+                        figure.update(extract_figure_image(doc, xref, image_memo))
+                except Exception as e:
+                    figure["error"] = str(e)
+            parts.append(("figure", figure))
+
+    content = {"page": page_num + 1, "parts": parts, "font_sizes": sorted(font_sizes.items())}
+    kind = classify_page(page_num, page_lines, parts, front_matter)
+    if kind:
+        content["kind"] = kind
+        if kind == "toc":
+            content["toc"] = parse_toc_lines(page_lines)
+    return content
+
+
+def _inside_any(bbox, regions: list) -> bool:
+    """Whether the center of bbox lies inside any of the regions"""
+    cx = (bbox[0] + bbox[2]) / 2
+    cy = (bbox[1] + bbox[3]) / 2
+    return any(r[0] <= cx <= r[2] and r[1] <= cy <= r[3] for r in regions)
+
+
+def open_pdf(pdf) -> fitz.Document:
+    """Open a PDF given as a file path or as its bytes"""
+    if isinstance(pdf, (bytes, bytearray)):
+        return fitz.open(stream=pdf, filetype="pdf")
+    return fitz.open(pdf)
+
+
+def directory_writer(output_dir: str):
+    """Image writer storing each image as a file in output_dir"""
+    def write(filename: str, data: bytes) -> None:
+        with open(os.path.join(output_dir, filename), "wb") as f:
+            f.write(data)
+    return write
+
+
+class FrameWriter:
+    """
+    Framed binary output of --archive: the whole extraction result, images
+    included, as one stream (e.g. stdout) instead of files.
+
+    The stream starts with MAGIC, followed by frames of
+        kind (1 byte) | name length (uint16 BE) | payload length (uint32 BE) | name (UTF-8) | payload
+    where kind is b"I" for an image (name: filename, payload: bytes),
+    b"J" for a JSON record (name: "result", "page", "summary",
+    "materialized" or "probe", payload: UTF-8 JSON) and b"E" for the end of the stream.
+    Image frames come before the JSON record that references them.
+    """
+
+    MAGIC = b"TFX1"
+    HEADER = struct.Struct(">cHI")
+
+    def __init__(self, stream):
+        self.stream = stream
+        # Images may be written from the normalizer's threads
+        self._lock = threading.Lock()
+        self.stream.write(self.MAGIC)
+
+    def write_frame(self, kind: bytes, name: str, payload: bytes) -> None:
+        name_bytes = name.encode('utf-8')
+        with self._lock:
+            self.stream.write(self.HEADER.pack(kind, len(name_bytes), len(payload)))
+            self.stream.write(name_bytes)
+            self.stream.write(payload)
+
+    def write_image(self, filename: str, data: bytes) -> None:
+        self.write_frame(b"I", filename, data)
+
+    def write_json(self, name: str, record: dict) -> None:
+        self.write_frame(b"J", name, json.dumps(record, ensure_ascii=False).encode('utf-8'))
+        self.stream.flush()
+
+    def close(self) -> None:
+        self.write_frame(b"E", "", b"")
+        self.stream.flush()
+
+
+# Boilerplate pages (classify_page): front matter that carries no thesis content
+BOILERPLATE_KINDS = ('cover', 'declaration', 'authorization', 'blank', 'toc')
+# Kinds dropped from the text by default; the cover is kept for its metadata
+# (title, author, supervisor)
+DROPPED_BOILERPLATE = ('declaration', 'authorization', 'blank', 'toc')
+COVER_MAX_PAGE = 3
+# Declarations, authorizations and TOCs are only looked for in the front
+# matter: before the first page with a numbered bookmark (see
+# front_matter_pages) or, without one, in the first FRONT_MATTER_MAX_PAGES
+FRONT_MATTER_MAX_PAGES = 20
+COVER_MAX_CHARS = 400
+COVER_MIN_FIELDS = 2
+COVER_FIELD_PATTERN = re.compile(
+    r'作者|姓名|学号|指导教师|导师|专业|学科|学院|院系|申请|答辩|'
+    r'supervisor|advisor|student|department|submitted|degree',
+    re.IGNORECASE
+)
+BOILERPLATE_MAX_CHARS = 1500
+BOILERPLATE_TITLE_MAX_CHARS = 24
+DECLARATION_TITLE_PATTERN = re.compile(
+    r'(独创性|原创性|学位论文|诚信)声明|declaration\s*of\s*(originality|authorship)|statement\s*of\s*originality',
+    re.IGNORECASE
+)
+AUTHORIZATION_TITLE_PATTERN = re.compile(
+    r'授权书|授权声明|使用授权|copyright\s*(authorization|statement)|authorization\s*(letter|statement)',
+    re.IGNORECASE
+)
+# Numbered section titles ("4.3 Authorization") are body headings, never boilerplate titles
+NUMBERED_TITLE_PATTERN = re.compile(
+    r'^(\d+(\.\d+)*\.?\s*\D|第[一二三四五六七八九十\d]+[章节]|chapter\s*\d+)', re.IGNORECASE)
+TOC_TITLE_PATTERN = re.compile(r'^(目\s*录|contents|table\s*of\s*contents)$', re.IGNORECASE)
+TOC_MIN_LINES = 3
+TOC_MIN_ENTRY_RATIO = 0.5
+TOC_ENTRY_PATTERN = re.compile(
+    r'^\s*(?P<title>\S.*?)\s*(\.{2,}|…+|·{2,}|\s{2,})\s*(?P<page>\d+|[ivxlcIVXLC]+)\s*$'
+)
+# An entry whose page number was set on a line of its own
+TOC_OPEN_LEADER_PATTERN = re.compile(r'(\.{2,}|…+|·{2,})\s*$')
+TOC_PAGE_LINE_PATTERN = re.compile(r'^\s*(\d+|[ivxlcIVXLC]+)\s*$')
+
+
+def front_matter_pages(doc) -> int:
+    """
+    Number of leading pages that may hold front matter: up to the first page
+    with a numbered bookmark (第1章, Chapter 1, 1.1, ...), or
+    FRONT_MATTER_MAX_PAGES without one
+    """
+    for _, title, page in doc.get_toc():
+        if page > 0 and NUMBERED_TITLE_PATTERN.match(title.strip()):
+            return page - 1
+    return FRONT_MATTER_MAX_PAGES
+
+
+def join_toc_page_lines(texts: list) -> list:
+    """texts with a leader-ended line and a page number line after it joined into one"""
+    joined = []
+    for text in texts:
+        if joined and TOC_PAGE_LINE_PATTERN.match(text) and TOC_OPEN_LEADER_PATTERN.search(joined[-1]):
+            joined[-1] = f"{joined[-1]} {text.strip()}"
+        else:
+            joined.append(text)
+    return joined
+
+
+def classify_page(page_num: int, lines: list, parts: list, front_matter: int = FRONT_MATTER_MAX_PAGES):
+    """
+    Kind of a boilerplate page from its body lines (margin lines excluded)
+    and parts, or None for a content page:
+
+    - "blank": no text, figures or tables
+    - "toc": a 目录/Contents title or mostly "title .... page" lines
+    - "declaration" / "authorization": a short page titled as an originality
+      declaration or a copyright authorization (both on one page: declaration)
+    - "cover": one of the first pages, little text, cover fields (作者, 指导教师, ...)
+
+    TOC, declaration and authorization pages are only recognized among the
+    first front_matter pages (see front_matter_pages), and never by a
+    numbered section title.
+    """
+    texts = [line.strip() for line in lines if line.strip()]
+    chars = sum(len(text) for text in texts)
+    if not texts:
+        if any(kind in ("figure", "table") for kind, _ in parts):
+            return None
+        return "blank"
+
+    if page_num < front_matter:
+        compact = ["".join(text.split()) for text in texts]
+        # Titles are looked for in the first lines, also split over two ("目\n录")
+        heads = compact[:3] + ["".join(compact[i:i + 2]) for i in range(2)]
+        entries = sum(1 for text in join_toc_page_lines(texts) if TOC_ENTRY_PATTERN.match(text))
+        if any(TOC_TITLE_PATTERN.match(text) for text in heads) or (
+                entries >= TOC_MIN_LINES and entries >= TOC_MIN_ENTRY_RATIO * len(texts)):
+            return "toc"
+        if chars <= BOILERPLATE_MAX_CHARS:
+            kind = _front_matter_title_kind(texts)
+            if kind:
+                return kind
+
+    if page_num < COVER_MAX_PAGE and chars <= COVER_MAX_CHARS:
+        fields = {match.group(0).lower() for text in texts for match in COVER_FIELD_PATTERN.finditer(text)}
+        if len(fields) >= COVER_MIN_FIELDS:
+            return "cover"
+    return None
+
+
+def _front_matter_title_kind(texts: list):
+    """"declaration" or "authorization" for a page with such a title among texts, else None"""
+    compact = ["".join(text.split()) for text in texts if not NUMBERED_TITLE_PATTERN.match(text)]
+    titles = [text for text in compact if len(text) <= BOILERPLATE_TITLE_MAX_CHARS]
+    if any(DECLARATION_TITLE_PATTERN.search(text) for text in titles):
+        return "declaration"
+    if any(AUTHORIZATION_TITLE_PATTERN.search(text) for text in titles):
+        return "authorization"
+    return None
+
+
+def parse_toc_lines(lines: list) -> list:
+    """
+    Entries of a table of contents page: [{"level", "title", "page_label"}],
+    page_label being the printed page number; level follows the numbering
+    (see numbering_level), unnumbered entries are level 1.
+    """
+    entries = []
+    for line in join_toc_page_lines(lines):
+        match = TOC_ENTRY_PATTERN.match(line)
+        if match:
+            title = TOC_LEADER_PATTERN.sub('', match.group("title")).strip()
+            if title:
+                entries.append({"level": numbering_level(title) or 1, "title": title,
+                                "page_label": match.group("page")})
+    return entries
+
+
+# Heading candidates: short standalone blocks with a letter or CJK character,
+# not TOC entries (dot leaders), figure/table captions or "label: value"
+# fields of cover pages
+HEADING_MAX_LINES = 2
+HEADING_MAX_CHARS = 60
+HEADING_TEXT_PATTERN = re.compile(r'[A-Za-z\u4e00-\u9fff]')
+TOC_LEADER_PATTERN = re.compile(r'(\.{4,}|…{2,}|·{4,}|-{4,})\s*[\dIVXivx]*\s*$')
+CAPTION_PATTERN = re.compile(r'^(图|表|Figure|Fig\.|Table)\s*\d')
+FIELD_PATTERN = re.compile(r'^\S{1,6}[：:]')
+# Heading numbering that fixes the level: 第N章 / Chapter N, then N.N, N.N.N
+CHAPTER_NUMBER_PATTERN = re.compile(r'^(第[一二三四五六七八九十\d]+章|chapter\s+\d+)', re.IGNORECASE)
+SECTION_NUMBER_PATTERN = re.compile(r'^\d+(\.\d+)+(?=\s|[^\d.])')
+# Bold font names: weight tokens, plus the Hei (sans) faces that CJK headings
+# are set in instead of bold. Not any "hei": STHeitiSC-Light is body text.
+BOLD_FONT_PATTERN = re.compile(r'bold|heavy|black|semibold|medium|simhei|黑体', re.IGNORECASE)
+BOLD_FLAG = 16
+
+# Font-based outline: heading styles must be larger than the body text (or
+# bold), occur at least twice (a cover title does not make a level) and not
+# repeat the same text on several pages (running headers)
+HEADING_SIZE_DELTA = 0.5
+MIN_STYLE_OCCURRENCES = 2
+MAX_REPEATED_PAGES = 2
+MAX_HEADING_LEVELS = 3
+# Characters past the page a heading is on that its title is still looked for
+HEADING_SEARCH_SLACK = 4096
+
+
+# Running headers and footers: lines within this fraction of the page height
+# from its top or bottom edge whose text (digits aside) repeats at the same
+# position on at least RUNNING_MIN_PAGES pages, and page numbers there. The
+# band widens to MARGIN_MAX_BAND for lines set apart from the body by a gap
+# of MARGIN_MIN_GAP line heights (see margin_bounds)
+MARGIN_BAND = 0.08
+MARGIN_MAX_BAND = 0.15
+MARGIN_MIN_GAP = 1.5
+RUNNING_MIN_PAGES = 3
+MARGIN_POSITION_TOLERANCE = 2.0
+PAGE_NUMBER_PATTERN = re.compile(
+    r'^\s*([-–—]?\s*\d+\s*[-–—]?|\d+\s*/\s*\d+|第\s*\d+\s*页(\s*[,，]?\s*共\s*\d+\s*页)?'
+    r'|page\s+\d+(\s+of\s+\d+)?)\s*$',
+    re.IGNORECASE
+)
+# Front matter page numbers: a well-formed roman numeral of up to 6 letters,
+# bare, as "- iv -" or as "第iv页". Words like "I" or "mix" match too, so such
+# a line only counts as a page number next to a page numbered the same way
+# (see LayoutAssembler.is_page_number)
+ROMAN_NUMERAL = r'(?=[ivxlc]{1,6}(?![a-z]))c{0,3}(?:xc|xl|l?x{0,3})(?:ix|iv|v?i{0,3})'
+ROMAN_PAGE_NUMBER_PATTERN = re.compile(
+    rf'^\s*(?:[-–—]?\s*({ROMAN_NUMERAL})\s*[-–—]?|第\s*({ROMAN_NUMERAL})\s*页)\s*$',
+    re.IGNORECASE
+)
+ROMAN_VALUES = {"i": 1, "v": 5, "x": 10, "l": 50, "c": 100}
+DIGITS_PATTERN = re.compile(r'\d+')
+
+
+def roman_value(numeral: str) -> int:
+    """Value of a well-formed roman numeral"""
+    values = [ROMAN_VALUES[c] for c in numeral.lower()]
+    return sum(-v if v < next_v else v for v, next_v in zip(values, values[1:] + [0]))
+
+
+def margin_bounds(bboxes: list, page_rect) -> tuple:
+    """
+    (top, bottom) of the page's body: lines ending above top or starting
+    below bottom are in its margins. These are the MARGIN_BAND strips along
+    the page edges, widened up to MARGIN_MAX_BAND to take in lines set apart
+    from the body, like a footer set well above the bottom edge: the page
+    content (the bboxes of its text lines, images and tables) inward of such
+    a line starts at least MARGIN_MIN_GAP of its height away and reaches
+    past MARGIN_MAX_BAND.
+    """
+    band = page_rect.height * MARGIN_BAND
+    wide = page_rect.height * MARGIN_MAX_BAND
+    top, bottom = page_rect.y0 + band, page_rect.y1 - band
+
+    def center(box) -> float:
+        return (box[1] + box[3]) / 2
+
+    def set_apart(inward: list, gap: float, distance) -> bool:
+        """Whether the boxes inward of a line all lie gap beyond it and reach the body"""
+        return (bool(inward) and all(distance(other) >= gap for other in inward)
+                and any(page_rect.y0 + wide < center(other) < page_rect.y1 - wide for other in inward))
+
+    for box in bboxes:
+        gap = MARGIN_MIN_GAP * (box[3] - box[1])
+        if page_rect.y1 - wide <= box[1] < bottom and set_apart(
+                [other for other in bboxes if center(other) < box[1]], gap,
+                lambda other: box[1] - other[3]):
+            bottom = min(other[1] for other in bboxes if center(other) >= box[1])
+        if top < box[3] <= page_rect.y0 + wide and set_apart(
+                [other for other in bboxes if center(other) > box[3]], gap,
+                lambda other: other[1] - box[3]):
+            top = max(other[3] for other in bboxes if center(other) <= box[3])
+    return top, bottom
+
+
+def margin_key(bbox, text: str, page_rect, bounds: tuple = None):
+    """
+    Key under which a line in the page margin is matched across pages: None
+    for a page number, "roman:band:value" for a roman numeral that may be
+    one, "band:position:text" (digits normalized) for other text, or False
+    when the line is not in the top or bottom margin. bounds is the page's
+    margin_bounds(), by default the MARGIN_BAND strips.
+    """
+    if bounds is None:
+        bounds = margin_bounds([], page_rect)
+    if bbox[3] <= bounds[0]:
+        edge = "top"
+        position = bbox[1] - page_rect.y0
+    elif bbox[1] >= bounds[1]:
+        edge = "bottom"
+        position = page_rect.y1 - bbox[3]
+    else:
+        return False
+    if not text.strip():
+        return False
+    if PAGE_NUMBER_PATTERN.match(text):
+        return None
+    roman = ROMAN_PAGE_NUMBER_PATTERN.match(text)
+    if roman:
+        return f"roman:{edge}:{roman_value(roman.group(1) or roman.group(2))}"
+    normalized = DIGITS_PATTERN.sub('#', "".join(text.split()))
+    return f"{edge}:{round(position / MARGIN_POSITION_TOLERANCE)}:{normalized}"
+
+
+def heading_style(lines: list, block_text: str):
+    """
+    Font style of a text block that could be a heading: {"size", "bold",
+    "text"} with size the size of the block's longest span, or None when the
+    block is too long, has no letters or looks like a TOC entry or caption.
+    """
+    if not lines or len(lines) > HEADING_MAX_LINES:
+        return None
+    text = " ".join(line.strip() for line in block_text.split("\n") if line.strip())
+    if (len(text) > HEADING_MAX_CHARS or not HEADING_TEXT_PATTERN.search(text)
+            or TOC_LEADER_PATTERN.search(text) or CAPTION_PATTERN.match(text)
+            or FIELD_PATTERN.match(text)):
+        return None
+
+    spans = [span for line in lines for span in line["spans"] if span["text"].strip()]
+    if not spans:
+        return None
+    longest = max(spans, key=lambda span: len(span["text"].strip()))
+    bold = all(span["flags"] & BOLD_FLAG or BOLD_FONT_PATTERN.search(span["font"]) for span in spans)
+    return {"size": round(longest["size"] * 2) / 2, "bold": bool(bold), "text": text}
+
+
+def outline_from_bookmarks(toc: list, pages: set) -> list:
+    """Headings from doc.get_toc() entries ([level, title, page]) on the given 1-based pages"""
+    return [
+        {"level": level, "title": title.strip(), "page": page}
+        for level, title, page in toc
+        if page in pages and title.strip()
+    ]
+
+
+def numbering_level(title: str):
+    """Heading level implied by a title's numbering ("第2章" 1, "2.1" 2, "2.1.3" 3), or None"""
+    if CHAPTER_NUMBER_PATTERN.match(title):
+        return 1
+    match = SECTION_NUMBER_PATTERN.match(title)
+    return match.group(0).count('.') + 1 if match else None
+
+
+def outline_from_fonts(candidates: list, font_sizes: Counter) -> list:
+    """
+    Headings from heading candidates (heading_style() results with "page"
+    and "raw_offset").
+
+    Numbered headings take the level of their numbering. Unnumbered ones take
+    the level of their style: the level most numbered headings of the same
+    style have, else that of the nearest larger numbered style; without any
+    numbered headings the largest style is level 1, and so on.
+    """
+    if not candidates or not font_sizes:
+        return []
+    body_size = font_sizes.most_common(1)[0][0]
+
+    pages_by_text = {}
+    for candidate in candidates:
+        pages_by_text.setdefault(candidate["text"], set()).add(candidate["page"])
+
+    def is_heading(candidate) -> bool:
+        if len(pages_by_text[candidate["text"]]) > MAX_REPEATED_PAGES:
             return False
-        # Check for numeric patterns (including comma-separated numbers like "50,000")
-        if re.match(r'^[\d,.\-+%]+$', stripped) and len(stripped) >= 1:
-            return True
-        # Dataset names like CIFAR-10, ImageNet
-        if re.match(r'^[A-Za-z][\w\-]+$', stripped) and len(stripped) <= 15:
-            return True
-        # Short Chinese text that could be a header (not ending with sentence punctuation)
-        if len(stripped) <= 10 and not stripped.endswith(('。', '：', '；')):
-            return True
-        # Medium-length English text (headers like "Accuracy", "Model Parameters")
-        if re.match(r'^[A-Za-z][A-Za-z\s\-]{0,40}$', stripped):
-            return True
-        # Chinese text up to 20 chars
-        if len(stripped) <= 20 and re.match(r'^[\u4e00-\u9fa5]+', stripped):
-            return True
-        # Percentage values
-        if re.match(r'^[\d,.]+%$', stripped):
+        return (candidate["size"] >= body_size + HEADING_SIZE_DELTA
+                or (candidate["bold"] and candidate["size"] >= body_size - HEADING_SIZE_DELTA))
+
+    headings = [candidate for candidate in candidates if is_heading(candidate)]
+    styles = Counter((h["size"], h["bold"]) for h in headings)
+    numbered = {}
+    for h in headings:
+        level = numbering_level(h["text"])
+        if level:
+            numbered.setdefault((h["size"], h["bold"]), Counter())[level] += 1
+
+    levels = {}
+    larger_level = None
+    ranked = sorted((style for style, count in styles.items() if count >= MIN_STYLE_OCCURRENCES),
+                    reverse=True)
+    for rank, style in enumerate(ranked, 1):
+        if style in numbered:
+            larger_level = levels[style] = numbered[style].most_common(1)[0][0]
+        elif numbered:
+            levels[style] = larger_level or 1
+        else:
+            levels[style] = rank
+
+    outline = []
+    for h in headings:
+        level = numbering_level(h["text"]) or levels.get((h["size"], h["bold"]))
+        if level and level <= MAX_HEADING_LEVELS and (h["size"], h["bold"]) in levels:
+            outline.append({"level": level, "title": h["text"], "page": h["page"],
+                            "raw_offset": h.get("raw_offset")})
+    return outline
+
+
+def locate_headings(text: str, headings: list, page_spans: dict, growth: int) -> None:
+    """
+    Set each heading's "offset" in the final text (None when its title is not
+    found). Titles are searched in document order from the previous heading,
+    within the heading's page: page_spans maps pages to their (start, end)
+    in the text before classify_lines(), which grows it by growth characters.
+    """
+    position = 0
+    for heading in headings:
+        page_start, page_end = page_spans[heading["page"]]
+        raw_offset = heading.pop("raw_offset", None)
+        start = max(position, page_start if raw_offset is None else raw_offset)
+        end = min(len(text), page_end + max(growth, 0) + HEADING_SEARCH_SLACK)
+        offset = text.find(heading["title"], start, end)
+        if offset < 0:
+            # Line breaks or spacing differ between the title and the text
+            pattern = r'\s*'.join(re.escape(c) for c in heading["title"] if not c.isspace())
+            match = re.compile(pattern).search(text, start, end)
+            offset = match.start() if match else -1
+        if offset < 0:
+            heading["offset"] = None
+            continue
+        heading["offset"] = offset
+        position = offset + 1
+
+
+class LayoutAssembler:
+    """
+    Assembles page contents in page order: numbers images (pdfimgN), writes
+    them to output_dir (or passes them to image_writer(filename, data)) and
+    builds text_with_images with the figure markers.
+
+    Byte-identical images (the same xref on every page, or the same picture
+    stored under several xrefs) are written once and every occurrence gets
+    the id of the first one.
+
+    With a normalizer, images are normalized and written in its thread pool;
+    their filenames are filled in by finish_images().
+
+    Deferred figures (extracted with defer_images) are not written: their
+    entries carry xref and pixel size instead of a filename. Repeated xrefs
+    share one id, as do xrefs with the same raw_image_digest(), so a picture
+    stored under several xrefs is deduplicated in both modes.
+
+    Heading candidates and font size statistics are collected for the
+    document outline (see outline()).
+
+    Running headers and footers and page numbers (margin parts, see
+    margin_key) are dropped unless keep_headers_footers is set. Whether a
+    header repeats on enough pages is decided over the whole document when
+    the text is kept; page records (keep_text=False) can only count the pages
+    added so far, so a header is kept on its first RUNNING_MIN_PAGES - 1 pages.
+    Likewise, a roman numeral only counts as a page number when a facing
+    page has one too (see is_page_number), which page records can only check
+    against the previous page.
+
+    Boilerplate pages (see classify_page) are listed in boilerplate_pages;
+    those of a DROPPED_BOILERPLATE kind are left out entirely (text, images,
+    tables and headings) unless keep_boilerplate is set. Entries of TOC pages
+    are collected in toc_entries. Boilerplate pages have no heading
+    candidates.
+
+    Pages degraded to plain text (see degraded_page_content) are listed in
+    degraded_pages with the stage that ran over budget.
+    """
+
+    def __init__(self, output_dir: str, page_count: int, keep_text: bool = True,
+                 normalizer: ImageNormalizer = None, image_writer=None,
+                 keep_headers_footers: bool = False, keep_boilerplate: bool = False):
+        self.output_dir = output_dir
+        self.write_image = image_writer or directory_writer(output_dir)
+        self.page_count = page_count
+        self.keep_text = keep_text
+        self.normalizer = normalizer
+        self.image_counter = 0
+        self.text_parts = []
+        self.images = []
+        self.images_by_hash = {}
+        self.images_by_xref = {}
+        self.duplicate_images = 0
+        self.pending_images = []
+        self.failed_images = set()
+        self.pages = []
+        self.page_parts = []
+        self.text_length = 0
+        self.page_spans = {}
+        self.heading_candidates = []
+        self.font_sizes = Counter()
+        self.keep_headers_footers = keep_headers_footers
+        self.margin_pages = {}
+        self.numbered_pages = set()
+        self.roman_numbers = {}
+        self.removed_lines = 0
+        self.removed_chars = 0
+        self.keep_boilerplate = keep_boilerplate
+        self.boilerplate_pages = []
+        self.toc_entries = []
+        self.degraded_pages = []
+
+    def add_page(self, page_content: dict) -> dict:
+        """
+        Add the next page. Returns the page record: its text fragment (before
+        formula/table post-processing) and the images and tables on it, plus
+        its kind as "boilerplate" for a boilerplate page (empty when dropped)
+        and "degraded" for a page degraded to plain text.
+        """
+        page_no = page_content["page"]
+        if "degraded" in page_content:
+            self.degraded_pages.append({"page": page_no, **page_content["degraded"]})
+        page_kind = page_content.get("kind")
+        if page_kind:
+            dropped = not self.keep_boilerplate and page_kind in DROPPED_BOILERPLATE
+            self.boilerplate_pages.append({"page": page_no, "kind": page_kind, "dropped": dropped})
+            self.toc_entries.extend(page_content.get("toc", ()))
+            if dropped:
+                return {"page": page_no, "text": "", "images": [], "tables": [], "boilerplate": page_kind}
+
+        text_parts = []
+        page_images = []
+        page_tables = []
+        page_headings = []
+        self.pages.append(page_no)
+
+        for size, chars in page_content.get("font_sizes", ()):
+            self.font_sizes[size] += chars
+
+        for kind, value in page_content["parts"]:
+            if kind == "text":
+                text_parts.append(value)
+                continue
+
+            if kind == "heading":
+                if page_kind:
+                    # Cover lines and the like are not section headings
+                    continue
+                candidate = {**value, "page": page_no}
+                self.heading_candidates.append(candidate)
+                page_headings.append((len(text_parts), candidate))
+                continue
+
+            if kind == "margin":
+                if value["key"] is None:
+                    self.numbered_pages.add(page_no)
+                elif value["key"].startswith("roman:"):
+                    self.roman_numbers[(value["key"].rsplit(":", 1)[0], page_no)] = value["key"]
+                else:
+                    self.margin_pages.setdefault(value["key"], set()).add(page_no)
+                text_parts.append((value["key"], value["text"]))
+                continue
+
+            if kind == "table":
+                page_tables.append({
+                    "bbox": list(value["bbox"]),
+                    "rows": value["rows"],
+                    "col_count": value["col_count"]
+                })
+                text_parts.append(f"\n{format_table_as_markers(value)}\n")
+                continue
+
+            if "image" in value or "xref" in value:
+                if "image" in value:
+                    digest = hashlib.sha256(value["image"]).hexdigest()
+                    known = self.images_by_hash.get(digest)
+                else:
+                    digest = value.get("digest")
+                    known = self.images_by_xref.get(value["xref"]) or self.images_by_hash.get(digest)
+                if known is not None:
+                    known["occurrences"] += 1
+                    self.duplicate_images += 1
+                    text_parts.append(f"\n[FIGURE:{known['id']}]\n")
+                    continue
+
+            self.image_counter += 1
+            img_id = f"pdfimg{self.image_counter}"
+
+            if "xref" in value:
+                image_entry = {
+                    "id": img_id,
+                    "page": page_no,
+                    "bbox": value["bbox"],
+                    "xref": value["xref"],
+                    "width": value["width"],
+                    "height": value["height"],
+                    "occurrences": 1
+                }
+                page_images.append(image_entry)
+                self.images_by_xref[value["xref"]] = image_entry
+                if digest is not None:
+                    self.images_by_hash[digest] = image_entry
+                text_parts.append(f"\n[FIGURE:{img_id}]\n")
+            elif "image" in value:
+                try:
+                    if self.normalizer is not None:
+                        future = self.normalizer.submit(
+                            value["image"], value["ext"], value["bbox"], img_id, self.write_image,
+                            value.get("source_format")
+                        )
+                        filename = None
+                    else:
+                        filename = f"{img_id}.{value['ext']}"
+                        self.write_image(filename, value["image"])
+
+                    image_entry = {
+                        "id": img_id,
+                        "filename": filename,
+                        "page": page_no,
+                        "bbox": value["bbox"],
+                        "occurrences": 1
+                    }
+                    page_images.append(image_entry)
+                    self.images_by_hash[digest] = image_entry
+                    if filename is None:
+                        self.pending_images.append((future, image_entry, value["image"], value["ext"]))
+
+                    # Insert image marker in text
+                    text_parts.append(f"\n[FIGURE:{img_id}]\n")
+                except Exception as e:
+                    text_parts.append(f"\n[FIGURE:{img_id}:extraction_failed]\n")
+                    sys.stderr.write(f"Warning: Failed to extract image {img_id}: {e}\n")
+            elif "error" in value:
+                # If extraction fails, still add marker but note the error
+                text_parts.append(f"\n[FIGURE:{img_id}:extraction_failed]\n")
+                sys.stderr.write(f"Warning: Failed to extract image {img_id}: {value['error']}\n")
+            else:
+                # Image block found but no xref match
+                text_parts.append(f"\n[FIGURE:{img_id}:no_xref]\n")
+
+        self.images.extend(page_images)
+        if self.keep_text:
+            # Assembled in result(), once headers repeated on later pages are known
+            self.page_parts.append((page_no, text_parts, page_headings))
+            fragment = None
+        else:
+            fragment = "".join(self._drop_margins(text_parts, page_no))
+
+        record = {
+            "page": page_no,
+            "text": fragment,
+            "images": page_images,
+            "tables": page_tables
+        }
+        if page_kind:
+            record["boilerplate"] = page_kind
+        if "degraded" in page_content:
+            record["degraded"] = page_content["degraded"]
+        return record
+
+    def is_page_number(self, key, page_no: int) -> bool:
+        """
+        Whether a margin line with key (see margin_key) on page page_no is a
+        page number: a digit-style one always, a roman numeral when a facing
+        page has a digit-style page number or the adjacent roman numeral in
+        the same margin
+        """
+        if key is None:
             return True
+        if not key.startswith("roman:"):
+            return False
+        band, value = key.rsplit(":", 1)
+        for facing, step in ((page_no - 1, -1), (page_no + 1, 1)):
+            facing_key = self.roman_numbers.get((band, facing))
+            if facing in self.numbered_pages or facing_key == f"{band}:{int(value) + step}":
+                return True
         return False
 
-    def looks_like_table_sequence(buffer: list) -> bool:
-        """Check if a sequence of lines looks like table data"""
-        if len(buffer) < 4:  # Need at least header row + 1 data row (assuming 2+ cols)
-            return False
-        # Count numeric entries
-        num_count = sum(1 for line in buffer if re.match(r'^[\d,.\-+%]+$', line.strip()))
-        # Should have at least one number or enough cells
-        return num_count >= 1 or len(buffer) >= 4
+    def _drop_margins(self, text_parts: list, page_no: int) -> list:
+        """
+        text_parts with margin lines replaced by their text when kept and by
+        "" when dropped as page numbers or running headers/footers
+        """
+        resolved = []
+        for part in text_parts:
+            if isinstance(part, str):
+                resolved.append(self.mark_failed_images(part) if self.failed_images else part)
+                continue
+            key, text = part
+            if self.keep_headers_footers or not (
+                    self.is_page_number(key, page_no)
+                    or key in self.margin_pages and len(self.margin_pages[key]) >= RUNNING_MIN_PAGES):
+                resolved.append(text)
+            else:
+                resolved.append("")
+                self.removed_lines += 1
+                self.removed_chars += len(text)
+        return resolved
+
+    def _assemble_text(self) -> str:
+        """
+        Join the kept pages into one text, recording page spans and the
+        offsets of heading candidates in it
+        """
+        for page_no, text_parts, page_headings in self.page_parts:
+            text_parts = self._drop_margins(text_parts, page_no)
+            # Add page separator (pages may be a subset of the document, see select_pages)
+            if self.text_parts:
+                self.text_parts.append("\n\n")
+                self.text_length += 2
+
+            offsets = [self.text_length]
+            for part in text_parts:
+                offsets.append(offsets[-1] + len(part))
+            for index, candidate in page_headings:
+                candidate["raw_offset"] = offsets[index]
+
+            self.page_spans[page_no] = (self.text_length, offsets[-1])
+            self.text_parts.extend(text_parts)
+            self.text_length = offsets[-1]
+        self.page_parts = []
+        return "".join(self.text_parts)
+
+    def headers_footers(self) -> dict:
+        """Running header/footer and page number lines dropped so far"""
+        return {"removed_lines": self.removed_lines, "removed_chars": self.removed_chars}
+
+    def finish_images(self) -> None:
+        """
+        Wait for images still being normalized and record their filenames.
+
+        An image whose normalized copy could not be written is written as
+        extracted; if that fails too, it is dropped and its markers become
+        [FIGURE:id:extraction_failed] (see mark_failed_images()).
+        """
+        for future, image_entry, image, ext in self.pending_images:
+            try:
+                image_entry["filename"] = future.result()
+                continue
+            except Exception as e:
+                sys.stderr.write(f"Warning: Failed to write normalized image {image_entry['id']}: {e}\n")
+            filename = f"{image_entry['id']}.{ext}"
+            try:
+                self.write_image(filename, image)
+                image_entry["filename"] = filename
+            except Exception as e:
+                self.images.remove(image_entry)
+                self.failed_images.add(image_entry["id"])
+                sys.stderr.write(f"Warning: Failed to extract image {image_entry['id']}: {e}\n")
+        self.pending_images = []
+
+    def mark_failed_images(self, text: str) -> str:
+        """text with the markers of images dropped by finish_images() flagged as failed"""
+        for img_id in self.failed_images:
+            text = text.replace(f"[FIGURE:{img_id}]", f"[FIGURE:{img_id}:extraction_failed]")
+        return text
+
+    def outline(self, toc: list = None, text: str = None) -> dict:
+        """
+        Document outline: {"source", "headings": [{"level", "title", "page",
+        "offset"}]}. Headings come from the PDF bookmarks (toc, as returned by
+        doc.get_toc()) when there are any, with source "bookmarks"; otherwise
+        from font sizes and weights of heading candidates, with source "fonts".
+        offset is the title's position in text (the final text_with_images);
+        without text (stream mode) headings have no offset.
+        """
+        if toc:
+            source = "bookmarks"
+            headings = outline_from_bookmarks(toc, set(self.pages))
+        else:
+            source = "fonts"
+            headings = outline_from_fonts(self.heading_candidates, self.font_sizes)
 
-    for i, line in enumerate(lines):
-        stripped = line.strip()
+        if text is None:
+            for heading in headings:
+                heading.pop("raw_offset", None)
+        else:
+            headings = [h for h in headings if h["page"] in self.page_spans]
+            locate_headings(text, headings, self.page_spans, len(text) - self.text_length)
+        return {"source": source, "headings": headings}
+
+    def result(self, toc: list = None) -> dict:
+        """
+        The document result; toc is the document's bookmarks for the outline
+        (see outline())
+        """
+        self.finish_images()
+        text = self._assemble_text()
+
+        # Post-process to mark formulas and tables
+        text = classify_lines(text)
+
+        result = {
+            "text_with_images": text,
+            "images": self.images,
+            "duplicate_images": self.duplicate_images,
+            "outline": self.outline(toc, text),
+            "headers_footers": self.headers_footers(),
+            "boilerplate_pages": self.boilerplate_pages,
+            "toc": self.toc_entries,
+            "degraded_pages": self.degraded_pages
+        }
+        if self.normalizer is not None:
+            result["image_normalization"] = self.normalizer.report()
+        return result
+
+
+def current_rss_mb() -> float:
+    """Current resident set size of this process in MB."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+    except (OSError, ValueError, IndexError):
+        return peak_rss_mb()
 
-        # Check if this looks like a table row (multi-column per line)
-        parts = stripped.split()
-        has_numbers = any(re.match(r'^[\d,.]+$', p) for p in parts)
-        looks_like_multi_col_row = len(parts) >= 3 and has_numbers
 
-        # Check if this looks like a single table cell (PDF extraction pattern)
-        looks_like_single_cell = is_table_cell_candidate(stripped)
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process in MB."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in KB on Linux
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
 
-        if looks_like_multi_col_row:
-            # Traditional table row with multiple columns
-            if not in_potential_table:
-                in_potential_table = True
-            table_buffer.append(stripped)
-        elif looks_like_single_cell and (in_potential_table or len(table_buffer) > 0):
-            # Continue collecting potential table cells
-            if not in_potential_table:
-                in_potential_table = True
-            table_buffer.append(stripped)
-        elif looks_like_single_cell and i + 1 < len(lines) and is_table_cell_candidate(lines[i + 1]):
-            # Start of a potential table sequence
-            in_potential_table = True
-            table_buffer.append(stripped)
+
+class MemoryBudget:
+    """
+    Keeps low-memory extraction under an RSS budget.
+
+    After every page the MuPDF object store is emptied, so it never holds more
+    than one page's resources; when RSS is still above the budget a full garbage
+    collection is run and the overrun is recorded.
+    """
+
+    def __init__(self, max_rss_mb: float):
+        self.max_rss_mb = max_rss_mb
+        self.exceeded = False
+
+    def after_page(self, page_no: int) -> None:
+        fitz.TOOLS.store_shrink(100)
+        if current_rss_mb() <= self.max_rss_mb:
+            return
+        gc.collect()
+        rss = current_rss_mb()
+        if rss > self.max_rss_mb and not self.exceeded:
+            self.exceeded = True
+            sys.stderr.write(
+                f"Warning: RSS {rss:.0f}MB over budget {self.max_rss_mb:.0f}MB after page {page_no}\n"
+            )
+
+    def report(self) -> dict:
+        return {
+            "max_rss_mb": self.max_rss_mb,
+            "peak_rss_mb": round(peak_rss_mb(), 1),
+            "rss_budget_exceeded": self.exceeded
+        }
+
+
+PAGE_RANGE_PATTERN = re.compile(r'^\s*(\d+)\s*(-\s*(\d*))?\s*$')
+
+
+# Per-process document handle for parallel extraction
+_worker_doc = None
+_worker_image_memo = None
+_worker_page_options = {}
+
+
+def _open_worker_doc(pdf_path: str, page_options: dict) -> None:
+    global _worker_doc, _worker_image_memo, _worker_page_options
+    _worker_doc = open_pdf(pdf_path)
+    _worker_image_memo = ImageMemo(_worker_doc)
+    _worker_page_options = page_options
+
+
+def _extract_pages(page_numbers: list) -> list:
+    return [
+        extract_page_content(_worker_doc, n, _worker_image_memo, **_worker_page_options)
+        for n in page_numbers
+    ]
+
+
+def select_pages(pages: str, page_count: int) -> list:
+    """
+    0-based page numbers for a page range spec such as "1-5,8,12-" (1-based,
+    inclusive, open-ended ranges run to the last page), or all pages when
+    pages is empty. Ranges are clipped to the document.
+
+    Raises:
+        ValueError: malformed spec, or no page of the document selected
+    """
+    if not pages:
+        return list(range(page_count))
+    selected = set()
+    for item in pages.split(','):
+        match = PAGE_RANGE_PATTERN.match(item)
+        if not match:
+            raise ValueError(f"Invalid page range: {item.strip()!r}")
+        first = int(match.group(1))
+        if match.group(2) is None:
+            last = first
         else:
-            if in_potential_table and len(table_buffer) >= 2:
-                # Check if it looks like a real table
-                if looks_like_table_sequence(table_buffer) or any(re.match(r'^[\d,.]+$', l.strip()) for l in table_buffer):
-                    # Mark the buffered content as a table
-                    result.append('[TABLE_START]')
-                    for row in table_buffer:
-                        result.append(f'[TABLE_CELL: {row}]')
-                    result.append('[TABLE_END]')
-                else:
-                    # Not enough table-like content, output normally
-                    result.extend(table_buffer)
-                table_buffer = []
-            elif table_buffer:
-                # Not enough rows to be a table, just output normally
-                result.extend(table_buffer)
-                table_buffer = []
-            in_potential_table = False
-            result.append(line)
+            last = int(match.group(3)) if match.group(3) else max(first, page_count)
+        if first < 1 or last < first:
+            raise ValueError(f"Invalid page range: {item.strip()!r}")
+        selected.update(range(first - 1, min(last, page_count)))
+    if not selected:
+        raise ValueError(f"No pages in range {pages!r} (document has {page_count} pages)")
+    return sorted(selected)
 
-    # Handle remaining buffer
-    if len(table_buffer) >= 2 and looks_like_table_sequence(table_buffer):
-        result.append('[TABLE_START]')
-        for row in table_buffer:
-            result.append(f'[TABLE_CELL: {row}]')
-        result.append('[TABLE_END]')
-    elif table_buffer:
-        result.extend(table_buffer)
 
-    return '\n'.join(result)
+def split_page_batches(page_numbers: list, workers: int) -> list:
+    """Split pages into consecutive batches, a few per worker for load balancing."""
+    chunk = max(1, -(-len(page_numbers) // (workers * 4)))
+    return [page_numbers[start:start + chunk] for start in range(0, len(page_numbers), chunk)]
 
 
-def extract_pdf_with_layout(pdf_path: str, output_dir: str) -> dict:
+def iter_page_contents(doc, pdf_path: str, workers: int = 1, memory_budget: MemoryBudget = None,
+                       page_numbers: list = None, page_options: dict = None):
+    """
+    Yield extract_page_content() results in page order.
+
+    With workers > 1 page batches are extracted by a process pool, each process
+    opening its own fitz.Document; results are still yielded in page order.
+    With a memory budget pages are extracted serially and the budget is
+    enforced once the consumer is done with each page.
+
+    page_numbers: 0-based pages to extract (default: all pages)
+    page_options: keyword arguments for extract_page_content()
+    """
+    if page_numbers is None:
+        page_numbers = list(range(len(doc)))
+    page_options = page_options or {}
+
+    if memory_budget is not None:
+        # No image memo: it would keep repeated images alive for the whole run
+        for page_num in page_numbers:
+            yield extract_page_content(doc, page_num, **page_options)
+            memory_budget.after_page(page_num + 1)
+        return
+
+    if workers <= 1 or len(page_numbers) < 2:
+        image_memo = ImageMemo(doc)
+        for page_num in page_numbers:
+            yield extract_page_content(doc, page_num, image_memo, **page_options)
+        return
+
+    batches = split_page_batches(page_numbers, workers)
+    with ProcessPoolExecutor(
+        max_workers=min(workers, len(batches)),
+        initializer=_open_worker_doc,
+        initargs=(pdf_path, page_options)
+    ) as executor:
+        for batch in executor.map(_extract_pages, batches):
+            yield from batch
+
+
+def track_pages(page_contents, page_total: int, assembler: LayoutAssembler,
+                progress: ProgressReporter):
+    """
+    Pass page_contents through, emitting an "extract" progress event once the
+    consumer has added each page to assembler
+    """
+    for pages_done, page_content in enumerate(page_contents, 1):
+        yield page_content
+        progress.emit("extract", pages_done=pages_done, pages_total=page_total,
+                      images=len(assembler.images))
+
+
+def make_normalizer(normalize_images: bool, image_max_side: int, image_max_dpi: float):
+    """ImageNormalizer for the image options, or None when normalization is off"""
+    if not normalize_images:
+        return None
+    return ImageNormalizer(image_max_side, image_max_dpi)
+
+
+def extract_pdf_with_layout(pdf_path: str, output_dir: str, workers: int = 1,
+                            max_rss_mb: float = None, full_table_detection: bool = False,
+                            normalize_images: bool = False, image_max_side: int = DEFAULT_MAX_SIDE,
+                            image_max_dpi: float = DEFAULT_MAX_DPI, defer_images: bool = False,
+                            image_writer=None, pages: str = None,
+                            keep_headers_footers: bool = False, reflow: bool = True,
+                            keep_boilerplate: bool = False, stage_budgets: dict = None,
+                            progress: ProgressReporter = None) -> dict:
     """
     Extract PDF content with image position information.
 
     Args:
-        pdf_path: Path to the PDF file
+        pdf_path: Path to the PDF file, or the PDF bytes
         output_dir: Directory to save extracted images
+        workers: Number of processes to extract pages with (1 = serial).
+                 Output is identical to a serial run.
+        max_rss_mb: Enables low-memory mode: serial, page by page, with the
+                    MuPDF store emptied after each page and RSS kept under this
+                    budget. Adds a "memory" report to the result.
+        full_table_detection: Run find_tables() on every page instead of only
+                              on pages passing may_contain_table()
+        normalize_images: Downscale images to image_max_side pixels and
+                          image_max_dpi at their displayed width, and convert
+                          formats Word/LaTeX cannot embed to PNG or JPEG (see
+                          image_normalizer). Adds an "image_normalization"
+                          report with the bytes saved to the result.
+        defer_images: Do not extract image bytes; image entries carry xref,
+                      width and height instead of a filename and are written
+                      on demand with materialize_images()
+        image_writer: Called as image_writer(filename, data) for each image
+                      instead of writing it into output_dir (e.g.
+                      FrameWriter.write_image)
+        pages: Extract only these pages, as a page range spec (see
+               select_pages); the result then lists them as "pages"
+        keep_headers_footers: Keep running headers/footers and page numbers
+                              in the text; by default they are removed and
+                              counted in "headers_footers"
+        reflow: Join the lines of each paragraph (see reflow_lines); off,
+                every line of the PDF stays a line of text
+        keep_boilerplate: Keep declaration, authorization, blank and TOC
+                          pages in the output; they are still listed in
+                          "boilerplate_pages"
+        stage_budgets: Per-page time budget in seconds of each extraction
+                       stage ("layout", "tables", "figures"; 0 = unlimited),
+                       default DEFAULT_STAGE_BUDGETS. A page over budget is
+                       extracted as plain text and listed in "degraded_pages".
+        progress: Reports "open", "extract" (per page), "assemble" and "done"
+                  events (see progress.ProgressReporter)
 
     Returns:
-        dict with text_with_images and images list
+        dict with text_with_images, images list, outline (see
+        LayoutAssembler.outline), headers_footers, boilerplate_pages
+        ([{"page", "kind", "dropped"}]), toc (entries of the document's
+        table of contents pages, see parse_toc_lines) and degraded_pages
+        ([{"page", "stage", "elapsed_ms", "budget_ms"}])
     """
-    doc = fitz.open(pdf_path)
-    result = {
-        "text_with_images": "",
-        "images": []
-    }
+    progress = progress or NO_PROGRESS
+    memory_budget = MemoryBudget(max_rss_mb) if max_rss_mb else None
+    page_options = {"table_prefilter": not full_table_detection, "defer_images": defer_images,
+                    "reflow": reflow, "stage_budgets": stage_budgets}
+    normalizer = make_normalizer(normalize_images, image_max_side, image_max_dpi)
+    doc = open_pdf(pdf_path)
+    try:
+        page_options["front_matter"] = front_matter_pages(doc)
+        page_numbers = select_pages(pages, len(doc))
+        progress.emit("open", pages_total=len(page_numbers))
+        assembler = LayoutAssembler(output_dir, len(doc), normalizer=normalizer,
+                                    image_writer=image_writer,
+                                    keep_headers_footers=keep_headers_footers,
+                                    keep_boilerplate=keep_boilerplate)
+        page_contents = iter_page_contents(doc, pdf_path, workers, memory_budget,
+                                           page_numbers=page_numbers, page_options=page_options)
+        for page_content in track_pages(page_contents, len(page_numbers), assembler, progress):
+            assembler.add_page(page_content)
+        progress.emit("assemble", images=len(assembler.images))
+        result = assembler.result(doc.get_toc())
+    finally:
+        doc.close()
+        if normalizer:
+            normalizer.shutdown()
+
+    if pages:
+        result["pages"] = [n + 1 for n in page_numbers]
+    if memory_budget:
+        result["memory"] = memory_budget.report()
+    progress.emit("done", pages_total=len(page_numbers), images=len(result["images"]),
+                  chars=len(result["text_with_images"]))
+    return result
+
+
+def extract_pdf_cached(pdf_path: str, output_dir: str, cache_dir: str,
+                       cache_max_mb: float = 1024, **options) -> dict:
+    """
+    extract_pdf_with_layout() through the content-addressed cache in cache_dir.
+
+    A hit costs hashing the PDF plus reading the entry; images are linked into
+    output_dir as on a fresh extraction. Results with degraded pages are not
+    cached, so the pages get another chance on the next run.
+    """
+    cache = ExtractionCache(cache_dir, int(cache_max_mb * 1024 * 1024))
+    # workers, max_rss_mb, the time budgets and progress do not change the extracted content
+    key_options = {k: v for k, v in options.items()
+                   if k not in ('workers', 'max_rss_mb', 'stage_budgets', 'progress')}
+    key = cache.key_for(pdf_path, EXTRACTOR_VERSION, key_options)
+
+    result = cache.get(key, output_dir)
+    if result is not None:
+        (options.get("progress") or NO_PROGRESS).emit(
+            "done", cached=True, images=len(result["images"]), chars=len(result["text_with_images"]))
+        return result
+
+    result = extract_pdf_with_layout(pdf_path, output_dir, **options)
+    if not result["degraded_pages"]:
+        cache.put(key, {k: v for k, v in result.items() if k != "memory"}, output_dir)
+    return result
+
 
-    image_counter = 0
-
-    for page_num, page in enumerate(doc):
-        # Extract tables using PyMuPDF native detection
-        page_tables = extract_tables_with_pymupdf(page)
-        table_bboxes = [t['bbox'] for t in page_tables]
-
-        # Get all blocks (text and images)
-        blocks = page.get_text("dict")["blocks"]
-
-        # Get image info with xrefs for extraction
-        image_info_list = page.get_image_info(xrefs=True)
-
-        # Create a mapping of bbox to image info
-        # Use center point for matching
-        image_map = {}
-        for img_info in image_info_list:
-            bbox = img_info["bbox"]
-            center_y = (bbox[1] + bbox[3]) / 2
-            image_map[center_y] = img_info
-
-        # Sort blocks by y coordinate (top to bottom)
-        sorted_blocks = sorted(blocks, key=lambda b: b["bbox"][1])
-
-        for block in sorted_blocks:
-            bbox = block["bbox"]
-
-            if block["type"] == 0:  # Text block
-                block_text = ""
-                for line in block["lines"]:
-                    line_text = ""
-                    for span in line["spans"]:
-                        line_text += span["text"]
-                    block_text += line_text + "\n"
-                result["text_with_images"] += block_text
-
-            elif block["type"] == 1:  # Image block
-                image_counter += 1
-                img_id = f"pdfimg{image_counter}"
-
-                # Try to find matching image info by bbox proximity
-                block_center_y = (bbox[1] + bbox[3]) / 2
-                matched_img = None
-                min_distance = float('inf')
-
-                for center_y, img_info in image_map.items():
-                    distance = abs(center_y - block_center_y)
-                    if distance < min_distance and distance < 50:  # 50pt tolerance
-                        min_distance = distance
-                        matched_img = img_info
-
-                # Extract and save image
-                if matched_img and matched_img.get("xref", 0) > 0:
-                    try:
-                        xref = matched_img["xref"]
-                        img_data = doc.extract_image(xref)
-                        ext = img_data.get("ext", "png")
-                        filename = f"{img_id}.{ext}"
-                        img_path = os.path.join(output_dir, filename)
-
-                        with open(img_path, "wb") as f:
-                            f.write(img_data["image"])
-
-                        result["images"].append({
-                            "id": img_id,
-                            "filename": filename,
-                            "page": page_num + 1,
-                            "bbox": list(bbox)
-                        })
-
-                        # Insert image marker in text
-                        result["text_with_images"] += f"\n[FIGURE:{img_id}]\n"
-
-                    except Exception as e:
-                        # If extraction fails, still add marker but note the error
-                        result["text_with_images"] += f"\n[FIGURE:{img_id}:extraction_failed]\n"
-                        sys.stderr.write(f"Warning: Failed to extract image {img_id}: {e}\n")
+# Subset fonts carry a random tag ("ABCDEF+SimSun") that changes on every export
+SUBSET_TAG_PATTERN = re.compile(r'^[A-Z]{6}\+')
+
+IMAGE_CODEC_FILTERS = ('DCTDecode', 'JPXDecode', 'JBIG2Decode', 'CCITTFaxDecode')
+
+
+def page_fingerprint(doc, page_num: int, stream_hashes: dict) -> str:
+    """
+    Fingerprint a page from its content streams and the resources they use
+    (image and form XObject streams, fonts and their ToUnicode maps).
+
+    Object numbers are not part of the fingerprint, so an unchanged page keeps
+    its fingerprint when the rest of the document is regenerated.
+    stream_hashes memoizes raw stream hashes by xref within one document.
+    """
+    def stream_hash(xref: int) -> str:
+        if xref not in stream_hashes:
+            try:
+                # Hash decompressed data so re-deflating a file keeps fingerprints stable,
+                # but do not decode image codecs, which would cost as much as extraction
+                filters = doc.xref_get_key(xref, "Filter")[1]
+                if any(codec in filters for codec in IMAGE_CODEC_FILTERS):
+                    data = doc.xref_stream_raw(xref)
                 else:
-                    # Image block found but no xref match
-                    result["text_with_images"] += f"\n[FIGURE:{img_id}:no_xref]\n"
+                    data = doc.xref_stream(xref)
+                stream_hashes[xref] = hashlib.sha256(data or b'').hexdigest()
+            except Exception:
+                stream_hashes[xref] = ''
+        return stream_hashes[xref]
+
+    page = doc[page_num]
+    digest = hashlib.sha256()
+    digest.update(f"{tuple(page.rect)}|{page.rotation}|".encode('utf-8'))
+    # read_contents() fails on pages without a content stream (blank pages)
+    if page.get_contents():
+        digest.update(page.read_contents())
+
+    for img in page.get_images(full=True):
+        digest.update(f"|img:{img[7]}:{stream_hash(img[0])}".encode('utf-8'))
+    for xobj in page.get_xobjects():
+        digest.update(f"|xobj:{xobj[1]}:{stream_hash(xobj[0])}".encode('utf-8'))
+    for font in page.get_fonts(full=True):
+        xref, basefont, name = font[0], font[3], font[4]
+        to_unicode = doc.xref_get_key(xref, "ToUnicode")
+        cmap = stream_hash(int(to_unicode[1].split()[0])) if to_unicode[0] == 'xref' else ''
+        digest.update(f"|font:{name}:{SUBSET_TAG_PATTERN.sub('', basefont)}:{cmap}".encode('utf-8'))
+
+    return digest.hexdigest()
+
+
+def extract_pdf_incremental(pdf_path: str, output_dir: str, store_dir: str,
+                            store_max_mb: float = 1024, workers: int = 1,
+                            full_table_detection: bool = False, normalize_images: bool = False,
+                            image_max_side: int = DEFAULT_MAX_SIDE,
+                            image_max_dpi: float = DEFAULT_MAX_DPI, defer_images: bool = False,
+                            image_writer=None, pages: str = None,
+                            keep_headers_footers: bool = False, reflow: bool = True,
+                            keep_boilerplate: bool = False, stage_budgets: dict = None,
+                            progress: ProgressReporter = None) -> dict:
+    """
+    Extract a PDF reusing per-page results of earlier uploads.
 
-        # Insert formatted table markers from PyMuPDF native detection
-        for table in sorted(page_tables, key=lambda t: t['bbox'][1]):
-            result["text_with_images"] += f"\n{format_table_as_markers(table)}\n"
+    Pages are fingerprinted (see page_fingerprint); only pages missing from
+    the page store are extracted, the rest are taken from the store, and the
+    document is assembled exactly as a full extraction would be. The store
+    holds images as extracted; normalization happens during assembly.
 
-        # Add page separator
-        if page_num < len(doc) - 1:
-            result["text_with_images"] += "\n\n"
+    Degraded pages (see extract_pdf_with_layout's stage_budgets) are not
+    stored. Progress events are those of extract_pdf_with_layout, plus
+    "fingerprint" (pages_total, pages_changed) before the changed pages are
+    extracted.
+
+    Returns:
+        extract_pdf_with_layout() result plus "changed_pages": 1-based pages
+        that were not found in the store and had to be extracted
+    """
+    progress = progress or NO_PROGRESS
+    store = PageStore(store_dir, int(store_max_mb * 1024 * 1024))
+    page_options = {"table_prefilter": not full_table_detection, "defer_images": defer_images,
+                    "reflow": reflow, "stage_budgets": stage_budgets}
+    normalizer = make_normalizer(normalize_images, image_max_side, image_max_dpi)
+    doc = open_pdf(pdf_path)
+    try:
+        page_options["front_matter"] = front_matter_pages(doc)
+        # Page results depend on the options as well as the page itself
+        content_options = {k: v for k, v in page_options.items() if k != "stage_budgets"}
+        options_tag = hashlib.sha256(
+            json.dumps(content_options, sort_keys=True).encode('utf-8')).hexdigest()[:12]
+        page_numbers = select_pages(pages, len(doc))
+        stream_hashes = {}
+        keys = {
+            n: f"{EXTRACTOR_VERSION}-{options_tag}-{page_fingerprint(doc, n, stream_hashes)}"
+            for n in page_numbers
+        }
+        page_contents = {n: store.get_page(keys[n]) for n in page_numbers}
+        changed = [n for n in page_numbers if page_contents[n] is None]
+        progress.emit("fingerprint", pages_total=len(page_numbers), pages_changed=len(changed))
+
+        assembler = LayoutAssembler(output_dir, len(doc), normalizer=normalizer,
+                                    image_writer=image_writer,
+                                    keep_headers_footers=keep_headers_footers,
+                                    keep_boilerplate=keep_boilerplate)
+        changed_contents = iter_page_contents(doc, pdf_path, workers, page_numbers=changed,
+                                              page_options=page_options)
+
+        def all_page_contents():
+            # Changed pages come from the extractor in page order, between the stored ones
+            for page_num in page_numbers:
+                content = page_contents.pop(page_num)
+                if content is None:
+                    content = next(changed_contents)
+                    if "degraded" not in content:
+                        store.put_page(keys[page_num], content)
+                yield {**content, "page": page_num + 1}
+
+        for page_content in track_pages(all_page_contents(), len(page_numbers), assembler, progress):
+            assembler.add_page(page_content)
+        progress.emit("assemble", images=len(assembler.images))
+        result = assembler.result(doc.get_toc())
+    finally:
+        doc.close()
+        if normalizer:
+            normalizer.shutdown()
+
+    if pages:
+        result["pages"] = [n + 1 for n in page_numbers]
+    result["changed_pages"] = [n + 1 for n in changed]
+    progress.emit("done", pages_total=len(page_numbers), images=len(result["images"]),
+                  chars=len(result["text_with_images"]))
+    return result
 
-    doc.close()
 
-    # Post-process to mark formulas and tables
-    result["text_with_images"] = mark_formulas(result["text_with_images"])
-    result["text_with_images"] = detect_table_structure(result["text_with_images"])
+def stream_pdf_with_layout(pdf_path: str, output_dir: str, workers: int = 1,
+                           max_rss_mb: float = None, full_table_detection: bool = False,
+                           normalize_images: bool = False, image_max_side: int = DEFAULT_MAX_SIDE,
+                           image_max_dpi: float = DEFAULT_MAX_DPI, defer_images: bool = False,
+                           image_writer=None, pages: str = None,
+                           keep_headers_footers: bool = False, reflow: bool = True,
+                           keep_boilerplate: bool = False, stage_budgets: dict = None,
+                           progress: ProgressReporter = None):
+    """
+    Extract PDF content page by page, yielding one record per finished page.
+
+    Page records carry the page's text (formulas and tables marked within the
+    page), its images and its natively detected tables; a final summary record
+    follows. Formula/table groups spanning a page break are marked per page.
+
+    Yields:
+        {"type": "page", "page", "text", "images", "tables"} for each page,
+        then {"type": "summary", "page_count", "image_count", "table_count",
+        "duplicate_images", "char_count", "outline", "headers_footers",
+        "boilerplate_pages", "toc", "degraded_pages"} where
+        outline headings carry page anchors only and running headers are
+        kept on the first pages they occur on (see LayoutAssembler)
+        (plus "memory" when max_rss_mb is set, "image_normalization" when
+        normalize_images is set and "pages" when pages is set, see
+        extract_pdf_with_layout)
+    """
+    progress = progress or NO_PROGRESS
+    memory_budget = MemoryBudget(max_rss_mb) if max_rss_mb else None
+    page_options = {"table_prefilter": not full_table_detection, "defer_images": defer_images,
+                    "reflow": reflow, "stage_budgets": stage_budgets}
+    normalizer = make_normalizer(normalize_images, image_max_side, image_max_dpi)
+    doc = open_pdf(pdf_path)
+    try:
+        page_options["front_matter"] = front_matter_pages(doc)
+        page_numbers = select_pages(pages, len(doc))
+        assembler = LayoutAssembler(output_dir, len(doc), keep_text=False, normalizer=normalizer,
+                                    image_writer=image_writer,
+                                    keep_headers_footers=keep_headers_footers,
+                                    keep_boilerplate=keep_boilerplate)
+        progress.emit("open", pages_total=len(page_numbers))
+        char_count = 0
+        table_count = 0
+        page_contents = iter_page_contents(doc, pdf_path, workers, memory_budget,
+                                           page_numbers=page_numbers, page_options=page_options)
+        for page_content in track_pages(page_contents, len(page_numbers), assembler, progress):
+            record = assembler.add_page(page_content)
+            if normalizer and not defer_images:
+                # The page's images are normalized in parallel; wait before reporting them
+                assembler.finish_images()
+                record["images"] = [img for img in record["images"] if img["filename"]]
+                record["text"] = assembler.mark_failed_images(record["text"])
+            record["text"] = classify_lines(record["text"])
+            char_count += len(record["text"])
+            table_count += len(record["tables"])
+            yield {"type": "page", **record}
+
+        summary = {
+            "type": "summary",
+            "page_count": assembler.page_count,
+            "image_count": len(assembler.images),
+            "table_count": table_count,
+            "duplicate_images": assembler.duplicate_images,
+            "char_count": char_count,
+            "outline": assembler.outline(doc.get_toc()),
+            "headers_footers": assembler.headers_footers(),
+            "boilerplate_pages": assembler.boilerplate_pages,
+            "toc": assembler.toc_entries,
+            "degraded_pages": assembler.degraded_pages
+        }
+        if pages:
+            summary["pages"] = [n + 1 for n in page_numbers]
+        if memory_budget:
+            summary["memory"] = memory_budget.report()
+        if normalizer:
+            summary["image_normalization"] = normalizer.report()
+        yield summary
+        progress.emit("done", pages_total=len(page_numbers), images=len(assembler.images),
+                      chars=char_count)
+    finally:
+        doc.close()
+        if normalizer:
+            normalizer.shutdown()
+
+
+def materialize_images(pdf_path: str, output_dir: str, images: list, normalize_images: bool = False,
+                       image_max_side: int = DEFAULT_MAX_SIDE,
+                       image_max_dpi: float = DEFAULT_MAX_DPI, image_writer=None) -> dict:
+    """
+    Write the bytes of images from a defer_images extraction of the same PDF.
+
+    Args:
+        images: image entries of the deferred result to write ("id" and
+                "xref"; "bbox" is used by image normalization)
+        normalize_images, image_max_side, image_max_dpi, image_writer: as for
+                          extract_pdf_with_layout
 
+    Returns:
+        dict with "images": [{"id", "filename"} | {"id", "error"}] in the
+        order requested (plus "image_normalization" when normalizing)
+    """
+    normalizer = make_normalizer(normalize_images, image_max_side, image_max_dpi)
+    write_image = image_writer or directory_writer(output_dir)
+    materialized = []
+    pending = []
+    doc = open_pdf(pdf_path)
+    try:
+        for image in images:
+            entry = {"id": image["id"]}
+            materialized.append(entry)
+            try:
+                figure = extract_figure_image(doc, image["xref"])
+                if normalizer is not None:
+                    future = normalizer.submit(figure["image"], figure["ext"], image.get("bbox"),
+                                               image["id"], write_image, figure.get("source_format"))
+                    pending.append((future, entry))
+                    continue
+                entry["filename"] = f"{image['id']}.{figure['ext']}"
+                write_image(entry["filename"], figure["image"])
+            except Exception as e:
+                entry["error"] = str(e)
+
+        for future, entry in pending:
+            try:
+                entry["filename"] = future.result()
+            except Exception as e:
+                entry["error"] = str(e)
+    finally:
+        doc.close()
+        if normalizer:
+            normalizer.shutdown()
+
+    result = {"images": materialized}
+    if normalizer:
+        result["image_normalization"] = normalizer.report()
     return result
 
 
-def main():
-    if len(sys.argv) < 3:
-        print("Usage: python extract_pdf.py <pdf_path> <output_dir>", file=sys.stderr)
-        sys.exit(1)
+def probe_pdf(pdf_path, pages: str = None) -> dict:
+    """
+    Cheap facts about a PDF for routing it before a full extraction: no
+    layout analysis, table detection or image decoding.
+
+    Args:
+        pdf_path: Path to the PDF file, or the PDF bytes
+        pages: Probe only these pages (page range spec, see select_pages)
+
+    Returns:
+        dict with "page_count", "has_outline", "outline_entries", "char_count",
+        "image_count", "pages_without_text" (1-based) and "pages": one
+        {"page", "chars", "images", "text_layer"} per probed page, where chars
+        counts non-whitespace characters and images counts the image
+        XObjects the page references
+    """
+    started = time.perf_counter()
+    doc = open_pdf(pdf_path)
+    try:
+        page_count = len(doc)
+        outline = doc.get_toc(simple=True)
+        probed = []
+        for page_num in select_pages(pages, page_count):
+            page = doc[page_num]
+            text = page.get_text("text", flags=fitz.TEXT_MEDIABOX_CLIP)
+            chars = len(text) - sum(text.count(c) for c in WHITESPACE_CHARS)
+            probed.append({
+                "page": page_num + 1,
+                "chars": chars,
+                "images": len(page.get_images()),
+                "text_layer": chars > 0
+            })
+    finally:
+        doc.close()
+
+    return {
+        "page_count": page_count,
+        "has_outline": bool(outline),
+        "outline_entries": len(outline),
+        "char_count": sum(p["chars"] for p in probed),
+        "image_count": sum(p["images"] for p in probed),
+        "pages_without_text": [p["page"] for p in probed if not p["text_layer"]],
+        "pages": probed,
+        "elapsed_ms": round((time.perf_counter() - started) * 1000, 1)
+    }
 
-    pdf_path = sys.argv[1]
-    output_dir = sys.argv[2]
 
-    if not os.path.exists(pdf_path):
+WHITESPACE_CHARS = ' \t\n\r\f\v\u00a0\u3000'
+
+RESULT_FILENAME = 'result.json'
+
+
+def read_manifest(lines) -> list:
+    """
+    Batch manifest entries from JSON lines: {"pdf", "output_dir"[, "id"][, "result"]}.
+    Malformed lines become entries with an "error" and are reported, not extracted.
+    """
+    entries = []
+    for number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            entry = json.loads(line)
+            if not isinstance(entry, dict) or "pdf" not in entry or "output_dir" not in entry:
+                raise ValueError('expected an object with "pdf" and "output_dir"')
+        except ValueError as e:
+            entry = {"id": f"line {number}", "error": f"Invalid manifest line {number}: {e}"}
+        entries.append(entry)
+    return entries
+
+
+def extract_document(pdf_path, output_dir: str, cache_dir: str = None, cache_max_mb: float = 1024,
+                     page_store: str = None, page_store_max_mb: float = 1024,
+                     token_budget: int = DEFAULT_TOKEN_BUDGET, token_rates: dict = None,
+                     **options) -> dict:
+    """
+    Plain, cached (cache_dir) or incremental (page_store) extraction of one
+    PDF, with the "token_plan" of its text (see token_budget.plan_chunks) for
+    chunks of token_budget tokens, estimated with token_rates
+    """
+    if page_store:
+        options.pop("max_rss_mb", None)
+        result = extract_pdf_incremental(pdf_path, output_dir, page_store, page_store_max_mb, **options)
+    elif cache_dir:
+        result = extract_pdf_cached(pdf_path, output_dir, cache_dir, cache_max_mb, **options)
+    else:
+        result = extract_pdf_with_layout(pdf_path, output_dir, **options)
+    result["token_plan"] = plan_chunks(result["text_with_images"], result["outline"]["headings"],
+                                       token_budget, TokenEstimator(token_rates))
+    return result
+
+
+def _extract_batch_entry(entry: dict, options: dict) -> dict:
+    """
+    Extract one manifest entry and write its result JSON (entry "result", by
+    default RESULT_FILENAME in its output_dir). Never raises.
+    """
+    started = time.perf_counter()
+    record = {"type": "file", "id": entry.get("id", entry.get("pdf")), "pdf": entry.get("pdf")}
+    try:
+        if "error" in entry:
+            raise ValueError(entry["error"])
+        pdf_path, output_dir = entry["pdf"], entry["output_dir"]
+        if not os.path.exists(pdf_path):
+            raise FileNotFoundError(f"PDF file not found: {pdf_path}")
+        os.makedirs(output_dir, exist_ok=True)
+        with fitz.open(pdf_path) as doc:
+            page_count = len(doc)
+        # The extraction's own progress messages go to stderr like in single-file mode
+        with contextlib.redirect_stdout(sys.stderr):
+            result = extract_document(pdf_path, output_dir, **options)
+
+        result_path = entry.get("result") or os.path.join(output_dir, RESULT_FILENAME)
+        with open(result_path, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False)
+        record.update(ok=True, result=result_path, page_count=page_count,
+                      char_count=len(result["text_with_images"]), image_count=len(result["images"]))
+    except Exception as e:
+        record.update(ok=False, error=f"{type(e).__name__}: {e}")
+    record["elapsed_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    return record
+
+
+def _extract_isolated(entry: dict, options: dict) -> dict:
+    """Retry an entry whose pool died in a process of its own, so a crash only fails that file"""
+    try:
+        with ProcessPoolExecutor(max_workers=1) as executor:
+            return executor.submit(_extract_batch_entry, entry, options).result()
+    except BrokenProcessPool:
+        return {"type": "file", "id": entry.get("id", entry.get("pdf")), "pdf": entry.get("pdf"),
+                "ok": False, "error": "Worker process died"}
+
+
+def extract_batch(entries: list, workers: int = 1, progress: ProgressReporter = None, **options):
+    """
+    Extract many PDFs in one process pool, so Python and PyMuPDF start-up is
+    paid once per worker rather than once per file.
+
+    Files are extracted in parallel (each one serially); options are those of
+    extract_document. When a worker process dies (e.g. a MuPDF crash) the
+    files it took down are retried one by one in fresh processes. progress
+    gets a "batch" event (files_done, files_total, failed, pages) per file
+    and a final "done".
+
+    Yields:
+        {"type": "file", "id", "pdf", "ok", "result", "page_count",
+        "char_count", "image_count", "elapsed_ms"} (or "error" instead of
+        the counts) for each file in order of completion, then
+        {"type": "summary", "files", "succeeded", "failed", "pages",
+        "elapsed_s", "files_per_s", "pages_per_s"}
+    """
+    progress = progress or NO_PROGRESS
+    started = time.perf_counter()
+    succeeded = failed = pages = 0
+    options = {**options, "workers": 1}
+    progress.emit("batch", files_done=0, files_total=len(entries), failed=0, pages=0)
+
+    with ProcessPoolExecutor(max_workers=max(1, min(workers, len(entries) or 1))) as executor:
+        futures = {executor.submit(_extract_batch_entry, entry, options): entry for entry in entries}
+        for future in as_completed(futures):
+            try:
+                record = future.result()
+            except BrokenProcessPool:
+                record = _extract_isolated(futures[future], options)
+            if record["ok"]:
+                succeeded += 1
+                pages += record["page_count"]
+            else:
+                failed += 1
+            yield record
+            progress.emit("batch", files_done=succeeded + failed, files_total=len(entries),
+                          failed=failed, pages=pages)
+
+    elapsed = time.perf_counter() - started
+    yield {
+        "type": "summary",
+        "files": len(entries),
+        "succeeded": succeeded,
+        "failed": failed,
+        "pages": pages,
+        "elapsed_s": round(elapsed, 3),
+        "files_per_s": round(len(entries) / elapsed, 2) if elapsed else None,
+        "pages_per_s": round(pages / elapsed, 1) if elapsed else None
+    }
+    progress.emit("done", files_total=len(entries), failed=failed, pages=pages)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Extract PDF text with image position markers')
+    parser.add_argument('pdf_path', nargs='?',
+                        help='Path to the PDF file, or - to read the PDF from stdin (not used with --batch)')
+    parser.add_argument('output_dir', nargs='?',
+                        help='Directory to save extracted images (not used with --archive)')
+    parser.add_argument('--archive', action='store_true',
+                        help='Write the result and all images to stdout as one framed binary stream '
+                             '(see FrameWriter) instead of JSON plus image files')
+    parser.add_argument('--probe', action='store_true',
+                        help='Only report page count, per-page character and image counts, text '
+                             'layer presence and outline presence (no layout, tables or images)')
+    parser.add_argument('--pages',
+                        help='Only extract these pages, e.g. "1-5,8,12-" (1-based, inclusive)')
+    parser.add_argument('--batch', metavar='MANIFEST',
+                        help='Extract every PDF listed in this JSON lines manifest ({"pdf", "output_dir"} '
+                             'per line, - for stdin), writing result.json into each output_dir and one '
+                             'NDJSON record per file as it finishes, then a throughput summary')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Extract pages in parallel with N processes (default: 1); with --batch, '
+                             'the number of files extracted in parallel')
+    parser.add_argument('--stream', action='store_true',
+                        help='Write one JSON record per page as it finishes (NDJSON), then a summary record')
+    parser.add_argument('--max-rss-mb', type=float,
+                        help='Low-memory mode: extract serially, page by page, keeping RSS under this budget '
+                             '(peak RSS is reported in the output)')
+    parser.add_argument('--cache-dir',
+                        help='Reuse results for identical PDFs from this content-addressed cache directory')
+    parser.add_argument('--cache-max-mb', type=float, default=1024,
+                        help='Size limit of the cache directory; least recently used entries are evicted')
+    parser.add_argument('--page-store',
+                        help='Incremental mode: reuse per-page results from this directory and only '
+                             'extract changed pages (reported as changed_pages)')
+    parser.add_argument('--page-store-max-mb', type=float, default=1024,
+                        help='Size limit of the page store directory')
+    parser.add_argument('--full-table-detection', action='store_true',
+                        help='Run table detection on every page, without the ruling-line pre-filter')
+    parser.add_argument('--keep-headers-footers', action='store_true',
+                        help='Keep running headers/footers and page numbers in the text')
+    parser.add_argument('--keep-boilerplate', action='store_true',
+                        help='Keep declaration, authorization, blank and table of contents pages in the text')
+    parser.add_argument('--stage-budget', action='append', metavar='STAGE=SECONDS',
+                        help='Per-page time budget of an extraction stage (layout, tables, figures; '
+                             '0 = unlimited); pages over budget are extracted as plain text and '
+                             'listed in degraded_pages. Repeatable. Defaults: '
+                             + ', '.join(f'{k}={v:g}' for k, v in DEFAULT_STAGE_BUDGETS.items()))
+    parser.add_argument('--progress-fd', type=int, metavar='FD',
+                        help='Write JSON-lines progress events (stage, pages done/total, images, '
+                             'elapsed time) to this open file descriptor')
+    parser.add_argument('--token-budget', type=int, default=DEFAULT_TOKEN_BUDGET,
+                        help='Tokens per chunk of the result\'s token_plan '
+                             f'(default: {DEFAULT_TOKEN_BUDGET}; not with --stream)')
+    parser.add_argument('--token-rates', metavar='FILE',
+                        help='Token estimator rates written by token_budget.py calibrate')
+    parser.add_argument('--no-reflow', action='store_true',
+                        help='Keep every PDF line break instead of joining lines into paragraphs')
+    parser.add_argument('--defer-images', action='store_true',
+                        help='Do not write images; list them with xref and size for --materialize')
+    parser.add_argument('--materialize', metavar='RESULT_JSON',
+                        help='Write the images of a --defer-images result of the same PDF '
+                             '(all of them, or those given with --ids)')
+    parser.add_argument('--ids',
+                        help='With --materialize: comma-separated image ids to write')
+    parser.add_argument('--normalize-images', action='store_true',
+                        help='Downscale oversized images and convert formats Word/LaTeX cannot embed '
+                             'to PNG/JPEG (bytes saved are reported as image_normalization)')
+    parser.add_argument('--image-max-side', type=int, default=DEFAULT_MAX_SIDE,
+                        help=f'With --normalize-images: longest image side in pixels (default: {DEFAULT_MAX_SIDE})')
+    parser.add_argument('--image-max-dpi', type=float, default=DEFAULT_MAX_DPI,
+                        help=f'With --normalize-images: resolution at the displayed figure width '
+                             f'(default: {DEFAULT_MAX_DPI})')
+    args = parser.parse_args()
+
+    pdf_path = args.pdf_path
+    output_dir = args.output_dir
+
+    if args.batch:
+        if args.stream or args.archive or args.materialize or args.probe:
+            print("Error: --batch cannot be combined with --stream, --archive, --materialize or --probe",
+                  file=sys.stderr)
+            sys.exit(1)
+    elif not pdf_path:
+        print("Error: pdf_path is required unless --batch is given", file=sys.stderr)
+        sys.exit(1)
+    elif pdf_path == '-':
+        pdf_path = sys.stdin.buffer.read()
+    elif not os.path.exists(pdf_path):
         print(f"Error: PDF file not found: {pdf_path}", file=sys.stderr)
         sys.exit(1)
 
-    os.makedirs(output_dir, exist_ok=True)
+    if args.archive and args.cache_dir:
+        # Cache entries are filled from and linked into an output directory
+        print("Error: --archive cannot be combined with --cache-dir", file=sys.stderr)
+        sys.exit(1)
+    if not args.archive and not args.probe and not args.batch:
+        if not output_dir:
+            print("Error: output_dir is required unless --archive is given", file=sys.stderr)
+            sys.exit(1)
+        os.makedirs(output_dir, exist_ok=True)
+
+    options = {
+        "workers": args.workers,
+        "full_table_detection": args.full_table_detection,
+    }
+    image_options = {}
+    if args.normalize_images:
+        image_options = {
+            "normalize_images": True,
+            "image_max_side": args.image_max_side,
+            "image_max_dpi": args.image_max_dpi,
+        }
+    options.update(image_options)
+    if args.defer_images:
+        options["defer_images"] = True
+    if args.pages:
+        options["pages"] = args.pages
+    if args.keep_headers_footers:
+        options["keep_headers_footers"] = True
+    if args.no_reflow:
+        options["reflow"] = False
+    if args.keep_boilerplate:
+        options["keep_boilerplate"] = True
+    if args.progress_fd is not None:
+        try:
+            options["progress"] = ProgressReporter(args.progress_fd)
+        except OSError as e:
+            print(f"Error: Invalid --progress-fd {args.progress_fd}: {e}", file=sys.stderr)
+            sys.exit(1)
+    if args.stage_budget:
+        try:
+            options["stage_budgets"] = parse_stage_budgets(args.stage_budget)
+        except ValueError as e:
+            print(f"Error: {e}", file=sys.stderr)
+            sys.exit(1)
+
+    if args.archive:
+        archive = FrameWriter(sys.stdout.buffer)
+        image_options["image_writer"] = options["image_writer"] = archive.write_image
+        emit = archive.write_json
+        # Everything printed while extracting goes to stderr, stdout carries the frames
+        output_context = contextlib.redirect_stdout(sys.stderr)
+    else:
+        archive = None
+
+        def emit(name: str, record: dict) -> None:
+            print(json.dumps(record, ensure_ascii=False), flush=True)
+        output_context = contextlib.nullcontext()
 
     try:
-        result = extract_pdf_with_layout(pdf_path, output_dir)
-        print(json.dumps(result, ensure_ascii=False))
+        with output_context:
+            run_extraction(args, pdf_path, output_dir, options, image_options, emit)
+        if archive:
+            archive.close()
     except Exception as e:
         print(f"Error: {e}", file=sys.stderr)
         sys.exit(1)
 
 
+def run_extraction(args, pdf_path, output_dir: str, options: dict, image_options: dict, emit) -> None:
+    """Run the extraction selected by the command line, passing results to emit(name, record)"""
+    token_options = {"token_budget": args.token_budget}
+    if args.token_rates:
+        token_options["token_rates"] = TokenEstimator.from_file(args.token_rates).rates
+
+    if args.batch:
+        if args.batch == '-':
+            entries = read_manifest(sys.stdin)
+        else:
+            with open(args.batch, 'r', encoding='utf-8') as f:
+                entries = read_manifest(f)
+        batch_options = {k: v for k, v in options.items() if k != "workers"}
+        for key in ("cache_dir", "cache_max_mb", "page_store", "page_store_max_mb", "max_rss_mb"):
+            batch_options[key] = getattr(args, key)
+        batch_options.update(token_options)
+        for record in extract_batch(entries, options["workers"], **batch_options):
+            emit(record["type"], record)
+        return
+
+    if args.probe:
+        emit("probe", probe_pdf(pdf_path, args.pages))
+        return
+
+    if args.materialize:
+        with open(args.materialize, 'r', encoding='utf-8') as f:
+            images = json.load(f)["images"]
+        if args.ids:
+            wanted = set(args.ids.split(','))
+            images = [img for img in images if img["id"] in wanted]
+        emit("materialized", materialize_images(pdf_path, output_dir, images, **image_options))
+        return
+
+    if args.stream:
+        for record in stream_pdf_with_layout(pdf_path, output_dir, max_rss_mb=args.max_rss_mb,
+                                             **options):
+            emit(record["type"], record)
+        return
+
+    result = extract_document(pdf_path, output_dir, args.cache_dir, args.cache_max_mb,
+                              args.page_store, args.page_store_max_mb, max_rss_mb=args.max_rss_mb,
+                              **token_options, **options)
+    emit("result", result)
+
+
 if __name__ == "__main__":
     main()
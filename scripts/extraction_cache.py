@@ -0,0 +1,231 @@
+"""
+Content-addressed on-disk cache for extract_pdf.py results.
+
+Entries are keyed by the SHA-256 of the PDF bytes, the extractor version and
+the extraction options, and hold result.json plus the extracted images. The
+cache is bounded by total size with least-recently-used eviction and is safe
+to share between concurrent worker processes:
+
+- entries are built in a private temp directory and published with rename()
+- readers treat a vanished or half-deleted entry as a miss
+- eviction is serialized with an flock() on the cache directory
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import fcntl
+import hashlib
+import uuid
+from typing import Optional, Dict, Any, Union
+
+RESULT_FILE = 'result.json'
+IMAGES_DIR = 'images'
+LOCK_FILE = '.lock'
+TMP_PREFIX = '.tmp-'
+
+
+def file_sha256(path: str, chunk_size: int = 1024 * 1024) -> str:
+    """SHA-256 of a file's bytes"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ExtractionCache:
+    """Size-bounded LRU cache of extraction results"""
+
+    def __init__(self, cache_dir: str, max_bytes: int = 1024 * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def key_for(self, pdf: Union[str, bytes], version: str, options: Optional[Dict[str, Any]] = None) -> str:
+        """
+        Cache key from PDF content (a file path or the PDF bytes), extractor
+        version and output-affecting options
+        """
+        digest = hashlib.sha256(pdf).hexdigest() if isinstance(pdf, bytes) else file_sha256(pdf)
+        material = json.dumps(
+            {"pdf": digest, "version": version, "options": options or {}},
+            sort_keys=True
+        )
+        return hashlib.sha256(material.encode('utf-8')).hexdigest()
+
+    def _entry_dir(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key)
+
+    def get(self, key: str, output_dir: str) -> Optional[Dict[str, Any]]:
+        """
+        Return the cached result and place its images in output_dir,
+        or None on a miss.
+        """
+        entry = self._entry_dir(key)
+        try:
+            with open(os.path.join(entry, RESULT_FILE), 'r', encoding='utf-8') as f:
+                result = json.load(f)
+
+            images_dir = os.path.join(entry, IMAGES_DIR)
+            for img in _written_images(result):
+                src = os.path.join(images_dir, img["filename"])
+                dst = os.path.join(output_dir, img["filename"])
+                if os.path.exists(dst):
+                    os.unlink(dst)
+                try:
+                    os.link(src, dst)
+                except OSError:
+                    # Different filesystem or no hardlink support
+                    shutil.copyfile(src, dst)
+
+            # Mark as recently used
+            os.utime(entry)
+            return result
+        except (OSError, ValueError, KeyError) as e:
+            # Missing entry, or evicted while we were reading it
+            if os.path.exists(entry):
+                sys.stderr.write(f"Warning: Ignoring unreadable cache entry {key}: {e}\n")
+            return None
+
+    def put(self, key: str, result: Dict[str, Any], output_dir: str) -> None:
+        """Store a result and the images it references from output_dir"""
+        def write(images_dir: str) -> Dict[str, Any]:
+            for img in _written_images(result):
+                shutil.copyfile(
+                    os.path.join(output_dir, img["filename"]),
+                    os.path.join(images_dir, img["filename"])
+                )
+            return result
+
+        self._publish(key, write)
+
+    def _publish(self, key: str, write) -> None:
+        """
+        Build an entry in a temp directory and rename it into place.
+        write(images_dir) copies the entry's files and returns its result dict.
+        """
+        entry = self._entry_dir(key)
+        if os.path.exists(entry):
+            return
+
+        tmp_dir = os.path.join(self.cache_dir, f"{TMP_PREFIX}{uuid.uuid4().hex}")
+        try:
+            images_dir = os.path.join(tmp_dir, IMAGES_DIR)
+            os.makedirs(images_dir)
+            result = write(images_dir)
+            with open(os.path.join(tmp_dir, RESULT_FILE), 'w', encoding='utf-8') as f:
+                json.dump(result, f, ensure_ascii=False)
+
+            try:
+                os.rename(tmp_dir, entry)
+            except OSError:
+                # Another worker published the same entry first
+                shutil.rmtree(tmp_dir, ignore_errors=True)
+        except OSError as e:
+            sys.stderr.write(f"Warning: Failed to write cache entry {key}: {e}\n")
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            return
+
+        self.evict()
+
+    def evict(self) -> None:
+        """Remove least recently used entries until the cache fits max_bytes"""
+        with open(os.path.join(self.cache_dir, LOCK_FILE), 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+
+            entries = []
+            total = 0
+            for item in os.scandir(self.cache_dir):
+                if not item.is_dir() or item.name.startswith('.'):
+                    continue
+                size = _dir_size(item.path)
+                entries.append((item.stat().st_mtime, size, item.path))
+                total += size
+
+            for _, size, path in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                # Rename first so readers never see a partially deleted entry
+                doomed = os.path.join(self.cache_dir, f"{TMP_PREFIX}{uuid.uuid4().hex}")
+                try:
+                    os.rename(path, doomed)
+                except OSError:
+                    continue
+                shutil.rmtree(doomed, ignore_errors=True)
+                total -= size
+
+            self._remove_stale_tmp()
+
+    def _remove_stale_tmp(self, max_age: float = 3600) -> None:
+        """Clean up temp directories left behind by crashed writers"""
+        now = time.time()
+        for item in os.scandir(self.cache_dir):
+            if item.name.startswith(TMP_PREFIX) and now - item.stat().st_mtime > max_age:
+                shutil.rmtree(item.path, ignore_errors=True)
+
+
+class PageStore(ExtractionCache):
+    """
+    Per-page extraction store for incremental re-extraction.
+
+    Entries are keyed by a page fingerprint and hold the page content as
+    returned by extract_pdf.extract_page_content(), with figure bytes kept as
+    files next to result.json.
+    """
+
+    def get_page(self, key: str) -> Optional[Dict[str, Any]]:
+        """Return the stored page content, or None on a miss"""
+        entry = self._entry_dir(key)
+        try:
+            with open(os.path.join(entry, RESULT_FILE), 'r', encoding='utf-8') as f:
+                stored = json.load(f)
+
+            parts = []
+            for kind, value in stored["parts"]:
+                if kind == "figure" and "file" in value:
+                    with open(os.path.join(entry, IMAGES_DIR, value.pop("file")), 'rb') as f:
+                        value["image"] = f.read()
+                parts.append((kind, value))
+            stored["parts"] = parts
+
+            os.utime(entry)
+            return stored
+        except (OSError, ValueError, KeyError) as e:
+            if os.path.exists(entry):
+                sys.stderr.write(f"Warning: Ignoring unreadable page store entry {key}: {e}\n")
+            return None
+
+    def put_page(self, key: str, page_content: Dict[str, Any]) -> None:
+        """Store a page's parts and its other fields (e.g. font statistics)"""
+        def write(images_dir: str) -> Dict[str, Any]:
+            parts = []
+            for index, (kind, value) in enumerate(page_content["parts"]):
+                if kind == "figure" and "image" in value:
+                    filename = f"{index}.{value['ext']}"
+                    with open(os.path.join(images_dir, filename), 'wb') as f:
+                        f.write(value["image"])
+                    value = {k: v for k, v in value.items() if k != "image"}
+                    value["file"] = filename
+                parts.append((kind, value))
+            return {**page_content, "parts": parts}
+
+        self._publish(key, write)
+
+
+def _written_images(result: Dict[str, Any]) -> list:
+    """Image entries with a file in the output directory (not deferred ones)"""
+    return [img for img in result.get("images", []) if img.get("filename")]
+
+
+def _dir_size(path: str) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
@@ -2,6 +2,7 @@
 """
 Generate formatted DOCX from thesis JSON data with table and image support.
 Usage: python generate_docx.py <input.json> <output.docx> [--images-dir <dir>] [--template <template.docx>]
+                              [--progress-fd <fd>]
 """
 
 import json
@@ -17,6 +18,8 @@ from docx.enum.style import WD_STYLE_TYPE
 from docx.oxml.ns import qn, nsmap
 from docx.oxml import OxmlElement
 
+from progress import ProgressReporter, NO_PROGRESS
+
 
 def set_chinese_font(run, font_name='宋体', size=12, bold=False):
     """Set Chinese font for a run"""
@@ -150,8 +153,15 @@ def add_image_from_buffer(doc, image_buffer, width_inches=5, caption=None):
         return None
 
 
-def generate_thesis_docx(data, output_path, images_dir=None, template_path=None):
-    """Generate DOCX from thesis data"""
+def generate_thesis_docx(data, output_path, images_dir=None, template_path=None, progress=None):
+    """
+    Generate DOCX from thesis data
+
+    progress (a progress.ProgressReporter) gets "front_matter", "sections"
+    (after each section: sections_done, sections_total, images), "save" and
+    "done" events.
+    """
+    progress = progress or NO_PROGRESS
 
     # Use template if provided, otherwise create new document
     if template_path and os.path.exists(template_path):
@@ -311,6 +321,8 @@ def generate_thesis_docx(data, output_path, images_dir=None, template_path=None)
 
         doc.add_page_break()
 
+    progress.emit("front_matter")
+
     # === Table of Contents placeholder ===
     add_heading_chinese(doc, '目  录', 1, '黑体', 18)
     p = doc.add_paragraph()
@@ -322,8 +334,10 @@ def generate_thesis_docx(data, output_path, images_dir=None, template_path=None)
     # === Sections ===
     table_index = 0
     image_index = 0
+    images_added = 0
+    sections = data.get('sections', [])
 
-    for section in data.get('sections', []):
+    for sections_done, section in enumerate(sections, 1):
         level = section.get('level', 1)
         title = section.get('title', '')
         content = section.get('content', '')
@@ -364,7 +378,11 @@ def generate_thesis_docx(data, output_path, images_dir=None, template_path=None)
                     img_info = images[idx]
                     img_path = os.path.join(images_dir, img_info.get('filename', ''))
                     if os.path.exists(img_path):
-                        add_image_from_file(doc, img_path, caption=f"图 {img_num}")
+                        if add_image_from_file(doc, img_path, caption=f"图 {img_num}"):
+                            images_added += 1
+
+        progress.emit("sections", sections_done=sections_done, sections_total=len(sections),
+                      images=images_added)
 
     # === Add remaining tables if not placed ===
     # (Tables that weren't referenced in content)
@@ -392,8 +410,10 @@ def generate_thesis_docx(data, output_path, images_dir=None, template_path=None)
         add_paragraph_chinese(doc, data['acknowledgements'])
 
     # Save
+    progress.emit("save")
     doc.save(output_path)
     print(f'Generated: {output_path}')
+    progress.emit("done", sections_total=len(sections), images=images_added)
     return output_path
 
 
@@ -403,6 +423,8 @@ def main():
     parser.add_argument('output', help='Output DOCX file path')
     parser.add_argument('--images-dir', help='Directory containing extracted images')
     parser.add_argument('--template', help='Word template file for styling')
+    parser.add_argument('--progress-fd', type=int, metavar='FD',
+                        help='Write JSON-lines progress events to this open file descriptor')
 
     args = parser.parse_args()
 
@@ -413,7 +435,8 @@ def main():
         data,
         args.output,
         images_dir=args.images_dir,
-        template_path=args.template
+        template_path=args.template,
+        progress=ProgressReporter(args.progress_fd) if args.progress_fd is not None else None
     )
 
 
@@ -0,0 +1,144 @@
+"""
+Image normalization for extract_pdf.py.
+
+Caps the resolution of extracted figures and converts formats that LaTeX and
+Word cannot embed (JPEG 2000, TIFF, BMP, ...) to PNG or JPEG. JPEG and PNG
+images that are already within the cap are written as they are.
+
+Images are decoded, resampled and encoded with Pillow in a thread pool;
+Pillow releases the GIL for that work, so figures are processed in parallel.
+"""
+
+import os
+import sys
+import threading
+from io import BytesIO
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Tuple
+
+from PIL import Image
+
+# Lossy source formats; written as JPEG rather than PNG when they have no alpha
+PHOTO_FORMATS = ('jpeg', 'jpx')
+
+DEFAULT_MAX_SIDE = 2400
+DEFAULT_MAX_DPI = 300
+# Widest a figure is shown in the generated thesis (A4 text width)
+TARGET_WIDTH_INCHES = 6.3
+JPEG_QUALITY = 90
+# Images less than this far over the cap are kept: re-encoding them loses
+# quality for little size reduction
+MIN_SCALE = 0.8
+
+
+class ImageNormalizer:
+    """
+    Normalizes extracted images in a thread pool and keeps per-document totals.
+
+    An image is downscaled when its longest side exceeds max_side, or when it
+    would be shown at more than max_dpi: its displayed width is its bbox width
+    on the source page, capped at TARGET_WIDTH_INCHES. Images only slightly
+    over the cap (see MIN_SCALE) are left alone.
+    """
+
+    def __init__(self, max_side: int = DEFAULT_MAX_SIDE, max_dpi: float = DEFAULT_MAX_DPI,
+                 workers: Optional[int] = None):
+        self.max_side = max_side
+        self.max_dpi = max_dpi
+        self.executor = ThreadPoolExecutor(max_workers=workers or min(4, os.cpu_count() or 1))
+        self._lock = threading.Lock()
+        self.stats = {
+            "images": 0,
+            "passed_through": 0,
+            "downscaled": 0,
+            "converted": 0,
+            "failed": 0,
+            "bytes_in": 0,
+            "bytes_out": 0
+        }
+
+    def submit(self, image: bytes, ext: str, bbox, name: str, write, source_format: str = None):
+        """
+        Normalize image in the pool and pass it to write(filename, data) as
+        name plus the extension of its output format. write is called from
+        pool threads.
+
+        Returns:
+            Future resolving to the filename
+        """
+        return self.executor.submit(self._write, image, ext, bbox, name, write, source_format)
+
+    def _write(self, image: bytes, ext: str, bbox, name: str, write, source_format: str = None) -> str:
+        data, ext = self.normalize(image, ext, bbox, source_format)
+        filename = f"{name}.{ext}"
+        write(filename, data)
+        return filename
+
+    def normalize(self, image: bytes, ext: str, bbox=None, source_format: str = None) -> Tuple[bytes, str]:
+        """
+        Return the normalized image bytes and extension.
+
+        source_format is the codec the image was stored with in the PDF when
+        that differs from ext (a JPEG 2000 image extracted as PNG).
+        """
+        try:
+            data, out_ext, action = self._normalize(image, ext, bbox, source_format or ext)
+        except Exception as e:
+            # Unreadable by Pillow (e.g. JPEG XR): keep the original
+            sys.stderr.write(f"Warning: Failed to normalize {ext} image: {e}\n")
+            data, out_ext, action = image, ext, "failed"
+
+        with self._lock:
+            self.stats["images"] += 1
+            self.stats[action] += 1
+            self.stats["bytes_in"] += len(image)
+            self.stats["bytes_out"] += len(data)
+        return data, out_ext
+
+    def _normalize(self, image: bytes, ext: str, bbox, source_format: str):
+        im = Image.open(BytesIO(image))
+        width, height = im.size
+        scale = self._scale(width, height, bbox)
+
+        suitable = (ext == 'png' and source_format == 'png') or (ext == 'jpeg' and im.mode in ('L', 'RGB'))
+        if scale >= 1 and suitable:
+            return image, ext, "passed_through"
+
+        if scale < 1:
+            # thumbnail() lets the JPEG decoder scale down while decoding
+            im.thumbnail((max(1, round(width * scale)), max(1, round(height * scale))), Image.LANCZOS)
+
+        has_alpha = im.mode in ('RGBA', 'LA', 'PA') or (im.mode == 'P' and 'transparency' in im.info)
+        out = BytesIO()
+        if source_format in PHOTO_FORMATS and not has_alpha:
+            if im.mode not in ('L', 'RGB'):
+                im = im.convert('RGB')
+            im.save(out, 'JPEG', quality=JPEG_QUALITY, optimize=True)
+            out_ext = 'jpeg'
+        else:
+            if im.mode not in ('1', 'L', 'LA', 'P', 'RGB', 'RGBA', 'I', 'I;16'):
+                im = im.convert('RGBA' if has_alpha else 'RGB')
+            im.save(out, 'PNG')
+            out_ext = 'png'
+
+        return out.getvalue(), out_ext, "downscaled" if scale < 1 else "converted"
+
+    def _scale(self, width: int, height: int, bbox) -> float:
+        scale = 1.0
+        if self.max_side and max(width, height) > self.max_side:
+            scale = self.max_side / max(width, height)
+        if self.max_dpi and bbox and bbox[2] > bbox[0] and width > 0:
+            shown_inches = min((bbox[2] - bbox[0]) / 72, TARGET_WIDTH_INCHES)
+            scale = min(scale, self.max_dpi * shown_inches / width)
+        return scale if scale < MIN_SCALE else 1.0
+
+    def report(self) -> dict:
+        with self._lock:
+            report = dict(self.stats)
+        report["bytes_saved"] = report["bytes_in"] - report["bytes_out"]
+        report["max_side"] = self.max_side
+        report["max_dpi"] = self.max_dpi
+        return report
+
+    def shutdown(self) -> None:
+        self.executor.shutdown(wait=True)
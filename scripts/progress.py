@@ -0,0 +1,58 @@
+"""
+Machine-readable progress events for the thesis formatter scripts.
+
+Events are JSON lines written to a dedicated file descriptor (--progress-fd),
+separate from the result on stdout and free-form warnings on stderr:
+
+    {"event": "progress", "stage": "extract", "elapsed_ms": 412,
+     "pages_done": 3, "pages_total": 40, "images": 2}
+
+Every event has the stage and the milliseconds since the reporter was
+created; the other fields depend on the stage. A final {"stage": "done"}
+event follows a successful run. A caller can treat a channel that stays
+silent for too long as a stalled process.
+"""
+
+import os
+import json
+import time
+import threading
+
+
+class ProgressReporter:
+    """
+    Writes progress events to a file descriptor or a text stream; without
+    either every call is a no-op. Write errors (the reader went away)
+    silently disable reporting.
+    """
+
+    def __init__(self, fd: int = None, stream=None):
+        self.stream = stream
+        if fd is not None:
+            self.stream = os.fdopen(fd, 'w', buffering=1, encoding='utf-8', closefd=False)
+        self.started = time.perf_counter()
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.stream is not None
+
+    def emit(self, stage: str, **fields) -> None:
+        if self.stream is None:
+            return
+        event = {
+            "event": "progress",
+            "stage": stage,
+            "elapsed_ms": round((time.perf_counter() - self.started) * 1000),
+            **fields
+        }
+        with self._lock:
+            try:
+                self.stream.write(json.dumps(event, ensure_ascii=False) + "\n")
+                self.stream.flush()
+            except (OSError, ValueError):
+                self.stream = None
+
+
+# Reporter for callers that do not want progress events
+NO_PROGRESS = ProgressReporter()
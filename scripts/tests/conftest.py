@@ -0,0 +1,191 @@
+"""
+Fixtures for the extraction script tests.
+
+The scripts import each other as top-level modules (run from scripts/), so
+the scripts directory goes on sys.path. PDFs are generated with PyMuPDF.
+"""
+
+import os
+import sys
+
+import fitz
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+CJK_FONT = "china-s"
+
+
+def solid_png(width: int, height: int, value: int) -> bytes:
+    """PNG of a single grey value"""
+    pixmap = fitz.Pixmap(fitz.csRGB, fitz.IRect(0, 0, width, height), False)
+    pixmap.clear_with(value)
+    return pixmap.tobytes("png")
+
+
+def draw_table(page, writer, font, x0: float, y0: float, rows: list,
+               col_width: float = 100, row_height: float = 18) -> float:
+    """Ruled table of rows of cell text; returns the y below it"""
+    for r, row in enumerate(rows):
+        for c, cell in enumerate(row):
+            rect = fitz.Rect(x0 + c * col_width, y0 + r * row_height,
+                             x0 + (c + 1) * col_width, y0 + (r + 1) * row_height)
+            page.draw_rect(rect, color=(0, 0, 0), width=0.5)
+            writer.append((rect.x0 + 4, rect.y1 - 5), cell, font=font, fontsize=9)
+    return y0 + len(rows) * row_height
+
+
+@pytest.fixture(scope="session")
+def thesis_pdf(tmp_path_factory) -> str:
+    """
+    12-page thesis-like PDF: chapter headings, CJK and English body text,
+    a figure every third page (one image reused on every page as a logo) and
+    a ruled table every fourth page
+    """
+    path = str(tmp_path_factory.mktemp("pdf") / "thesis.pdf")
+    font = fitz.Font(CJK_FONT)
+    logo = solid_png(40, 40, 200)
+    doc = fitz.open()
+    for p in range(12):
+        page = doc.new_page()
+        writer = fitz.TextWriter(page.rect)
+        page.insert_image(fitz.Rect(30, 25, 50, 45), stream=logo)
+        y = 90
+        if p % 4 == 0:
+            writer.append((72, y), f"第{p // 4 + 1}章 研究内容", font=font, fontsize=18)
+            y += 30
+        for i in range(8):
+            writer.append((72, y), f"这是第{p + 1}页的第{i + 1}行正文内容，用于测试提取和版面分析。",
+                          font=font, fontsize=11)
+            y += 16
+        if p % 3 == 0:
+            page.insert_image(fitz.Rect(72, y, 222, y + 100), stream=solid_png(60 + p, 40, 10 * p))
+            y += 120
+        if p % 4 == 1:
+            y = draw_table(page, writer, font, 72, y,
+                           [["数据集", "类别数", "训练集"], ["CIFAR-10", "10", "50,000"],
+                            ["ImageNet", "1,000", "1,281,167"]]) + 10
+        for i in range(4):
+            writer.append((72, y), f"English body text on page {p + 1}, line {i + 1}.",
+                          font=font, fontsize=11)
+            y += 16
+        writer.write_text(page)
+    doc.save(path)
+    doc.close()
+    return path
+
+
+@pytest.fixture(scope="session")
+def copied_image_pdf(tmp_path_factory) -> str:
+    """
+    3-page PDF showing one picture stored under two xrefs (pages 1 and 2,
+    merged from separate documents) and a different picture on page 3
+    """
+    path = str(tmp_path_factory.mktemp("pdf") / "copied.pdf")
+    doc = fitz.open()
+    for value in (120, 120, 60):
+        part = fitz.open()
+        part.new_page().insert_image(fitz.Rect(72, 72, 272, 172), stream=solid_png(80, 40, value))
+        doc.insert_pdf(part)
+        part.close()
+    doc.save(path)
+    doc.close()
+    return path
+
+
+FOOTERS = ["- i -", "- ii -", "- iii -", "1", "2", "", "CD", "I"]
+
+
+@pytest.fixture(scope="session")
+def page_number_pdf(tmp_path_factory) -> str:
+    """
+    8-page PDF with the bottom margin line of each page from FOOTERS ("" for
+    none) under a line of body text
+    """
+    path = str(tmp_path_factory.mktemp("pdf") / "page_numbers.pdf")
+    doc = fitz.open()
+    for p, footer in enumerate(FOOTERS):
+        page = doc.new_page()
+        page.insert_text((72, 100), f"Body text of page {p + 1}.", fontsize=11)
+        if footer:
+            page.insert_text((290, 810), footer, fontsize=10)
+    doc.save(path)
+    doc.close()
+    return path
+
+
+@pytest.fixture(scope="session")
+def raised_footer_pdf(tmp_path_factory) -> str:
+    """
+    4-page letter-size PDF laid out like the LaTeX sample thesis: body text
+    from y=100 (the first line repeats, digits aside) down to about y=670
+    and the page number centered at y=704, above the 8% bottom band
+    """
+    path = str(tmp_path_factory.mktemp("pdf") / "raised_footer.pdf")
+    doc = fitz.open()
+    for p in range(4):
+        page = doc.new_page(width=612, height=792)
+        for i in range(48):
+            page.insert_text((134, 100 + 12 * i), f"Body text of page {p + 1}, line {i + 1}.", fontsize=10)
+        page.insert_text((303, 704), str(p + 1), fontsize=10)
+    doc.save(path)
+    doc.close()
+    return path
+
+
+PARAGRAPHS = [
+    "图像识别是计算机视觉的基础任务之一，本章首先介绍研究背景及意义，然后回顾国内外研究现状，"
+    "最后给出本文的主要研究内容与章节安排",
+    "近年来，深度学习方法在图像识别任务中取得了显著进展，卷积神经网络已经成为计算机视觉领域的主流方法，"
+    "并在多个基准数据集上超过了传统方法。",
+]
+
+
+def draw_line_blocks(page, paragraphs: list, y: float, size: float, per_line: int = 37) -> float:
+    """
+    Draw paragraphs with each line on its own (one text block per line),
+    per_line glyphs to a line and a two-character first-line indent;
+    returns the y below them
+    """
+    font = fitz.Font(CJK_FONT)
+    for paragraph in paragraphs:
+        lines = [paragraph[:per_line - 2]]
+        lines += [paragraph[i:i + per_line] for i in range(per_line - 2, len(paragraph), per_line)]
+        for n, line in enumerate(lines):
+            writer = fitz.TextWriter(page.rect)
+            writer.append((72 + (2 * size if n == 0 else 0), y), line, font=font, fontsize=size)
+            writer.write_text(page)
+            y += 2 * size
+    return y
+
+
+@pytest.fixture(scope="session")
+def line_blocks_pdf(tmp_path_factory) -> str:
+    """
+    1-page PDF typeset like LaTeX/xeCJK output: each line of PARAGRAPHS
+    drawn on its own (one text block per line), justified to a 444pt column
+    with a two-character first-line indent
+    """
+    path = str(tmp_path_factory.mktemp("pdf") / "line_blocks.pdf")
+    doc = fitz.open()
+    draw_line_blocks(doc.new_page(), PARAGRAPHS, 100, 12)
+    doc.save(path)
+    doc.close()
+    return path
+
+
+@pytest.fixture(scope="session")
+def short_line_blocks_pdf(tmp_path_factory) -> str:
+    """
+    1-page PDF like line_blocks_pdf where the lines of PARAGRAPHS[1] stop
+    about 0.8 glyph short of the column edge set by PARAGRAPHS[0], more than
+    half a line height
+    """
+    path = str(tmp_path_factory.mktemp("pdf") / "short_line_blocks.pdf")
+    doc = fitz.open()
+    page = doc.new_page()
+    y = draw_line_blocks(page, PARAGRAPHS[:1], 100, 12)
+    draw_line_blocks(page, PARAGRAPHS[1:], y, 11.75)
+    doc.save(path)
+    doc.close()
+    return path
@@ -0,0 +1,38 @@
+import json
+import os
+import subprocess
+import sys
+
+import extract_pdf
+
+SCRIPT = os.path.join(os.path.dirname(extract_pdf.__file__), "extract_pdf.py")
+
+
+def test_batch_reports_a_broken_input_and_writes_the_others(thesis_pdf, copied_image_pdf, tmp_path):
+    broken_pdf = tmp_path / "broken.pdf"
+    broken_pdf.write_bytes(b"%PDF-1.7\n" + b"\x00garbage" * 100)
+    inputs = {"thesis": thesis_pdf, "broken": str(broken_pdf), "copied": copied_image_pdf}
+    manifest = tmp_path / "manifest.jsonl"
+    manifest.write_text(
+        "".join(json.dumps({"id": name, "pdf": pdf, "output_dir": str(tmp_path / name)}) + "\n"
+                for name, pdf in inputs.items()) + "not json\n",
+        encoding='utf-8')
+
+    completed = subprocess.run([sys.executable, SCRIPT, "--batch", str(manifest), "--workers", "2"],
+                               capture_output=True, text=True, timeout=120, check=True)
+    records = [json.loads(line) for line in completed.stdout.splitlines()]
+
+    files = {record["id"]: record for record in records if record["type"] == "file"}
+    assert files["broken"]["ok"] is False and files["broken"]["error"].startswith("FileDataError")
+    assert files["line 4"]["ok"] is False and "Invalid manifest line 4" in files["line 4"]["error"]
+    assert not os.path.exists(tmp_path / "broken" / extract_pdf.RESULT_FILENAME)
+    for name in ("thesis", "copied"):
+        assert files[name]["ok"] is True
+        with open(files[name]["result"], encoding='utf-8') as f:
+            written = json.load(f)
+        os.makedirs(tmp_path / "direct" / name)
+        expected = extract_pdf.extract_pdf_with_layout(inputs[name], str(tmp_path / "direct" / name))
+        assert written["text_with_images"] == expected["text_with_images"]
+        assert files[name]["image_count"] == len(expected["images"])
+    assert records[-1]["type"] == "summary"
+    assert (records[-1]["files"], records[-1]["succeeded"], records[-1]["failed"]) == (4, 2, 2)
@@ -0,0 +1,46 @@
+import fitz
+
+from extract_pdf import FRONT_MATTER_MAX_PAGES, classify_page, front_matter_pages, parse_toc_lines
+
+BODY = ["The system checks each request against the access policy of its tenant."] * 5
+
+
+def test_numbered_authorization_section_is_content():
+    assert classify_page(4, ["4.3 Authorization"] + BODY, []) is None
+    assert classify_page(4, ["Authorization"] + BODY, []) is None
+
+
+def test_declaration_is_only_recognized_in_front_matter():
+    lines = ["学位论文原创性声明", "本人郑重声明：所呈交的论文是本人在导师指导下独立进行研究所取得的成果。"]
+
+    assert classify_page(1, lines, []) == "declaration"
+    assert classify_page(1, ["授权使用说明", "使用授权书"] + lines[1:], []) == "authorization"
+    assert classify_page(12, lines, [], front_matter=12) is None
+    assert classify_page(FRONT_MATTER_MAX_PAGES, lines, []) is None
+
+
+def test_toc_title_split_over_two_lines():
+    assert classify_page(3, ["目", "录", "摘要", "Abstract"], []) == "toc"
+
+
+def test_toc_entries_with_page_numbers_on_their_own_lines():
+    lines = ["第一章 绪论 ..........", "1", "1.1 研究背景 ..........", "1",
+             "1.2 研究现状 ..........", "3", "第二章 相关工作 ...... 9"]
+
+    assert classify_page(4, lines, []) == "toc"
+    assert parse_toc_lines(lines) == [
+        {"level": 1, "title": "第一章 绪论", "page_label": "1"},
+        {"level": 2, "title": "1.1 研究背景", "page_label": "1"},
+        {"level": 2, "title": "1.2 研究现状", "page_label": "3"},
+        {"level": 1, "title": "第二章 相关工作", "page_label": "9"},
+    ]
+
+
+def test_front_matter_ends_at_first_numbered_bookmark():
+    doc = fitz.open()
+    for _ in range(8):
+        doc.new_page()
+    assert front_matter_pages(doc) == FRONT_MATTER_MAX_PAGES
+
+    doc.set_toc([[1, "摘要", 2], [1, "目录", 3], [1, "第1章 绪论", 5], [2, "1.1 研究背景", 5]])
+    assert front_matter_pages(doc) == 4
@@ -0,0 +1,145 @@
+import zipfile
+
+import pytest
+
+from conftest import solid_png
+from extract_docx import extract_docx
+
+NAMESPACES = ('xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main" '
+              'xmlns:m="http://schemas.openxmlformats.org/officeDocument/2006/math" '
+              'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships" '
+              'xmlns:a="http://schemas.openxmlformats.org/drawingml/2006/main"')
+
+STYLES = f'''<w:styles {NAMESPACES}>
+  <w:style w:type="paragraph" w:styleId="Heading1"><w:name w:val="heading 1"/></w:style>
+  <w:style w:type="paragraph" w:styleId="Heading2"><w:name w:val="heading 2"/></w:style>
+  <w:style w:type="paragraph" w:styleId="ChapterTitle"><w:name w:val="Chapter Title"/>
+    <w:basedOn w:val="Heading1"/></w:style>
+  <w:style w:type="paragraph" w:styleId="Outline3"><w:name w:val="Section Title"/>
+    <w:pPr><w:outlineLvl w:val="2"/></w:pPr></w:style>
+  <w:style w:type="paragraph" w:styleId="TOC1"><w:name w:val="toc 1"/></w:style>
+</w:styles>'''
+
+RELATIONSHIPS = '''<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">
+  <Relationship Id="rIdImg1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/image"
+                Target="media/image1.png"/>
+</Relationships>'''
+
+
+def paragraph(text: str, style: str = None) -> str:
+    ppr = f'<w:pPr><w:pStyle w:val="{style}"/></w:pPr>' if style else ''
+    return f'<w:p>{ppr}<w:r><w:t xml:space="preserve">{text}</w:t></w:r></w:p>'
+
+
+def picture(relationship_id: str = "rIdImg1") -> str:
+    return f'<w:p><w:r><w:drawing><a:blip r:embed="{relationship_id}"/></w:drawing></w:r></w:p>'
+
+
+def cell(content: str, properties: str = '') -> str:
+    return f'<w:tc><w:tcPr>{properties}</w:tcPr>{content}</w:tc>'
+
+
+def write_docx(path, *blocks: str) -> str:
+    """Minimal DOCX with blocks as the body, STYLES and one PNG as rIdImg1"""
+    document = f'<w:document {NAMESPACES}><w:body>{"".join(blocks)}</w:body></w:document>'
+    with zipfile.ZipFile(path, 'w') as zf:
+        zf.writestr('word/document.xml', document)
+        zf.writestr('word/styles.xml', STYLES)
+        zf.writestr('word/_rels/document.xml.rels', RELATIONSHIPS)
+        zf.writestr('word/media/image1.png', solid_png(8, 8, 90))
+    return str(path)
+
+
+def test_headings_come_from_style_names_based_on_and_outline_levels(tmp_path):
+    docx = write_docx(tmp_path / "headings.docx",
+                      paragraph("第一章 绪论", "ChapterTitle"), paragraph("正文。"),
+                      paragraph("1.1 研究背景", "Heading2"), paragraph("1.1.1 问题", "Outline3"),
+                      paragraph("Body text", "Normal"))
+
+    result = extract_docx(docx, str(tmp_path))
+    headings = result["outline"]["headings"]
+
+    assert [(h["level"], h["title"]) for h in headings] == [
+        (1, "第一章 绪论"), (2, "1.1 研究背景"), (3, "1.1.1 问题")]
+    for heading in headings:
+        assert result["text_with_images"].startswith(heading["title"], heading["offset"])
+
+
+def test_merged_cells_keep_their_spans(tmp_path):
+    table = ('<w:tbl>'
+             '<w:tr>' + cell(paragraph("方法")) + cell(paragraph("准确率"), '<w:gridSpan w:val="2"/>') + '</w:tr>'
+             '<w:tr>' + cell(paragraph("本文"), '<w:vMerge w:val="restart"/>') + cell(paragraph("95.6"))
+             + cell(paragraph("78.4")) + '</w:tr>'
+             '<w:tr>' + cell(paragraph(""), '<w:vMerge/>') + cell(paragraph("95.1")) + cell(paragraph("77.9")) + '</w:tr>'
+             '</w:tbl>')
+    docx = write_docx(tmp_path / "table.docx", table)
+
+    result = extract_docx(docx, str(tmp_path))
+    table_data = result["tables"][0]
+
+    assert table_data["rows"] == [["方法", "准确率", ""], ["本文", "95.6", "78.4"], ["", "95.1", "77.9"]]
+    spans = {cell["text"]: (cell["rowspan"], cell["colspan"]) for cell in table_data["cells"]}
+    assert spans["准确率"] == (1, 2) and spans["本文"] == (2, 1) and spans["95.1"] == (1, 1)
+    assert len(table_data["cells"]) == 7
+
+
+@pytest.mark.parametrize("omml, latex", [
+    ('<m:f><m:num><m:r><m:t>a</m:t></m:r></m:num><m:den><m:sSup><m:e><m:r><m:t>b</m:t></m:r></m:e>'
+     '<m:sup><m:r><m:t>2</m:t></m:r></m:sup></m:sSup></m:den></m:f>',
+     r'\frac{a}{{b}^{2}}'),
+    ('<m:nary><m:naryPr><m:chr m:val="∑"/></m:naryPr><m:sub><m:r><m:t>i=1</m:t></m:r></m:sub>'
+     '<m:sup><m:r><m:t>N</m:t></m:r></m:sup><m:e><m:sSub><m:e><m:r><m:t>x</m:t></m:r></m:e>'
+     '<m:sub><m:r><m:t>i</m:t></m:r></m:sub></m:sSub></m:e></m:nary>',
+     r'\sum_{i=1}^{N} {x}_{i}'),
+    ('<m:rad><m:radPr><m:degHide m:val="1"/></m:radPr><m:deg/><m:e><m:r><m:t>α+β</m:t></m:r></m:e></m:rad>',
+     r'\sqrt{\alpha +\beta}'),
+])
+def test_office_math_becomes_latex(tmp_path, omml, latex):
+    docx = write_docx(tmp_path / "math.docx",
+                      f'<w:p><w:r><w:t xml:space="preserve">其中 </w:t></w:r><m:oMath>{omml}</m:oMath></w:p>')
+
+    result = extract_docx(docx, str(tmp_path))
+
+    assert result["text_with_images"] == f"其中 [FORMULA: {latex} :END_FORMULA]\n"
+    assert result["equation_count"] == 1
+
+
+def test_toc_paragraphs_are_dropped_unless_kept(tmp_path):
+    docx = write_docx(tmp_path / "toc.docx",
+                      paragraph("目录"), paragraph("第一章 绪论\t1", "TOC1"), paragraph("参考文献\tIV", "TOC1"),
+                      paragraph("第一章 绪论", "Heading1"))
+
+    dropped = extract_docx(docx, str(tmp_path))
+    kept = extract_docx(docx, str(tmp_path), keep_boilerplate=True)
+
+    assert dropped["text_with_images"] == "目录\n第一章 绪论\n"
+    assert dropped["toc"] == kept["toc"] == [{"level": 1, "title": "第一章 绪论", "page_label": "1"},
+                                             {"level": 1, "title": "参考文献", "page_label": "IV"}]
+    assert "第一章 绪论\t1\n" in kept["text_with_images"]
+    assert dropped["outline"]["headings"] == [{"level": 1, "title": "第一章 绪论", "offset": 3}]
+
+
+def test_moved_and_deleted_text_is_left_out(tmp_path):
+    docx = write_docx(tmp_path / "revisions.docx",
+                      '<w:p><w:r><w:t xml:space="preserve">保留</w:t></w:r>'
+                      '<w:del><w:r><w:delText>删除</w:delText></w:r></w:del>'
+                      '<w:moveFrom><w:r><w:t>移出</w:t></w:r></w:moveFrom>'
+                      '<w:moveTo><w:r><w:t>移入</w:t></w:r></w:moveTo></w:p>')
+
+    result = extract_docx(docx, str(tmp_path))
+
+    assert result["text_with_images"] == "保留移入\n"
+
+
+def test_figures_in_table_cells_follow_the_table(tmp_path):
+    table = ('<w:tbl><w:tr>' + cell(picture() + paragraph("(a) 原图")) + cell(paragraph("(b) 结果"))
+             + '</w:tr></w:tbl>')
+    docx = write_docx(tmp_path / "figure_table.docx", table, picture())
+
+    result = extract_docx(docx, str(tmp_path))
+
+    assert result["tables"][0]["rows"] == [["(a) 原图", "(b) 结果"]]
+    assert result["text_with_images"] == (
+        "\n[TABLE_START]\n[TABLE_ROW:0]\n[TABLE_CELL: (a) 原图]\n[TABLE_CELL: (b) 结果]\n[TABLE_END]\n"
+        "[FIGURE:docximg1]\n[FIGURE:docximg1]\n")
+    assert result["images"][0]["occurrences"] == 2 and (tmp_path / "docximg1.png").exists()
@@ -0,0 +1,165 @@
+import json
+import os
+
+import fitz
+
+import extract_pdf
+from conftest import PARAGRAPHS
+
+
+def extract_to_bytes(pdf_path: str, output_dir: str, **options) -> tuple:
+    """Result JSON and the bytes of each written image, keyed by filename"""
+    os.makedirs(output_dir, exist_ok=True)
+    result = extract_pdf.extract_pdf_with_layout(pdf_path, output_dir, **options)
+    images = {}
+    for name in sorted(os.listdir(output_dir)):
+        with open(os.path.join(output_dir, name), 'rb') as f:
+            images[name] = f.read()
+    return json.dumps(result, ensure_ascii=False, sort_keys=True), images
+
+
+def test_parallel_output_is_identical_to_serial(thesis_pdf, tmp_path):
+    serial = extract_to_bytes(thesis_pdf, str(tmp_path / "serial"), workers=1)
+    parallel = extract_to_bytes(thesis_pdf, str(tmp_path / "parallel"), workers=4)
+
+    assert parallel == serial
+    result = json.loads(serial[0])
+    assert result["images"] and "[TABLE_START]" in result["text_with_images"]
+
+
+def failing_writer(output_dir: str, fail_names):
+    """Image writer into output_dir that raises for filenames fail_names(filename) selects"""
+    def write(filename: str, data: bytes) -> None:
+        if fail_names(filename):
+            raise OSError(f"cannot write {filename}")
+        with open(os.path.join(output_dir, filename), 'wb') as f:
+            f.write(data)
+    return write
+
+
+def test_image_falls_back_to_original_bytes_when_normalized_write_fails(thesis_pdf, tmp_path):
+    # Each image's first write (the normalized copy, from the pool) fails
+    attempted = set()
+
+    def fail_first(name: str) -> bool:
+        first = name not in attempted
+        attempted.add(name)
+        return first
+
+    writer = failing_writer(str(tmp_path), fail_first)
+    result = extract_pdf.extract_pdf_with_layout(thesis_pdf, str(tmp_path), normalize_images=True,
+                                                 image_writer=writer)
+
+    assert result["images"]
+    assert "extraction_failed" not in result["text_with_images"]
+    for image in result["images"]:
+        assert os.path.exists(tmp_path / image["filename"])
+        assert f"[FIGURE:{image['id']}]" in result["text_with_images"]
+
+
+def test_unwritable_image_marker_is_flagged_as_failed(thesis_pdf, tmp_path):
+    writer = failing_writer(str(tmp_path), lambda name: name.startswith("pdfimg1."))
+    result = extract_pdf.extract_pdf_with_layout(thesis_pdf, str(tmp_path), normalize_images=True,
+                                                 image_writer=writer)
+
+    assert all(image["id"] != "pdfimg1" for image in result["images"])
+    assert "[FIGURE:pdfimg1]" not in result["text_with_images"]
+    assert "[FIGURE:pdfimg1:extraction_failed]" in result["text_with_images"]
+
+
+def figure_ids(result: dict) -> list:
+    return [line for line in result["text_with_images"].split("\n") if line.startswith("[FIGURE:")]
+
+
+def test_deferred_images_are_deduplicated_like_eager_ones(copied_image_pdf, tmp_path):
+    os.makedirs(tmp_path / "eager")
+    os.makedirs(tmp_path / "deferred")
+    eager = extract_pdf.extract_pdf_with_layout(copied_image_pdf, str(tmp_path / "eager"))
+    deferred = extract_pdf.extract_pdf_with_layout(copied_image_pdf, str(tmp_path / "deferred"),
+                                                   defer_images=True)
+
+    xrefs = {image["xref"] for image in deferred["images"]}
+    assert figure_ids(deferred) == figure_ids(eager) == [
+        "[FIGURE:pdfimg1]", "[FIGURE:pdfimg1]", "[FIGURE:pdfimg2]"]
+    assert deferred["duplicate_images"] == eager["duplicate_images"] == 1
+    assert len(xrefs) == 2
+
+
+def test_roman_page_numbers_need_a_numbered_facing_page(page_number_pdf, tmp_path):
+    result = extract_pdf.extract_pdf_with_layout(page_number_pdf, str(tmp_path))
+    lines = result["text_with_images"].split("\n")
+
+    for page_number in ("- i -", "- ii -", "- iii -", "1", "2"):
+        assert page_number not in lines
+    assert "CD" in lines and "I" in lines
+    assert result["headers_footers"]["removed_lines"] == 5
+
+
+def test_page_numbers_above_the_margin_band_are_dropped(raised_footer_pdf, tmp_path):
+    page = fitz.open(raised_footer_pdf)[0]
+    assert page.search_for("1")[-1].y0 < page.rect.height * (1 - extract_pdf.MARGIN_BAND)
+
+    result = extract_pdf.extract_pdf_with_layout(raised_footer_pdf, str(tmp_path))
+    lines = result["text_with_images"].split("\n")
+
+    assert not any(line in lines for line in ("1", "2", "3", "4"))
+    assert "Body text of page 1, line 1." in result["text_with_images"]
+    assert "Body text of page 4, line 48." in result["text_with_images"]
+    assert result["headers_footers"]["removed_lines"] == 4
+
+
+def test_reflow_joins_single_line_blocks(line_blocks_pdf, tmp_path):
+    blocks = fitz.open(line_blocks_pdf)[0].get_text("dict")["blocks"]
+    assert len(blocks) > len(PARAGRAPHS) and all(len(block["lines"]) == 1 for block in blocks)
+
+    result = extract_pdf.extract_pdf_with_layout(line_blocks_pdf, str(tmp_path))
+    unflowed = extract_pdf.extract_pdf_with_layout(line_blocks_pdf, str(tmp_path), reflow=False)
+
+    assert result["text_with_images"].split("\n")[:2] == PARAGRAPHS
+    assert PARAGRAPHS[1] not in unflowed["text_with_images"]
+
+
+def test_reflow_joins_lines_stopping_short_of_the_column_edge(short_line_blocks_pdf, tmp_path):
+    lines = [block["lines"][0] for block in fitz.open(short_line_blocks_pdf)[0].get_text("dict")["blocks"]]
+    column_edge = max(line["bbox"][2] for line in lines)
+    wrapped = lines[-2]
+    height = wrapped["bbox"][3] - wrapped["bbox"][1]
+    assert height / 2 < column_edge - wrapped["bbox"][2] < wrapped["spans"][0]["size"]
+
+    result = extract_pdf.extract_pdf_with_layout(short_line_blocks_pdf, str(tmp_path))
+
+    assert result["text_with_images"].split("\n")[:2] == PARAGRAPHS
+
+
+def test_light_hei_faces_are_not_bold():
+    def line(font, text, flags=0):
+        return {"spans": [{"font": font, "text": text, "size": 12, "flags": flags}]}
+
+    body = [line("JABTKF+STHeitiSC-Light", "本文提出一种基于注意力的方法")]
+    assert extract_pdf.heading_style(body, "本文提出一种基于注意力的方法")["bold"] is False
+    assert extract_pdf._line_style(body[0]) == (12, False)
+
+    for font in ("XMEGEX+STHeitiSC-Medium", "SimHei", "黑体", "LMRoman12-Bold"):
+        assert extract_pdf._line_style(line(font, "第一章 绪论")) == (12, True)
+    # so a CJK body line has the same style as a Latin one and reflow can join them
+    assert extract_pdf._line_style(body[0]) == extract_pdf._line_style(line("LMRoman10-Regular", "Transformer"))
+
+
+def test_table_detection_only_runs_on_pages_with_ruled_areas(thesis_pdf, tmp_path, monkeypatch):
+    full = extract_pdf.extract_pdf_with_layout(thesis_pdf, str(tmp_path), full_table_detection=True)
+    detected = []
+    extract_tables = extract_pdf.extract_tables_with_pymupdf
+
+    def recording_extract_tables(page):
+        detected.append(page.number + 1)
+        return extract_tables(page)
+    monkeypatch.setattr(extract_pdf, "extract_tables_with_pymupdf", recording_extract_tables)
+    prefiltered = extract_pdf.extract_pdf_with_layout(thesis_pdf, str(tmp_path))
+
+    # Only the pages with a ruled table (2, 6, 10) have drawings at all
+    assert detected == [2, 6, 10]
+    native_row = "[TABLE_ROW:2]\n[TABLE_CELL: ImageNet]\n[TABLE_CELL: 1,000]\n[TABLE_CELL: 1,281,167]\n"
+    assert prefiltered["text_with_images"].count(native_row) == 3
+    assert prefiltered["text_with_images"] == full["text_with_images"]
+    with fitz.open(thesis_pdf) as doc:
+        assert not doc[0].get_cdrawings() and doc[1].get_cdrawings()
@@ -0,0 +1,116 @@
+import json
+import os
+
+import fitz
+
+import extract_pdf
+from conftest import CJK_FONT
+from extraction_cache import ExtractionCache
+
+
+def output_files(output_dir) -> dict:
+    """Bytes of each file in an output directory, keyed by filename"""
+    files = {}
+    for name in sorted(os.listdir(output_dir)):
+        with open(os.path.join(output_dir, name), 'rb') as f:
+            files[name] = f.read()
+    return files
+
+
+def put_entry(cache: ExtractionCache, key: str, text: str, mtime: float) -> None:
+    cache.put(key, {"text_with_images": text, "images": []}, "")
+    os.utime(os.path.join(cache.cache_dir, key), (mtime, mtime))
+
+
+def test_cache_hit_is_identical_to_a_fresh_extraction(thesis_pdf, tmp_path, monkeypatch):
+    cache_dir = str(tmp_path / "cache")
+    outputs = [tmp_path / name for name in ("fresh", "miss", "hit")]
+    for output in outputs:
+        os.makedirs(output)
+    fresh = extract_pdf.extract_pdf_with_layout(thesis_pdf, str(outputs[0]))
+    miss = extract_pdf.extract_pdf_cached(thesis_pdf, str(outputs[1]), cache_dir)
+
+    def no_extraction(*args, **kwargs):
+        raise AssertionError("cache hit ran an extraction")
+    monkeypatch.setattr(extract_pdf, "extract_pdf_with_layout", no_extraction)
+    hit = extract_pdf.extract_pdf_cached(thesis_pdf, str(outputs[2]), cache_dir)
+
+    assert json.dumps(hit, sort_keys=True) == json.dumps(miss, sort_keys=True) == json.dumps(fresh, sort_keys=True)
+    assert output_files(outputs[2]) == output_files(outputs[1]) == output_files(outputs[0])
+    assert len(output_files(outputs[2])) == len(fresh["images"]) > 0
+
+
+def test_key_changes_with_content_version_and_options(tmp_path):
+    cache = ExtractionCache(str(tmp_path))
+    key = cache.key_for(b"%PDF-1.7 a", "13", {"reflow": True})
+
+    assert cache.key_for(b"%PDF-1.7 a", "13", {"reflow": True}) == key
+    assert cache.key_for(b"%PDF-1.7 b", "13", {"reflow": True}) != key
+    assert cache.key_for(b"%PDF-1.7 a", "14", {"reflow": True}) != key
+    assert cache.key_for(b"%PDF-1.7 a", "13", {"reflow": False}) != key
+    assert cache.key_for(b"%PDF-1.7 a", "13", {"reflow": True, "pages": "1-3"}) != key
+
+
+def test_concurrent_writer_publishes_whole_entries_by_rename(tmp_path):
+    cache_dir = str(tmp_path / "cache")
+    first, second = ExtractionCache(cache_dir), ExtractionCache(cache_dir)
+    seen_while_writing = []
+
+    def racing_write(images_dir):
+        # While this writer builds its entry, readers miss and the other writer publishes
+        seen_while_writing.append(first.get("key", str(tmp_path)))
+        first.put("key", {"text_with_images": "first", "images": []}, "")
+        return {"text_with_images": "second", "images": []}
+
+    second._publish("key", racing_write)
+
+    assert seen_while_writing == [None]
+    assert first.get("key", str(tmp_path)) == {"text_with_images": "first", "images": []}
+    assert [name for name in os.listdir(cache_dir) if name != ".lock"] == ["key"]
+
+
+def test_least_recently_used_entries_are_evicted_over_the_size_cap(tmp_path):
+    probe = ExtractionCache(str(tmp_path / "probe"))
+    put_entry(probe, "probe", "x" * 1000, 0)
+    entry_size = os.path.getsize(tmp_path / "probe" / "probe" / "result.json")
+    cache = ExtractionCache(str(tmp_path / "cache"), max_bytes=3 * entry_size)
+
+    for age, key in enumerate(["oldest", "older", "old"]):
+        put_entry(cache, key, "x" * 1000, 1000 + age)
+    assert cache.get("oldest", str(tmp_path)) is not None  # now the most recently used
+    put_entry(cache, "new", "x" * 1000, 2000)
+
+    entries = sorted(name for name in os.listdir(tmp_path / "cache") if not name.startswith('.'))
+    assert entries == ["new", "old", "oldest"]
+
+
+def test_page_store_re_extracts_only_the_changed_page(thesis_pdf, tmp_path, monkeypatch):
+    edited_pdf = str(tmp_path / "edited.pdf")
+    doc = fitz.open(thesis_pdf)
+    doc[5].insert_text((72, 720), "第6页修改后新增的一行正文。", fontname=CJK_FONT, fontsize=11)
+    # A full rewrite renumbers the objects of the unchanged pages too
+    doc.save(edited_pdf, garbage=4)
+    doc.close()
+    store_dir = str(tmp_path / "store")
+    outputs = [tmp_path / name for name in ("first", "incremental", "plain")]
+    for output in outputs:
+        os.makedirs(output)
+
+    first = extract_pdf.extract_pdf_incremental(thesis_pdf, str(outputs[0]), store_dir)
+    extracted = []
+    extract_page_content = extract_pdf.extract_page_content
+
+    def recording_extract(doc, page_num, *args, **kwargs):
+        extracted.append(page_num + 1)
+        return extract_page_content(doc, page_num, *args, **kwargs)
+    monkeypatch.setattr(extract_pdf, "extract_page_content", recording_extract)
+    incremental = extract_pdf.extract_pdf_incremental(edited_pdf, str(outputs[1]), store_dir)
+    monkeypatch.undo()
+    plain = extract_pdf.extract_pdf_with_layout(edited_pdf, str(outputs[2]))
+
+    assert first["changed_pages"] == list(range(1, 13))
+    assert incremental.pop("changed_pages") == [6]
+    assert extracted == [6]
+    assert "第6页修改后新增的一行正文。" in plain["text_with_images"]
+    assert json.dumps(incremental, sort_keys=True) == json.dumps(plain, sort_keys=True)
+    assert output_files(outputs[1]) == output_files(outputs[2])
@@ -0,0 +1,55 @@
+import fitz
+
+from extract_pdf import ImageBBoxIndex
+
+PAGE = fitz.Rect(0, 0, 595, 842)
+
+
+def infos(*bboxes) -> list:
+    return [{"xref": n + 1, "bbox": bbox} for n, bbox in enumerate(bboxes)]
+
+
+def test_adjacent_subfigures_each_get_their_own_image():
+    # 2x2 figure of touching tiles sharing edges and row/column centers
+    tiles = [(72, 100, 222, 200), (222, 100, 372, 200), (72, 200, 222, 300), (222, 200, 372, 300)]
+    index = ImageBBoxIndex(infos(*tiles), PAGE)
+
+    matched = [index.match(tile)["xref"] for tile in reversed(tiles)]
+
+    assert matched == [4, 3, 2, 1]
+
+
+def test_caption_between_subfigures_does_not_shift_matches():
+    # (a) above its caption, (b) below it; block bboxes are slightly off the
+    # image bboxes, as for clipped images
+    top, bottom = (100, 100, 300, 250), (100, 280, 300, 430)
+    index = ImageBBoxIndex(infos(bottom, top), PAGE)
+
+    assert index.match((101, 102, 299, 248))["bbox"] == top
+    assert index.match((101, 282, 299, 428))["bbox"] == bottom
+
+
+def test_exact_image_wins_over_containing_background():
+    background, inset = (50, 50, 545, 500), (100, 100, 200, 200)
+    index = ImageBBoxIndex(infos(background, inset), PAGE)
+
+    assert index.match(inset)["bbox"] == inset
+    assert index.match(background)["bbox"] == background
+
+
+def test_containing_image_wins_over_partial_overlap():
+    block = (100, 100, 200, 200)
+    containing, neighbour = (95, 95, 205, 205), (160, 100, 260, 200)
+    index = ImageBBoxIndex(infos(neighbour, containing), PAGE)
+
+    assert index.match(block)["bbox"] == containing
+    assert index.match(block)["bbox"] == neighbour
+
+
+def test_non_overlapping_block_falls_back_to_center_distance():
+    index = ImageBBoxIndex(infos((100, 100, 200, 120)), PAGE)
+
+    assert index.match((400, 400, 500, 500)) is None
+    assert index.match((100, 160, 200, 180)) is None
+    assert index.match((100, 125, 200, 145))["xref"] == 1
+    assert index.match((100, 125, 200, 145)) is None
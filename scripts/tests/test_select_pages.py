@@ -0,0 +1,54 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+import extract_pdf
+from extract_pdf import select_pages
+
+SCRIPT = os.path.join(os.path.dirname(extract_pdf.__file__), "extract_pdf.py")
+
+
+def test_ranges_are_merged_deduplicated_and_clipped():
+    assert select_pages("", 5) == [0, 1, 2, 3, 4]
+    assert select_pages("3, 1-2, 2, 3-", 5) == [0, 1, 2, 3, 4]
+    assert select_pages("4-9", 5) == [3, 4]
+    assert select_pages("5-5", 5) == [4]
+
+
+@pytest.mark.parametrize("pages, message", [
+    ("5-3", "Invalid page range: '5-3'"),
+    ("0", "Invalid page range: '0'"),
+    ("0-2", "Invalid page range: '0-2'"),
+    ("6-9", "No pages in range '6-9' (document has 5 pages)"),
+    ("2,a", "Invalid page range: 'a'"),
+    ("1-2-3", "Invalid page range: '1-2-3'"),
+    ("1,,2", "Invalid page range: ''"),
+    ("-3", "Invalid page range: '-3'"),
+])
+def test_invalid_ranges_are_rejected(pages, message):
+    with pytest.raises(ValueError) as error:
+        select_pages(pages, 5)
+    assert str(error.value) == message
+
+
+def test_probe_reports_the_selected_pages(thesis_pdf):
+    completed = subprocess.run([sys.executable, SCRIPT, thesis_pdf, "--probe", "--pages", "2-4"],
+                               capture_output=True, text=True, timeout=60, check=True)
+    probe = json.loads(completed.stdout)
+
+    assert probe["page_count"] == 12 and probe["has_outline"] is False
+    assert [(page["page"], page["images"], page["text_layer"]) for page in probe["pages"]] == [
+        (2, 1, True), (3, 1, True), (4, 2, True)]
+    assert probe["char_count"] == sum(page["chars"] for page in probe["pages"]) > 0
+    assert probe["image_count"] == 4 and probe["pages_without_text"] == []
+
+
+def test_probe_fails_on_an_invalid_range(thesis_pdf):
+    completed = subprocess.run([sys.executable, SCRIPT, thesis_pdf, "--probe", "--pages", "13-"],
+                               capture_output=True, text=True, timeout=60)
+
+    assert completed.returncode == 1
+    assert completed.stderr.strip() == "Error: No pages in range '13-' (document has 12 pages)"
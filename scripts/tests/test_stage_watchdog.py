@@ -0,0 +1,45 @@
+import signal
+import time
+
+import pytest
+
+from extract_pdf import StageTimeout, StageWatchdog
+
+
+def busy(seconds: float) -> None:
+    # Python code, so the alarm interrupts it
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+
+def test_stage_over_budget_is_interrupted_and_alarm_restored():
+    previous = signal.getsignal(signal.SIGALRM)
+    watchdog = StageWatchdog({"tables": 0.05})
+
+    with pytest.raises(StageTimeout) as timeout:
+        with watchdog.stage("tables"):
+            busy(2.0)
+
+    assert timeout.value.stage == "tables" and timeout.value.elapsed < 1.0
+    assert signal.getitimer(signal.ITIMER_REAL) == (0.0, 0.0)
+    assert signal.getsignal(signal.SIGALRM) is previous
+
+
+def test_time_accumulates_over_stage_runs():
+    watchdog = StageWatchdog({"figures": 0.2})
+    for _ in range(3):
+        with watchdog.stage("figures"):
+            busy(0.05)
+
+    with pytest.raises(StageTimeout):
+        with watchdog.stage("figures"):
+            busy(0.2)
+    assert signal.getitimer(signal.ITIMER_REAL) == (0.0, 0.0)
+
+
+def test_stage_without_budget_is_not_timed():
+    watchdog = StageWatchdog({"layout": 0})
+    with watchdog.stage("layout"):
+        busy(0.01)
+    assert watchdog.spent["layout"] == 0
@@ -0,0 +1,45 @@
+import json
+import os
+
+import pytest
+
+from token_budget import TokenEstimator, plan_chunks
+
+# Cases shared with src/llm/token-estimator.spec.ts, so both estimators give the same counts
+TEST_FILES = os.path.join(os.path.dirname(__file__), "..", "..", "test-files")
+with open(os.path.join(TEST_FILES, "token-estimates.json"), encoding='utf-8') as f:
+    SHARED_ESTIMATES = json.load(f)
+
+
+def test_features_do_not_count_separators_as_text():
+    features = TokenEstimator.features("摘　要\n3×4÷2")
+
+    assert features["cjk"] == 2
+    assert features["words"] == 0
+    assert features["symbols"] == 2
+    assert min(features.values()) >= 0
+
+
+def test_plan_cuts_at_headings_within_budget():
+    sections = ["第1章 绪论\n" + "研究背景。" * 200 + "\n", "第2章 方法\n" + "实验设计。" * 200 + "\n"]
+    text = "".join(sections)
+    headings = [{"level": 1, "title": "第1章 绪论", "offset": 0},
+                {"level": 1, "title": "第2章 方法", "offset": len(sections[0])}]
+    budget = TokenEstimator().count(sections[0]) + 50
+
+    plan = plan_chunks(text, headings, budget)
+
+    assert [(c["start"], c["title"]) for c in plan["chunks"]] == [(0, "第1章 绪论"), (len(sections[0]), "第2章 方法")]
+    assert plan["chunks"][-1]["end"] == len(text)
+    assert not any(c["oversized"] for c in plan["chunks"])
+
+
+@pytest.mark.parametrize("case", SHARED_ESTIMATES)
+def test_counts_match_the_shared_estimates(case):
+    if "file" in case:
+        with open(os.path.join(TEST_FILES, case["file"]), encoding='utf-8') as f:
+            text = f.read()
+    else:
+        text = case["text"]
+
+    assert TokenEstimator().count(text) == case["tokens"]
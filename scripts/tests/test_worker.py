@@ -0,0 +1,37 @@
+import json
+import os
+import subprocess
+import sys
+
+import extract_pdf
+
+WORKER = os.path.join(os.path.dirname(extract_pdf.__file__), "worker.py")
+
+
+def serve(*requests) -> list:
+    """Response and progress lines of a stdio worker given requests"""
+    lines = "".join(json.dumps(request) + "\n" for request in requests)
+    output = subprocess.run([sys.executable, WORKER, "--workers", "2"], input=lines,
+                            capture_output=True, text=True, timeout=120, check=True).stdout
+    return [json.loads(line) for line in output.splitlines()]
+
+
+def test_requests_are_answered_with_progress_before_the_response(thesis_pdf, tmp_path):
+    messages = serve(
+        {"id": "ping", "op": "ping"},
+        {"id": "pdf", "op": "extract_pdf", "args": {"pdf_path": thesis_pdf, "output_dir": str(tmp_path)}},
+        {"id": "bad", "op": "render"},
+    )
+
+    responses = {message["id"]: message for message in messages if "ok" in message}
+    assert responses["ping"]["ok"] and responses["ping"]["result"]["pid"] != os.getpid()
+    assert responses["bad"] == {"id": "bad", "ok": False, "error": "ValueError: Unknown op: render"}
+    os.makedirs(tmp_path / "direct")
+    expected = extract_pdf.extract_pdf_with_layout(thesis_pdf, str(tmp_path / "direct"))
+    assert responses["pdf"]["result"]["text_with_images"] == expected["text_with_images"]
+
+    pdf_messages = [message for message in messages if message["id"] == "pdf"]
+    stages = [message["stage"] for message in pdf_messages[:-1]]
+    assert all(message["event"] == "progress" for message in pdf_messages[:-1])
+    assert stages[0] == "open" and stages[-1] == "done" and stages.count("extract") == 12
+    assert "ok" in pdf_messages[-1]
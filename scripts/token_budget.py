@@ -0,0 +1,296 @@
+#!/usr/bin/env python3
+"""
+Token estimates and heading-aligned chunk plans for extracted text.
+
+The LLM pipeline sends a long document in chunks that must fit the model's
+limits. Characters are a poor measure of that on mixed Chinese/English text:
+a CJK character is about one token, an English word about one and a third.
+TokenEstimator counts tokens from the text's character classes with per-class
+rates; plan_chunks() splits the text into blocks (paragraphs, whole tables
+and display formulas) and groups them into chunks within a token budget,
+cutting at the highest-level heading available.
+
+The default rates approximate the tokenizer of the default model (gpt-4o).
+They can be refitted from pairs of text and the token count the model
+reported for it (e.g. usage.prompt_tokens):
+
+    python token_budget.py calibrate samples.jsonl > token_rates.json
+
+where each line of samples.jsonl is {"text": "...", "tokens": 123}. The
+extractors take the resulting file with --token-rates.
+"""
+
+import re
+import sys
+import json
+import math
+import bisect
+import argparse
+
+# Matches the LLM pipeline's chunk calls, which answer with up to 16000
+# tokens and reproduce their input: larger chunks get truncated and retried
+DEFAULT_TOKEN_BUDGET = 12000
+
+# Tokens per feature (see TokenEstimator.features)
+DEFAULT_RATES = {
+    "cjk": 0.8,        # CJK ideographs, kana, hangul and full-width punctuation
+    "words": 0.6,      # runs of Latin letters ...
+    "letters": 0.12,   # ... plus their length, long words split into more tokens
+    "digits": 1.0,     # groups of up to three digits
+    "symbols": 0.8,    # other non-space characters (ASCII punctuation, math, markers)
+    "newlines": 1.0,   # runs of line breaks
+}
+
+# A chunk cut at a heading must hold at least this share of the budget;
+# otherwise the chunk is filled up and cut between paragraphs
+MIN_CHUNK_FILL = 0.5
+
+# CJK ideographs, kana, hangul, CJK and full-width punctuation; not the
+# ideographic space U+3000, which counts as whitespace (see symbols)
+CJK_PATTERN = re.compile(
+    '[\u1100-\u11ff\u2e80-\u2fdf\u3001-\u30ff\u3100-\u31ff\u3400-\u4dbf\u4e00-\u9fff'
+    '\ua960-\ua97f\uac00-\ud7ff\uf900-\ufaff\ufe30-\ufe4f\uff00-\uffef\U00020000-\U0003134f]'
+)
+# Latin letters, without the × and ÷ signs in Latin-1
+WORD_PATTERN = re.compile('[A-Za-z\u00c0-\u00d6\u00d8-\u00f6\u00f8-\u024f]+')
+DIGITS_PATTERN = re.compile('[0-9]+')
+NEWLINES_PATTERN = re.compile(r'\n+')
+NON_SPACE_PATTERN = re.compile(r'\S')
+
+# Tables and display formulas are never split; anything else splits into lines
+BLOCK_PATTERN = re.compile(
+    r'\[TABLE_START\].*?\[TABLE_END\]|\[FORMULA_BLOCK:.*?:END_FORMULA_BLOCK\]|[^\n]+',
+    re.DOTALL
+)
+
+
+class TokenEstimator:
+    """Estimates token counts as a weighted sum of character-class features"""
+
+    def __init__(self, rates: dict = None):
+        self.rates = {**DEFAULT_RATES, **(rates or {})}
+
+    @classmethod
+    def from_file(cls, path: str) -> "TokenEstimator":
+        """Estimator with the rates of a calibration file (see calibrate())"""
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        return cls(data.get("rates", data))
+
+    @staticmethod
+    def features(text: str) -> dict:
+        cjk = len(CJK_PATTERN.findall(text))
+        words = WORD_PATTERN.findall(text)
+        letters = sum(len(word) for word in words)
+        digit_runs = DIGITS_PATTERN.findall(text)
+        digits = sum(len(run) for run in digit_runs)
+        return {
+            "cjk": cjk,
+            "words": len(words),
+            "letters": letters,
+            "digits": sum((len(run) + 2) // 3 for run in digit_runs),
+            "symbols": len(NON_SPACE_PATTERN.findall(text)) - cjk - letters - digits,
+            "newlines": len(NEWLINES_PATTERN.findall(text)),
+        }
+
+    def count(self, text: str) -> int:
+        if not text:
+            return 0
+        features = self.features(text)
+        return math.ceil(sum(self.rates[name] * value for name, value in features.items()))
+
+
+def calibrate(samples: list, iterations: int = 500) -> dict:
+    """
+    Fit the estimator rates to (text, tokens) samples by non-negative least
+    squares. Rates of features that none of the samples contain keep their
+    default.
+
+    Returns:
+        {"rates", "samples", "mean_abs_error"} where mean_abs_error is the
+        mean relative error of the fitted estimator on the samples
+    """
+    names = list(DEFAULT_RATES)
+    rows = [[TokenEstimator.features(text)[name] for name in names] for text, _ in samples]
+    targets = [tokens for _, tokens in samples]
+    rates = [DEFAULT_RATES[name] for name in names]
+    norms = [sum(row[j] * row[j] for row in rows) for j in range(len(names))]
+
+    # Projected coordinate descent: exact for each rate given the others
+    residuals = [t - sum(r * x for r, x in zip(rates, row)) for row, t in zip(rows, targets)]
+    for _ in range(iterations):
+        for j, norm in enumerate(norms):
+            if not norm:
+                continue
+            step = sum(row[j] * res for row, res in zip(rows, residuals)) / norm
+            new_rate = max(0.0, rates[j] + step)
+            delta = new_rate - rates[j]
+            if delta:
+                rates[j] = new_rate
+                residuals = [res - delta * row[j] for row, res in zip(rows, residuals)]
+
+    errors = [abs(res) / t for res, t in zip(residuals, targets) if t]
+    return {
+        "rates": {name: round(rate, 4) for name, rate in zip(names, rates)},
+        "samples": len(samples),
+        "mean_abs_error": round(sum(errors) / len(errors), 4) if errors else None
+    }
+
+
+def split_blocks(text: str, estimator: TokenEstimator) -> list:
+    """Blocks of text ({"start", "end", "tokens"}) in text order"""
+    return [
+        {"start": m.start(), "end": m.end(), "tokens": estimator.count(m.group())}
+        for m in BLOCK_PATTERN.finditer(text)
+        if m.group().strip()
+    ]
+
+
+def plan_chunks(text: str, headings: list = None, budget: int = DEFAULT_TOKEN_BUDGET,
+                estimator: TokenEstimator = None) -> dict:
+    """
+    Token estimates per block and a chunk plan for text.
+
+    headings are outline entries ({"level", "title", "offset"}, e.g. the
+    extractor's outline["headings"]); a block holding a heading's offset
+    starts that heading's section. Chunks are cut before headings, preferring
+    the highest-level one that leaves the chunk at least MIN_CHUNK_FILL of the
+    budget full. A section that does not fit in the budget is cut between
+    paragraphs ("continued" on the following chunks); a single block over
+    the budget becomes a chunk of its own ("oversized").
+
+    Returns:
+        {"budget", "total_tokens", "rates", "blocks": [{"start", "end",
+        "tokens"} plus "level" for heading blocks], "chunks": [{"start",
+        "end", "tokens", "title", "level", "continued", "oversized"}]}
+        where chunk offsets cover the whole text and title/level are those
+        of the section the chunk starts in (None before the first heading)
+    """
+    estimator = estimator or TokenEstimator()
+    blocks = split_blocks(text, estimator)
+    starts = [block["start"] for block in blocks]
+
+    # Heading of each block that starts a section
+    block_headings = {}
+    for heading in headings or []:
+        offset = heading.get("offset")
+        if offset is None:
+            continue
+        index = bisect.bisect_right(starts, offset) - 1
+        if index >= 0 and offset < blocks[index]["end"]:
+            current = block_headings.get(index)
+            if current is None or heading["level"] < current["level"]:
+                block_headings[index] = heading
+    for index, heading in block_headings.items():
+        blocks[index]["level"] = heading["level"]
+
+    # Section heading in effect at each block
+    section_of = []
+    section = None
+    for index in range(len(blocks)):
+        section = block_headings.get(index, section)
+        section_of.append(section)
+
+    prefix = [0]
+    for block in blocks:
+        prefix.append(prefix[-1] + block["tokens"])
+
+    def best_cut(first: int, limit: int) -> int:
+        """Block index to start the next chunk at, for a chunk from first that overflows at limit"""
+        best = None
+        for index in range(first + 1, limit + 1):
+            heading = block_headings.get(index)
+            if heading is None or prefix[index] - prefix[first] < budget * MIN_CHUNK_FILL:
+                continue
+            if best is None or heading["level"] <= block_headings[best]["level"]:
+                best = index
+        return best if best is not None else limit
+
+    cuts = [0]
+    first = 0
+    for index in range(len(blocks)):
+        while prefix[index + 1] - prefix[first] > budget and index > first:
+            first = best_cut(first, index)
+            cuts.append(first)
+    cuts.append(len(blocks))
+
+    chunks = []
+    for n, (first, end) in enumerate(zip(cuts, cuts[1:])):
+        if first == end:
+            continue
+        section = section_of[first]
+        tokens = prefix[end] - prefix[first]
+        chunks.append({
+            "start": 0 if n == 0 else blocks[first]["start"],
+            "end": blocks[end]["start"] if end < len(blocks) else len(text),
+            "tokens": tokens,
+            "title": section["title"] if section else None,
+            "level": section["level"] if section else None,
+            "continued": first not in block_headings and section is not None,
+            "oversized": tokens > budget
+        })
+    if not chunks and text:
+        chunks.append({"start": 0, "end": len(text), "tokens": 0, "title": None, "level": None,
+                       "continued": False, "oversized": False})
+
+    return {
+        "budget": budget,
+        "total_tokens": prefix[-1],
+        "rates": estimator.rates,
+        "blocks": blocks,
+        "chunks": chunks
+    }
+
+
+def read_samples(lines) -> list:
+    """(text, tokens) pairs of a JSON-lines calibration file"""
+    samples = []
+    for number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+            samples.append((record["text"], int(record["tokens"])))
+        except (ValueError, KeyError, TypeError) as e:
+            raise ValueError(f"Invalid sample on line {number}: {e}") from None
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Token estimates and chunk plans for extracted text')
+    commands = parser.add_subparsers(dest='command', required=True)
+    calibrate_parser = commands.add_parser(
+        'calibrate', help='Fit estimator rates to JSON-lines {"text", "tokens"} samples')
+    calibrate_parser.add_argument('samples', help='Samples file, or - for stdin')
+    plan_parser = commands.add_parser('plan', help='Print the chunk plan of an extraction result')
+    plan_parser.add_argument('result', help='result JSON of extract_pdf.py or extract_docx.py')
+    plan_parser.add_argument('--token-budget', type=int, default=DEFAULT_TOKEN_BUDGET,
+                             help=f'Tokens per chunk (default: {DEFAULT_TOKEN_BUDGET})')
+    plan_parser.add_argument('--token-rates', metavar='FILE',
+                             help='Estimator rates written by the calibrate command')
+    args = parser.parse_args()
+
+    try:
+        if args.command == 'calibrate':
+            if args.samples == '-':
+                samples = read_samples(sys.stdin)
+            else:
+                with open(args.samples, 'r', encoding='utf-8') as f:
+                    samples = read_samples(f)
+            if not samples:
+                raise ValueError("No samples")
+            print(json.dumps(calibrate(samples), indent=2))
+        else:
+            with open(args.result, 'r', encoding='utf-8') as f:
+                result = json.load(f)
+            estimator = TokenEstimator.from_file(args.token_rates) if args.token_rates else None
+            plan = plan_chunks(result["text_with_images"], result.get("outline", {}).get("headings"),
+                               args.token_budget, estimator)
+            print(json.dumps({k: v for k, v in plan.items() if k != "blocks"}, ensure_ascii=False, indent=2))
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
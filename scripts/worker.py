@@ -0,0 +1,413 @@
+#!/usr/bin/env python3
+"""
+Long-lived worker for the thesis formatter Python scripts.
+
+Imports extract_pdf, extract_docx, generate_docx and modify_cover_pdf (and with
+them fitz and python-docx) once, then serves newline-delimited JSON requests so callers do not
+pay interpreter start-up and module import cost for every document.
+
+Usage:
+    python worker.py [--workers N]                  # requests on stdin, responses on stdout
+    python worker.py --socket /tmp/thesis-worker.sock [--workers N]
+
+Request:  {"id": "42", "op": "extract_pdf", "args": {"pdf_path": "...", "output_dir": "..."}}
+Progress: {"id": "42", "event": "progress", "stage": "extract", "elapsed_ms": 412, ...}
+Response: {"id": "42", "ok": true, "result": {...}, "elapsed_ms": 12.3}
+          {"id": "42", "ok": false, "error": "..."}
+
+Progress lines (see progress.ProgressReporter) come from the extract_pdf,
+extract_docx and generate_docx ops while they run; none follow the response.
+
+Supported ops: ping, probe_pdf, extract_pdf, extract_docx, materialize_images, generate_docx,
+               modify_cover_pdf
+"""
+
+import sys
+import os
+import json
+import time
+import argparse
+import itertools
+import contextlib
+import socketserver
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import extract_pdf
+import extract_docx
+import generate_docx
+import modify_cover_pdf
+from progress import ProgressReporter
+
+# Imported once by the fork server, so that pool processes start with them loaded
+PRELOADED_MODULES = ["extract_pdf", "extract_docx", "generate_docx", "modify_cover_pdf"]
+
+
+def op_ping(args: dict, progress: ProgressReporter) -> dict:
+    return {"pid": os.getpid()}
+
+
+def op_probe_pdf(args: dict, progress: ProgressReporter) -> dict:
+    pdf_path = args["pdf_path"]
+    if not os.path.exists(pdf_path):
+        raise FileNotFoundError(f"PDF file not found: {pdf_path}")
+    return extract_pdf.probe_pdf(pdf_path, args.get("pages"))
+
+
+def op_extract_pdf(args: dict, progress: ProgressReporter) -> dict:
+    pdf_path = args["pdf_path"]
+    output_dir = args["output_dir"]
+    if not os.path.exists(pdf_path):
+        raise FileNotFoundError(f"PDF file not found: {pdf_path}")
+    os.makedirs(output_dir, exist_ok=True)
+    options = {
+        "workers": args.get("workers", 1),
+        "full_table_detection": args.get("full_table_detection", False),
+    }
+    options.update(image_options(args))
+    if args.get("defer_images"):
+        options["defer_images"] = True
+    if args.get("pages"):
+        options["pages"] = args["pages"]
+    if args.get("keep_headers_footers"):
+        options["keep_headers_footers"] = True
+    if args.get("reflow") is False:
+        options["reflow"] = False
+    if args.get("keep_boilerplate"):
+        options["keep_boilerplate"] = True
+    if args.get("stage_budgets"):
+        options["stage_budgets"] = extract_pdf.parse_stage_budgets(
+            f"{stage}={seconds}" for stage, seconds in args["stage_budgets"].items()
+        )
+    options.update(token_options(args))
+    return extract_pdf.extract_document(
+        pdf_path, output_dir, progress=progress,
+        cache_dir=args.get("cache_dir"), cache_max_mb=args.get("cache_max_mb", 1024),
+        page_store=args.get("page_store"), page_store_max_mb=args.get("page_store_max_mb", 1024),
+        **options
+    )
+
+
+def op_extract_docx(args: dict, progress: ProgressReporter) -> dict:
+    docx_path = args["docx_path"]
+    output_dir = args["output_dir"]
+    if not os.path.exists(docx_path):
+        raise FileNotFoundError(f"DOCX file not found: {docx_path}")
+    os.makedirs(output_dir, exist_ok=True)
+    return extract_docx.extract_docx(
+        docx_path, output_dir, keep_boilerplate=args.get("keep_boilerplate", False),
+        progress=progress, **token_options(args)
+    )
+
+
+def op_materialize_images(args: dict, progress: ProgressReporter) -> dict:
+    pdf_path = args["pdf_path"]
+    output_dir = args["output_dir"]
+    if not os.path.exists(pdf_path):
+        raise FileNotFoundError(f"PDF file not found: {pdf_path}")
+    os.makedirs(output_dir, exist_ok=True)
+    return extract_pdf.materialize_images(pdf_path, output_dir, args["images"], **image_options(args))
+
+
+def image_options(args: dict) -> dict:
+    """Image normalization options of an extract_pdf/materialize_images request"""
+    if not args.get("normalize_images"):
+        return {}
+    options = {"normalize_images": True}
+    for key in ("image_max_side", "image_max_dpi"):
+        if key in args:
+            options[key] = args[key]
+    return options
+
+
+def token_options(args: dict) -> dict:
+    """Chunk plan options of an extract_pdf/extract_docx request (see token_budget)"""
+    return {key: args[key] for key in ("token_budget", "token_rates") if key in args}
+
+
+def op_generate_docx(args: dict, progress: ProgressReporter) -> dict:
+    data = args.get("data")
+    if data is None:
+        with open(args["input"], 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    output = generate_docx.generate_thesis_docx(
+        data,
+        args["output"],
+        images_dir=args.get("images_dir"),
+        template_path=args.get("template"),
+        progress=progress
+    )
+    return {"output": output}
+
+
+def op_modify_cover_pdf(args: dict, progress: ProgressReporter) -> dict:
+    input_pdf = args["input_pdf"]
+    output_pdf = args["output_pdf"]
+    if not os.path.exists(input_pdf):
+        raise FileNotFoundError(f"Input PDF not found: {input_pdf}")
+
+    data = args.get("data")
+    if data is None:
+        with open(args["data_json"], 'r', encoding='utf-8') as f:
+            data = json.load(f)
+
+    output_dir = os.path.dirname(output_pdf)
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+
+    modifier = modify_cover_pdf.CoverPdfModifier(input_pdf, output_pdf, args.get("font_dir", "."))
+    return modifier.process(data)
+
+
+OPS = {
+    "ping": op_ping,
+    "probe_pdf": op_probe_pdf,
+    "extract_pdf": op_extract_pdf,
+    "extract_docx": op_extract_docx,
+    "materialize_images": op_materialize_images,
+    "generate_docx": op_generate_docx,
+    "modify_cover_pdf": op_modify_cover_pdf,
+}
+
+
+# Queue carrying (progress key, event line) from the pool processes to the
+# worker, set in each pool process by init_pool_process()
+progress_queue = None
+
+
+def init_pool_process(queue) -> None:
+    global progress_queue
+    progress_queue = queue
+
+
+class ProgressChannel:
+    """Text stream for a ProgressReporter that puts each line on progress_queue under key"""
+
+    def __init__(self, key: int):
+        self.key = key
+
+    def write(self, text: str) -> None:
+        progress_queue.put((self.key, text))
+
+    def flush(self) -> None:
+        pass
+
+
+def handle_request(request: dict, progress_key: int = None) -> dict:
+    """
+    Run one request inside a pool process, reporting its progress under
+    progress_key when given. Never raises.
+    """
+    request_id = request.get("id")
+    started = time.perf_counter()
+    try:
+        op = OPS.get(request.get("op"))
+        if op is None:
+            raise ValueError(f"Unknown op: {request.get('op')}")
+        progress = ProgressReporter(stream=ProgressChannel(progress_key) if progress_key is not None else None)
+        # The scripts print progress with print(); keep stdout clean for the protocol
+        with contextlib.redirect_stdout(sys.stderr):
+            result = op(request.get("args") or {}, progress)
+        return {
+            "id": request_id,
+            "ok": True,
+            "result": result,
+            "elapsed_ms": round((time.perf_counter() - started) * 1000, 1)
+        }
+    except Exception as e:
+        return {"id": request_id, "ok": False, "error": f"{type(e).__name__}: {e}"}
+
+
+class WorkerPool:
+    """
+    Pre-forked process pool that survives crashed children.
+
+    Pool processes are forked from a fork server (never from this threaded
+    process) that has PRELOADED_MODULES imported. Their progress events come
+    back over one queue and are handed to the on_progress callback of the
+    request by a forwarding thread.
+    """
+
+    def __init__(self, workers: int):
+        self.workers = workers
+        self._lock = threading.Lock()
+        self._context = multiprocessing.get_context("forkserver")
+        self._context.set_forkserver_preload(PRELOADED_MODULES)
+        self._progress_queue = self._context.SimpleQueue()
+        self._progress_keys = itertools.count()
+        self._progress_listeners = {}
+        self._executor = self._create_executor()
+        threading.Thread(target=self._forward_progress, daemon=True).start()
+
+    def _create_executor(self) -> ProcessPoolExecutor:
+        return ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=self._context,
+            initializer=init_pool_process,
+            initargs=(self._progress_queue,)
+        )
+
+    def _forward_progress(self) -> None:
+        while True:
+            key, line = self._progress_queue.get()
+            listener = self._progress_listeners.get(key)
+            if listener is not None:
+                try:
+                    listener(json.loads(line))
+                except ValueError:
+                    pass
+
+    def submit(self, request: dict, respond, on_progress=None) -> None:
+        """
+        Run request in the pool and pass the response dict to respond(), and
+        until then its progress events to on_progress().
+        """
+        request_id = request.get("id")
+        progress_key = None
+        if on_progress is not None:
+            progress_key = next(self._progress_keys)
+            self._progress_listeners[progress_key] = on_progress
+
+        def on_done(future):
+            self._progress_listeners.pop(progress_key, None)
+            try:
+                respond(future.result())
+            except BrokenProcessPool:
+                # A child died (e.g. MuPDF segfault); fail this request, start a fresh pool
+                self._restart(executor)
+                respond({"id": request_id, "ok": False, "error": "Worker process died"})
+            except Exception as e:
+                respond({"id": request_id, "ok": False, "error": f"{type(e).__name__}: {e}"})
+
+        with self._lock:
+            executor = self._executor
+            try:
+                future = executor.submit(handle_request, request, progress_key)
+            except BrokenProcessPool:
+                self._executor = executor = self._create_executor()
+                future = executor.submit(handle_request, request, progress_key)
+        future.add_done_callback(on_done)
+
+    def _restart(self, broken: ProcessPoolExecutor) -> None:
+        with self._lock:
+            if self._executor is broken:
+                self._executor = self._create_executor()
+        broken.shutdown(wait=False)
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=True)
+
+
+def parse_request(line: str):
+    """Parse one request line. Returns (request, error_response)."""
+    try:
+        request = json.loads(line)
+    except json.JSONDecodeError as e:
+        return None, {"id": None, "ok": False, "error": f"Invalid JSON: {e}"}
+    if not isinstance(request, dict):
+        return None, {"id": None, "ok": False, "error": "Request must be a JSON object"}
+    return request, None
+
+
+def serve_lines(lines, write_line, pool: WorkerPool) -> None:
+    """Dispatch request lines to the pool; returns once every response is written."""
+    pending = []
+
+    def respond(response: dict) -> None:
+        write_line(json.dumps(response, ensure_ascii=False))
+
+    for line in lines:
+        if not line.strip():
+            continue
+        request, error = parse_request(line)
+        if error:
+            respond(error)
+            continue
+        done = threading.Event()
+        pending.append(done)
+        # Keeps progress lines from following the response
+        ordering = threading.Lock()
+
+        def respond_and_signal(response, done=done, ordering=ordering):
+            with ordering:
+                try:
+                    respond(response)
+                finally:
+                    done.set()
+
+        def report(event: dict, request_id=request.get("id"), done=done, ordering=ordering) -> None:
+            with ordering:
+                if not done.is_set():
+                    respond({"id": request_id, **event})
+
+        pool.submit(request, respond_and_signal, report)
+
+    for done in pending:
+        done.wait()
+
+
+def serve_stdio(pool: WorkerPool) -> None:
+    lock = threading.Lock()
+
+    def write_line(text: str) -> None:
+        with lock:
+            sys.stdout.write(text + "\n")
+            sys.stdout.flush()
+
+    serve_lines(sys.stdin, write_line, pool)
+
+
+def serve_socket(socket_path: str, pool: WorkerPool) -> None:
+    if os.path.exists(socket_path):
+        os.unlink(socket_path)
+
+    class Handler(socketserver.StreamRequestHandler):
+        def handle(self):
+            lock = threading.Lock()
+
+            def write_line(text: str) -> None:
+                with lock:
+                    try:
+                        self.wfile.write((text + "\n").encode('utf-8'))
+                        self.wfile.flush()
+                    except OSError:
+                        pass  # Client went away
+
+            lines = (raw.decode('utf-8', errors='replace') for raw in self.rfile)
+            serve_lines(lines, write_line, pool)
+
+    class Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+        daemon_threads = True
+
+    with Server(socket_path, Handler) as server:
+        print(f"Worker listening on {socket_path}", file=sys.stderr)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            if os.path.exists(socket_path):
+                os.unlink(socket_path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Persistent worker for thesis formatter scripts')
+    parser.add_argument('--socket', help='Serve on a Unix socket instead of stdin/stdout')
+    parser.add_argument('--workers', type=int, default=min(4, os.cpu_count() or 1),
+                        help='Number of pool processes')
+    args = parser.parse_args()
+
+    pool = WorkerPool(max(1, args.workers))
+    try:
+        if args.socket:
+            serve_socket(args.socket, pool)
+        else:
+            serve_stdio(pool)
+    finally:
+        pool.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -5,6 +5,14 @@ import { execSync } from 'child_process';
 import { v4 as uuidv4 } from 'uuid';
 import * as fs from 'fs';
 import * as path from 'path';
+import { ProgressEvent, runWorkerOp, WorkerCallOptions } from './python-worker';
+import { TokenPlan } from '../llm/token-estimator';
+
+// Every page reports progress and is bounded by the extractor's stage
+// budgets, so a silence this long means the Python process is stuck
+const PDF_EXTRACTION_STALL_TIMEOUT_MS = 120000;
+// extract_docx.py reports progress every ~2% of document.xml
+const DOCX_EXTRACTION_STALL_TIMEOUT_MS = 30000;
 
 export interface ExtractedImage {
   id: string;
@@ -13,17 +21,48 @@ export interface ExtractedImage {
   contentType: string;
 }
 
+export interface TableCell {
+  row: number;
+  col: number;
+  rowspan: number;
+  colspan: number;
+  text: string;
+}
+
 export interface ExtractedTable {
   id: string;
   rows: string[][];  // 2D array of cell text
   rowCount: number;
   colCount: number;
+  cells?: TableCell[];  // merged cells with their spans (DOCX layout extraction only)
+}
+
+export interface OutlineHeading {
+  level: number;
+  title: string;
+  page?: number;  // not known for DOCX headings
+  offset: number | null;  // position of the title in text, null if not found
+}
+
+export interface DocumentOutline {
+  source: 'bookmarks' | 'fonts' | 'styles';  // PDF bookmarks, font size/weight of headings, or DOCX paragraph styles
+  headings: OutlineHeading[];
+}
+
+export interface DegradedPage {
+  page: number;
+  stage: 'layout' | 'tables' | 'figures';  // extraction stage that ran over its time budget
+  elapsed_ms: number;
+  budget_ms: number;
 }
 
 export interface ExtractionResult {
   text: string;
   images: Map<string, ExtractedImage>;
   tables: ExtractedTable[];
+  outline?: DocumentOutline;
+  degradedPages?: DegradedPage[];  // pages extracted as plain text, without tables and figures
+  tokenPlan?: TokenPlan;  // token estimates and heading-aligned chunk plan of text
 }
 
 @Injectable()
@@ -37,6 +76,56 @@ export class ExtractionService {
   }
 
   async extractContent(fileBuffer: Buffer): Promise<ExtractionResult> {
+    try {
+      return await this.extractDocxWithLayout(fileBuffer);
+    } catch (error) {
+      this.logger.warn(
+        `DOCX layout extraction failed, falling back to mammoth: ${error instanceof Error ? error.message : error}`,
+      );
+      return this.extractContentWithMammoth(fileBuffer);
+    }
+  }
+
+  /**
+   * Extract DOCX content in a single streaming pass over document.xml
+   * (extract_docx op of the Python worker). The text carries the same
+   * [FIGURE:docximgN], table and formula markers as the PDF extraction;
+   * tables keep their merged cells and the outline comes from the heading
+   * paragraph styles.
+   */
+  async extractDocxWithLayout(
+    fileBuffer: Buffer,
+    onProgress?: (event: ProgressEvent) => void,
+  ): Promise<ExtractionResult> {
+    this.logger.log('Extracting DOCX content with layout...');
+
+    const { result, images } = await this.runWorkerExtraction('docx', fileBuffer, {
+      onProgress,
+      stallTimeoutMs: DOCX_EXTRACTION_STALL_TIMEOUT_MS,
+    });
+
+    const tables: ExtractedTable[] = result.tables.map((table: any) => ({
+      id: table.id,
+      rows: table.rows,
+      rowCount: table.row_count,
+      colCount: table.col_count,
+      cells: table.cells,
+    }));
+
+    this.logger.log(
+      `Extracted ${result.text_with_images.length} characters, ${images.size} images, ${tables.length} tables, ${result.equation_count} equations`,
+    );
+
+    return {
+      text: result.text_with_images,
+      images,
+      tables,
+      outline: result.outline,
+      tokenPlan: result.token_plan,
+    };
+  }
+
+  private async extractContentWithMammoth(fileBuffer: Buffer): Promise<ExtractionResult> {
     this.logger.log('Extracting content from uploaded document...');
 
     const images = new Map<string, ExtractedImage>();
@@ -252,66 +341,44 @@ export class ExtractionService {
   /**
    * 从 PDF 文件中提取内容，保留图片位置信息（使用 PyMuPDF）
    * 返回的 text 中包含 [FIGURE:pdfimgX] 标记
+   * onProgress 接收提取进度事件（已完成页数/总页数、图片数、阶段、耗时）
    */
-  async extractPdfWithLayout(fileBuffer: Buffer): Promise<ExtractionResult> {
+  async extractPdfWithLayout(
+    fileBuffer: Buffer,
+    onProgress?: (event: ProgressEvent) => void,
+  ): Promise<ExtractionResult> {
     this.logger.log('Extracting PDF content with layout using PyMuPDF...');
 
-    const images = new Map<string, ExtractedImage>();
     const tables: ExtractedTable[] = [];
-    const tmpId = uuidv4();
-    const tmpPdf = `/tmp/pdf-${tmpId}.pdf`;
-    const tmpDir = `/tmp/pdf-extract-${tmpId}`;
 
     try {
-      // 写入临时 PDF 文件
-      fs.writeFileSync(tmpPdf, fileBuffer);
-      fs.mkdirSync(tmpDir, { recursive: true });
-
-      // 调用 Python 脚本 (2>/dev/null redirects stderr to prevent warnings from mixing with JSON)
-      const scriptPath = path.join(__dirname, '../../scripts/extract_pdf.py');
-      const output = execSync(
-        `python3 "${scriptPath}" "${tmpPdf}" "${tmpDir}" 2>/dev/null`,
-        { encoding: 'utf-8', maxBuffer: 50 * 1024 * 1024 },
-      );
-
-      // Parse JSON with defensive handling for any remaining non-JSON output
-      const result = this.parseJsonFromOutput(output);
-
-      // 读取提取的图片
-      for (const img of result.images) {
-        const imgPath = path.join(tmpDir, img.filename);
-        if (fs.existsSync(imgPath)) {
-          const buffer = fs.readFileSync(imgPath);
-          const ext = path.extname(img.filename).slice(1) || 'png';
-          images.set(img.id, {
-            id: img.id,
-            buffer,
-            extension: ext,
-            contentType: this.getContentType(ext),
-          });
-        }
-      }
+      // 由常驻的 Python worker 提取（无需每次启动解释器并导入 PyMuPDF）
+      const { result, images } = await this.runWorkerExtraction('pdf', fileBuffer, {
+        onProgress,
+        stallTimeoutMs: PDF_EXTRACTION_STALL_TIMEOUT_MS,
+      });
 
       this.logger.log(
         `Extracted ${result.text_with_images.length} chars, ${images.size} images with layout`,
       );
-
-      // 清理临时文件
-      fs.unlinkSync(tmpPdf);
-      if (fs.existsSync(tmpDir)) {
-        fs.rmSync(tmpDir, { recursive: true });
+      const degradedPages: DegradedPage[] = result.degraded_pages || [];
+      if (degradedPages.length > 0) {
+        this.logger.warn(
+          `Pages extracted as plain text after exceeding a time budget: ${degradedPages
+            .map((p) => `${p.page} (${p.stage})`)
+            .join(', ')}`,
+        );
       }
 
       return {
         text: result.text_with_images,
         images,
         tables,
+        outline: result.outline,
+        degradedPages,
+        tokenPlan: result.token_plan,
       };
     } catch (error) {
-      // 清理临时文件
-      if (fs.existsSync(tmpPdf)) fs.unlinkSync(tmpPdf);
-      if (fs.existsSync(tmpDir)) fs.rmSync(tmpDir, { recursive: true });
-
       this.logger.error('Failed to extract PDF with layout', error);
       throw new Error(
         `PDF layout extraction failed: ${error instanceof Error ? error.message : 'Unknown error'}`,
@@ -398,32 +465,44 @@ export class ExtractionService {
   }
 
   /**
-   * Safely parse JSON from command output, handling cases where
-   * the output contains markdown fences, descriptions, or other text
-   * surrounding the JSON object
+   * Run the extraction op of the Python worker for format (extract_pdf /
+   * extract_docx) on fileBuffer. The input and the images the op writes live in a temporary
+   * directory that is removed afterwards; images are returned by id.
    */
-  private parseJsonFromOutput(output: string): any {
-    const trimmed = output.trim();
+  private async runWorkerExtraction(
+    format: 'pdf' | 'docx',
+    fileBuffer: Buffer,
+    options: WorkerCallOptions,
+  ): Promise<{ result: any; images: Map<string, ExtractedImage> }> {
+    const workDir = `/tmp/${format}-extract-${uuidv4()}`;
+    const inputPath = `${workDir}/input.${format}`;
+    const outputDir = `${workDir}/images`;
 
-    // Fast path: output starts with valid JSON
-    if (trimmed.startsWith('{')) {
-      try {
-        return JSON.parse(trimmed);
-      } catch {
-        // Fall through to regex extraction
-      }
-    }
+    try {
+      fs.mkdirSync(outputDir, { recursive: true });
+      fs.writeFileSync(inputPath, fileBuffer);
+      const result = await runWorkerOp(
+        `extract_${format}`,
+        { [`${format}_path`]: inputPath, output_dir: outputDir },
+        options,
+      );
 
-    // Use regex to find the outermost JSON object { ... }
-    // This handles cases like: "```json\n{...}\n```" or "Here is the result:\n{...}"
-    const jsonMatch = trimmed.match(/\{[\s\S]*\}/);
-    if (!jsonMatch) {
-      this.logger.error('No JSON object found in Python output:', trimmed.substring(0, 200));
-      throw new Error('No JSON found in Python script output');
+      const images = new Map<string, ExtractedImage>();
+      for (const img of result.images) {
+        const imagePath = path.join(outputDir, img.filename);
+        if (fs.existsSync(imagePath)) {
+          const ext = path.extname(img.filename).slice(1) || 'png';
+          images.set(img.id, {
+            id: img.id,
+            buffer: fs.readFileSync(imagePath),
+            extension: ext,
+            contentType: this.getContentType(ext),
+          });
+        }
+      }
+      return { result, images };
+    } finally {
+      fs.rmSync(workDir, { recursive: true, force: true });
     }
-
-    const jsonStr = jsonMatch[0];
-    this.logger.warn('Extracted JSON from output with surrounding text');
-    return JSON.parse(jsonStr);
   }
 }
@@ -0,0 +1,232 @@
+import { ChildProcess, spawn } from 'child_process';
+import { Socket } from 'net';
+import * as path from 'path';
+
+/**
+ * Progress event of a Python script (see scripts/progress.py), passed on by
+ * the worker as a progress line of the request. Fields besides stage and
+ * elapsed_ms depend on the stage, e.g. pages_done/pages_total/images while
+ * extracting a PDF.
+ */
+export interface ProgressEvent {
+  event: 'progress';
+  stage: string;
+  elapsed_ms: number;
+  pages_done?: number;
+  pages_total?: number;
+  images?: number;
+  sections_done?: number;
+  sections_total?: number;
+  [field: string]: unknown;
+}
+
+export interface WorkerCallOptions {
+  onProgress?: (event: ProgressEvent) => void;
+  stallTimeoutMs?: number; // fail when no progress event arrives for this long
+  timeoutMs?: number; // fail when the request runs longer than this
+}
+
+interface PendingCall {
+  op: string;
+  line: string;
+  options: WorkerCallOptions;
+  resolve: (result: any) => void;
+  reject: (error: Error) => void;
+  lastStage: string;
+  resent: boolean;
+  stallTimer?: NodeJS.Timeout;
+  deadline?: NodeJS.Timeout;
+}
+
+const WORKER_SCRIPT = path.join(__dirname, '../../scripts/worker.py');
+const STDERR_TAIL_BYTES = 4096;
+
+/**
+ * Client of one long-lived scripts/worker.py process, so that requests do
+ * not pay for interpreter start-up and the PyMuPDF / python-docx imports.
+ *
+ * Requests and responses are NDJSON on the worker's stdin/stdout; progress
+ * lines of a request reset its stall timer and go to onProgress. A request
+ * that stalls or runs past its timeout is failed and the worker (with its
+ * pool processes) is killed, since the stuck pool process cannot be
+ * stopped on its own; the other requests in flight are sent once more to
+ * a fresh worker. The process is started on the first request and does not
+ * keep Node running while idle.
+ */
+class PythonWorker {
+  private child: ChildProcess | null = null;
+  private readonly pending = new Map<string, PendingCall>();
+  private nextId = 0;
+  private stdoutBuffer = '';
+  private stderrTail = '';
+
+  call(op: string, args: Record<string, unknown>, options: WorkerCallOptions): Promise<any> {
+    return new Promise((resolve, reject) => {
+      const id = String(++this.nextId);
+      const call: PendingCall = {
+        op,
+        line: JSON.stringify({ id, op, args }) + '\n',
+        options,
+        resolve,
+        reject,
+        lastStage: 'start',
+        resent: false,
+      };
+      this.pending.set(id, call);
+      if (options.timeoutMs) {
+        call.deadline = setTimeout(
+          () => this.abort(id, new Error(`Python worker ${op} timed out after ${options.timeoutMs}ms`)),
+          options.timeoutMs,
+        );
+      }
+      this.armStallTimer(id, call);
+      this.send(call);
+    });
+  }
+
+  private send(call: PendingCall): void {
+    const child = this.child ?? this.start();
+    this.setRef(child, true);
+    child.stdin!.write(call.line);
+  }
+
+  private start(): ChildProcess {
+    // Own process group, so that killing it takes the pool processes along
+    const child = spawn('python3', [WORKER_SCRIPT], {
+      stdio: ['pipe', 'pipe', 'pipe'],
+      detached: true,
+    });
+    this.child = child;
+    this.stdoutBuffer = '';
+    this.stderrTail = '';
+
+    child.stdout!.setEncoding('utf-8');
+    child.stdout!.on('data', (chunk: string) => {
+      this.stdoutBuffer += chunk;
+      const lines = this.stdoutBuffer.split('\n');
+      this.stdoutBuffer = lines.pop() ?? '';
+      for (const line of lines) {
+        if (line.trim()) this.onLine(line);
+      }
+    });
+    child.stderr!.on('data', (chunk: Buffer) => {
+      this.stderrTail = (this.stderrTail + chunk.toString('utf-8')).slice(-STDERR_TAIL_BYTES);
+    });
+    // Writes after the worker died fail here; its exit handler deals with the requests
+    child.stdin!.on('error', () => undefined);
+    child.on('error', (error) => this.onExit(child, error.message));
+    child.on('exit', (code, signal) =>
+      this.onExit(child, code === null ? `was killed by ${signal}` : `exited with code ${code}`),
+    );
+    return child;
+  }
+
+  private onLine(line: string): void {
+    let message: any;
+    try {
+      message = JSON.parse(line);
+    } catch {
+      return;
+    }
+    const call = this.pending.get(message.id);
+    if (!call) return;
+
+    if (message.event === 'progress') {
+      call.lastStage = message.stage;
+      this.armStallTimer(message.id, call);
+      call.options.onProgress?.(message as ProgressEvent);
+      return;
+    }
+    this.settle(message.id);
+    if (message.ok) {
+      call.resolve(message.result);
+    } else {
+      call.reject(new Error(`Python worker ${call.op} failed: ${message.error}`));
+    }
+  }
+
+  private armStallTimer(id: string, call: PendingCall): void {
+    if (!call.options.stallTimeoutMs) return;
+    clearTimeout(call.stallTimer);
+    call.stallTimer = setTimeout(
+      () =>
+        this.abort(
+          id,
+          new Error(
+            `Python worker ${call.op} stalled: no progress for ${call.options.stallTimeoutMs}ms (last stage: ${call.lastStage})`,
+          ),
+        ),
+      call.options.stallTimeoutMs,
+    );
+  }
+
+  /** Fail a stuck request and kill the worker running it */
+  private abort(id: string, error: Error): void {
+    const call = this.pending.get(id);
+    if (!call) return;
+    this.settle(id);
+    call.reject(error);
+    const child = this.child;
+    if (child?.pid) {
+      try {
+        process.kill(-child.pid, 'SIGKILL');
+      } catch {
+        child.kill('SIGKILL');
+      }
+    }
+  }
+
+  private onExit(child: ChildProcess, reason: string): void {
+    if (this.child !== child) return;
+    this.child = null;
+    const stderr = this.stderrTail.trim();
+    const calls = [...this.pending.entries()];
+    for (const [id, call] of calls) {
+      if (call.resent) {
+        this.settle(id);
+        call.reject(new Error(`Python worker ${reason}: ${stderr}`));
+      } else {
+        call.resent = true;
+      }
+    }
+    for (const call of this.pending.values()) {
+      this.send(call);
+    }
+  }
+
+  private settle(id: string): void {
+    const call = this.pending.get(id);
+    if (!call) return;
+    clearTimeout(call.stallTimer);
+    clearTimeout(call.deadline);
+    this.pending.delete(id);
+    if (this.pending.size === 0 && this.child) {
+      this.setRef(this.child, false);
+    }
+  }
+
+  private setRef(child: ChildProcess, ref: boolean): void {
+    for (const handle of [child, child.stdin, child.stdout, child.stderr] as Array<
+      ChildProcess | Socket | null
+    >) {
+      if (ref) handle?.ref();
+      else handle?.unref();
+    }
+  }
+}
+
+const worker = new PythonWorker();
+
+/**
+ * Run an op of scripts/worker.py (extract_pdf, extract_docx,
+ * generate_docx, ...) in the shared worker process and return its result.
+ * Errors carry the worker's error message, or the tail of its stderr when
+ * the worker itself died.
+ */
+export function runWorkerOp(
+  op: string,
+  args: Record<string, unknown>,
+  options: WorkerCallOptions = {},
+): Promise<any> {
+  return worker.call(op, args, options);
+}
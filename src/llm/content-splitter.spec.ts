@@ -1,5 +1,6 @@
 import { splitContentByStructure, ContentChunk } from './content-splitter';
 import { DocumentStructure } from './structure-extractor';
+import { TokenPlan, DEFAULT_TOKEN_RATES, estimateTokens } from './token-estimator';
 
 describe('ContentSplitter', () => {
   describe('splitContentByStructure', () => {
@@ -159,5 +160,118 @@ describe('ContentSplitter', () => {
       expect(allSections.some((s) => s.level === 2)).toBe(true);
       expect(allSections.some((s) => s.level === 3)).toBe(true);
     });
+
+    it('should keep chunks within the token budget', () => {
+      const paragraph = '这是一个段落的内容。'.repeat(50);
+      const content = [0, 1, 2, 3].map(() => paragraph).join('');
+      const structure: DocumentStructure = {
+        metadata: {},
+        sections: [0, 1, 2, 3].map((i) => ({
+          title: `第${i + 1}节`,
+          level: 1 as const,
+          startPos: i * paragraph.length,
+          endPos: (i + 1) * paragraph.length,
+        })),
+      };
+      const sectionTokens = estimateTokens(paragraph);
+
+      const chunks = splitContentByStructure(content, structure, { tokenBudget: sectionTokens * 2 });
+
+      expect(chunks).toHaveLength(2);
+      chunks.forEach((chunk) => {
+        const tokens = chunk.sections.reduce((sum, s) => sum + estimateTokens(s.content), 0);
+        expect(tokens).toBeLessThanOrEqual(sectionTokens * 2);
+      });
+    });
+
+    it('should not truncate content without sections', () => {
+      const content = ('这是一个段落的内容。'.repeat(100) + '\n\n').repeat(50).trim();
+      const structure: DocumentStructure = { metadata: {}, sections: [] };
+
+      const chunks = splitContentByStructure(content, structure, { tokenBudget: 2000 });
+
+      expect(chunks.length).toBeGreaterThan(1);
+      const total = chunks.flatMap((c) => c.sections).reduce((sum, s) => sum + s.content.length, 0);
+      expect(total).toBeGreaterThan(content.length * 0.95);
+    });
+
+    it('should use the extractor chunk plan when there are no sections', () => {
+      const content = '第1章 绪论\n绪论内容。\n第2章 方法\n方法内容。';
+      const secondStart = content.indexOf('第2章');
+      const tokenPlan: TokenPlan = {
+        budget: 100,
+        total_tokens: 20,
+        rates: DEFAULT_TOKEN_RATES,
+        blocks: [],
+        chunks: [
+          { start: 0, end: secondStart, tokens: 10, title: '第1章 绪论', level: 1, continued: false, oversized: false },
+          {
+            start: secondStart,
+            end: content.length,
+            tokens: 10,
+            title: '第2章 方法',
+            level: 1,
+            continued: false,
+            oversized: false,
+          },
+        ],
+      };
+      const structure: DocumentStructure = { metadata: {}, sections: [] };
+
+      const chunks = splitContentByStructure(content, structure, { tokenBudget: 100, tokenPlan });
+
+      const sections = chunks.flatMap((c) => c.sections);
+      expect(sections.map((s) => s.title)).toEqual(['第1章 绪论', '第2章 方法']);
+      expect(sections[1].content).toBe('方法内容。');
+    });
+
+    describe('with a chunk plan and structure sections', () => {
+      const content = '摘要\n摘要内容。\n第1章 绪论\n绪论内容。\n第2章 方法\n方法内容。\n参考文献\n[1] 文献。';
+      const firstStart = content.indexOf('第1章');
+      const secondStart = content.indexOf('第2章');
+      const referencesStart = content.indexOf('参考文献');
+      const planChunk = (start: number, end: number, title: string | null) => ({
+        start,
+        end,
+        tokens: 10,
+        title,
+        level: title ? 1 : null,
+        continued: false,
+        oversized: false,
+      });
+      const tokenPlan: TokenPlan = {
+        budget: 100,
+        total_tokens: 40,
+        rates: DEFAULT_TOKEN_RATES,
+        blocks: [],
+        chunks: [planChunk(0, secondStart, null), planChunk(secondStart, content.length, '第2章 方法')],
+      };
+      const structure: DocumentStructure = {
+        metadata: {},
+        sections: [
+          { title: '绪论', level: 1, startPos: firstStart, endPos: secondStart },
+          { title: '方法', level: 1, startPos: secondStart, endPos: referencesStart },
+        ],
+        abstractRange: { start: 0, end: firstStart },
+        referencesRange: { start: referencesStart, end: content.length },
+      };
+
+      it('should prefer the plan made for the same budget and text', () => {
+        const chunks = splitContentByStructure(content, structure, { tokenBudget: 100, tokenPlan });
+
+        const sections = chunks.flatMap((c) => c.sections);
+        expect(sections.map((s) => s.title)).toEqual(['', '第2章 方法']);
+        expect(sections[0].content).toBe('第1章 绪论\n绪论内容。');
+        expect(sections[1].content).toBe('方法内容。');
+        expect(chunks.some((c) => c.includesAbstract)).toBe(true);
+        expect(chunks.some((c) => c.includesReferences)).toBe(true);
+      });
+
+      it('should use the structure when the plan was made for another budget', () => {
+        const chunks = splitContentByStructure(content, structure, { tokenBudget: 200, tokenPlan });
+
+        expect(chunks.flatMap((c) => c.sections).map((s) => s.title)).toEqual(['绪论', '方法']);
+      });
+    });
   });
 });
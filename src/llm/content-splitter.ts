@@ -1,5 +1,6 @@
 import { Logger } from '@nestjs/common';
 import { DocumentStructure } from './structure-extractor';
+import { DEFAULT_CHUNK_TOKEN_BUDGET, TokenPlan, estimateTokens } from './token-estimator';
 
 /**
  * A chunk of content to be processed by the LLM
@@ -20,7 +21,18 @@ export interface ContentChunk {
   acknowledgementsContent?: string;
 }
 
-const MAX_CHUNK_SIZE = 40000; // Characters per chunk
+/**
+ * Options of splitContentByStructure
+ */
+export interface SplitOptions {
+  tokenBudget?: number; // Estimated tokens per chunk (default: the plan's budget or DEFAULT_CHUNK_TOKEN_BUDGET)
+  tokenPlan?: TokenPlan; // The extractor's token estimates and heading-aligned chunk plan
+}
+
+type SectionContent = { title: string; level: 1 | 2 | 3; content: string };
+type TextRange = { start: number; end: number };
+type TokenCounter = (text: string) => number;
+
 const logger = new Logger('ContentSplitter');
 
 /**
@@ -56,44 +68,10 @@ function stripSectionHeaderFromContent(content: string, sectionTitle: string): s
 }
 
 /**
- * Splits content into processable chunks based on document structure
+ * Content of each section of the structure
  */
-export function splitContentByStructure(content: string, structure: DocumentStructure): ContentChunk[] {
-  const chunks: ContentChunk[] = [];
-
-  // Extract special sections first
-  const abstractContent = structure.abstractRange
-    ? content.slice(structure.abstractRange.start, structure.abstractRange.end).trim()
-    : undefined;
-
-  const referencesContent = structure.referencesRange
-    ? content.slice(structure.referencesRange.start, structure.referencesRange.end).trim()
-    : undefined;
-
-  const acknowledgementsContent = structure.acknowledgementsRange
-    ? content.slice(structure.acknowledgementsRange.start, structure.acknowledgementsRange.end).trim()
-    : undefined;
-
-  // If we have no sections from structure extraction, treat as single chunk
-  if (structure.sections.length === 0) {
-    logger.warn('No sections found in structure, treating entire content as single chunk');
-    return [
-      {
-        sections: [{ title: '', level: 1, content: content.slice(0, MAX_CHUNK_SIZE) }],
-        chunkIndex: 0,
-        totalChunks: 1,
-        includesAbstract: !!abstractContent,
-        includesReferences: !!referencesContent,
-        includesAcknowledgements: !!acknowledgementsContent,
-        abstractContent,
-        referencesContent,
-        acknowledgementsContent,
-      },
-    ];
-  }
-
-  // Extract content for each section
-  const sectionsWithContent = structure.sections.map((sec, idx) => {
+function structureSections(content: string, structure: DocumentStructure): SectionContent[] {
+  return structure.sections.map((sec, idx) => {
     const nextSection = structure.sections[idx + 1];
     const endPos = nextSection ? nextSection.startPos : content.length;
 
@@ -114,8 +92,102 @@ export function splitContentByStructure(content: string, structure: DocumentStru
       content: cleanedContent,
     };
   });
+}
+
+/**
+ * Text of content between start and end, leaving out the given ranges
+ */
+function sliceWithout(content: string, start: number, end: number, ranges: TextRange[]): string {
+  const pieces: string[] = [];
+  let pos = start;
+  for (const range of [...ranges].sort((a, b) => a.start - b.start)) {
+    if (range.end <= pos || range.start >= end) continue;
+    if (range.start > pos) pieces.push(content.slice(pos, range.start));
+    pos = Math.max(pos, range.end);
+  }
+  if (pos < end) pieces.push(content.slice(pos, end));
+  return pieces.join('\n').trim();
+}
+
+/**
+ * Sections from the extractor's planned chunks, or null when there is no
+ * plan for this budget and this text. Special sections (excluded) are sent
+ * separately and left out of the chunks.
+ */
+function plannedSections(
+  content: string,
+  budget: number,
+  tokenPlan: TokenPlan | undefined,
+  excluded: TextRange[],
+): SectionContent[] | null {
+  const plannedChunks = tokenPlan?.chunks ?? [];
+  if (
+    tokenPlan?.budget !== budget ||
+    plannedChunks.length === 0 ||
+    plannedChunks[plannedChunks.length - 1].end !== content.length
+  ) {
+    return null;
+  }
+
+  return plannedChunks
+    .map((chunk) => {
+      const title = chunk.title ?? '';
+      const rawContent = sliceWithout(content, chunk.start, chunk.end, excluded);
+      return {
+        title: chunk.continued ? `${title}（续）` : title,
+        level: Math.min(Math.max(chunk.level ?? 1, 1), 3) as 1 | 2 | 3,
+        content: chunk.continued ? rawContent : stripSectionHeaderFromContent(rawContent, title),
+      };
+    })
+    .filter((section) => section.content.length > 0);
+}
+
+/**
+ * Splits content into processable chunks based on document structure.
+ * Chunks are sized in estimated tokens (see token-estimator), using the
+ * extractor's calibrated rates when a token plan is given. A token plan made
+ * for the same budget and text supplies the sections instead of the
+ * structure, whose special sections are still sent separately.
+ */
+export function splitContentByStructure(
+  content: string,
+  structure: DocumentStructure,
+  options: SplitOptions = {},
+): ContentChunk[] {
+  const chunks: ContentChunk[] = [];
+  const budget = options.tokenBudget ?? options.tokenPlan?.budget ?? DEFAULT_CHUNK_TOKEN_BUDGET;
+  const rates = options.tokenPlan?.rates;
+  const countTokens: TokenCounter = (text) => estimateTokens(text, rates);
+
+  // Extract special sections first
+  const abstractContent = structure.abstractRange
+    ? content.slice(structure.abstractRange.start, structure.abstractRange.end).trim()
+    : undefined;
 
-  // Group sections into chunks that fit within MAX_CHUNK_SIZE
+  const referencesContent = structure.referencesRange
+    ? content.slice(structure.referencesRange.start, structure.referencesRange.end).trim()
+    : undefined;
+
+  const acknowledgementsContent = structure.acknowledgementsRange
+    ? content.slice(structure.acknowledgementsRange.start, structure.acknowledgementsRange.end).trim()
+    : undefined;
+
+  // Sections from the extractor's chunk plan when it was made for this budget
+  // and this text (chunks cut at headings, within the budget), otherwise from
+  // structure extraction
+  const specialRanges = [structure.abstractRange, structure.referencesRange, structure.acknowledgementsRange]
+    .filter((range): range is TextRange => !!range);
+  let sectionsWithContent = plannedSections(content, budget, options.tokenPlan, specialRanges);
+  if (sectionsWithContent) {
+    logger.log(`Using the extractor's chunk plan (${sectionsWithContent.length} chunks)`);
+  } else if (structure.sections.length > 0) {
+    sectionsWithContent = structureSections(content, structure);
+  } else {
+    logger.warn('No sections found in structure and no matching chunk plan, splitting the whole content');
+    sectionsWithContent = [{ title: '', level: 1, content }];
+  }
+
+  // Group sections into chunks that fit within the token budget
   let currentChunk: ContentChunk = {
     sections: [],
     chunkIndex: 0,
@@ -124,10 +196,10 @@ export function splitContentByStructure(content: string, structure: DocumentStru
   let currentChunkSize = 0;
 
   for (const section of sectionsWithContent) {
-    const sectionSize = section.content.length;
+    const sectionSize = countTokens(section.content);
 
-    // If a single section exceeds max size, split it at paragraph boundaries
-    if (sectionSize > MAX_CHUNK_SIZE) {
+    // If a single section exceeds the budget, split it at paragraph boundaries
+    if (sectionSize > budget) {
       // Flush current chunk if not empty
       if (currentChunk.sections.length > 0) {
         chunks.push(currentChunk);
@@ -140,7 +212,7 @@ export function splitContentByStructure(content: string, structure: DocumentStru
       }
 
       // Split large section into multiple chunks
-      const subChunks = splitLargeSectionAtParagraphs(section);
+      const subChunks = splitLargeSectionAtParagraphs(section, budget, countTokens);
       for (const subChunk of subChunks) {
         chunks.push({
           sections: [subChunk],
@@ -152,7 +224,7 @@ export function splitContentByStructure(content: string, structure: DocumentStru
     }
 
     // Check if adding this section would exceed the limit
-    if (currentChunkSize + sectionSize > MAX_CHUNK_SIZE && currentChunk.sections.length > 0) {
+    if (currentChunkSize + sectionSize > budget && currentChunk.sections.length > 0) {
       // Flush current chunk
       chunks.push(currentChunk);
       currentChunk = {
@@ -177,10 +249,10 @@ export function splitContentByStructure(content: string, structure: DocumentStru
   if (chunks.length > 0) {
     // Abstract goes with the first chunk
     if (abstractContent) {
-      const abstractSize = abstractContent.length;
-      const firstChunkSize = chunks[0].sections.reduce((sum, s) => sum + s.content.length, 0);
+      const abstractSize = countTokens(abstractContent);
+      const firstChunkSize = chunkTokens(chunks[0], countTokens);
 
-      if (firstChunkSize + abstractSize <= MAX_CHUNK_SIZE) {
+      if (firstChunkSize + abstractSize <= budget) {
         chunks[0].includesAbstract = true;
         chunks[0].abstractContent = abstractContent;
       } else {
@@ -197,10 +269,10 @@ export function splitContentByStructure(content: string, structure: DocumentStru
 
     // References and acknowledgements go with the last chunk or separate
     const lastChunk = chunks[chunks.length - 1];
-    const lastChunkSize = lastChunk.sections.reduce((sum, s) => sum + s.content.length, 0);
+    const lastChunkSize = chunkTokens(lastChunk, countTokens);
 
     if (acknowledgementsContent) {
-      if (lastChunkSize + acknowledgementsContent.length <= MAX_CHUNK_SIZE) {
+      if (lastChunkSize + countTokens(acknowledgementsContent) <= budget) {
         lastChunk.includesAcknowledgements = true;
         lastChunk.acknowledgementsContent = acknowledgementsContent;
       } else {
@@ -216,9 +288,9 @@ export function splitContentByStructure(content: string, structure: DocumentStru
 
     if (referencesContent) {
       const targetChunk = chunks[chunks.length - 1];
-      const targetSize = targetChunk.sections.reduce((sum, s) => sum + s.content.length, 0);
+      const targetSize = chunkTokens(targetChunk, countTokens);
 
-      if (targetSize + referencesContent.length <= MAX_CHUNK_SIZE) {
+      if (targetSize + countTokens(referencesContent) <= budget) {
         targetChunk.includesReferences = true;
         targetChunk.referencesContent = referencesContent;
       } else {
@@ -240,36 +312,49 @@ export function splitContentByStructure(content: string, structure: DocumentStru
     chunk.totalChunks = totalChunks;
   });
 
-  logger.log(`Content split into ${totalChunks} chunks`);
+  logger.log(`Content split into ${totalChunks} chunks of at most ${budget} estimated tokens`);
   return chunks;
 }
 
+/**
+ * Estimated tokens of a chunk's section contents
+ */
+function chunkTokens(chunk: ContentChunk, countTokens: TokenCounter): number {
+  return chunk.sections.reduce((sum, s) => sum + countTokens(s.content), 0);
+}
+
 /**
  * Splits a large section at paragraph boundaries
  */
 function splitLargeSectionAtParagraphs(
-  section: { title: string; level: 1 | 2 | 3; content: string },
-): Array<{ title: string; level: 1 | 2 | 3; content: string }> {
-  const results: Array<{ title: string; level: 1 | 2 | 3; content: string }> = [];
+  section: SectionContent,
+  budget: number,
+  countTokens: TokenCounter,
+): SectionContent[] {
+  const results: SectionContent[] = [];
   const content = section.content;
 
   // Split by double newlines (paragraph boundaries)
   const paragraphs = content.split(/\n\n+/);
 
   let currentContent = '';
+  let currentTokens = 0;
   let partIndex = 1;
 
   for (const paragraph of paragraphs) {
-    if (currentContent.length + paragraph.length > MAX_CHUNK_SIZE && currentContent.length > 0) {
+    const paragraphTokens = countTokens(paragraph);
+    if (currentTokens + paragraphTokens > budget && currentContent.length > 0) {
       results.push({
         title: results.length === 0 ? section.title : `${section.title}（续${partIndex}）`,
         level: section.level,
         content: currentContent.trim(),
       });
       currentContent = paragraph;
+      currentTokens = paragraphTokens;
       partIndex++;
     } else {
       currentContent += (currentContent ? '\n\n' : '') + paragraph;
+      currentTokens += paragraphTokens;
     }
   }
 
@@ -283,27 +368,31 @@ function splitLargeSectionAtParagraphs(
   }
 
   // If we couldn't split at paragraphs (single huge paragraph), force split
-  if (results.length === 0 || results.some((r) => r.content.length > MAX_CHUNK_SIZE)) {
-    return forceSplitContent(section);
+  if (results.length === 0 || results.some((r) => countTokens(r.content) > budget)) {
+    return forceSplitContent(section, budget, countTokens);
   }
 
   return results;
 }
 
 /**
- * Force splits content at character boundaries as a last resort
+ * Force splits content at character boundaries as a last resort, with the
+ * section's average characters per token converting the budget to characters
  */
 function forceSplitContent(
-  section: { title: string; level: 1 | 2 | 3; content: string },
-): Array<{ title: string; level: 1 | 2 | 3; content: string }> {
-  const results: Array<{ title: string; level: 1 | 2 | 3; content: string }> = [];
+  section: SectionContent,
+  budget: number,
+  countTokens: TokenCounter,
+): SectionContent[] {
+  const results: SectionContent[] = [];
   const content = section.content;
+  const maxChars = Math.max(1, Math.floor((budget * content.length) / Math.max(1, countTokens(content))));
 
   let start = 0;
   let partIndex = 1;
 
   while (start < content.length) {
-    let end = Math.min(start + MAX_CHUNK_SIZE, content.length);
+    let end = Math.min(start + maxChars, content.length);
 
     // Try to break at a sentence boundary
     if (end < content.length) {
@@ -311,7 +400,7 @@ function forceSplitContent(
       const lastPeriod = content.slice(start, end).lastIndexOf('. ');
       const breakPoint = Math.max(lastSentenceEnd, lastPeriod);
 
-      if (breakPoint > MAX_CHUNK_SIZE * 0.5) {
+      if (breakPoint > maxChars * 0.5) {
         end = start + breakPoint + 1;
       }
     }
@@ -11,6 +11,12 @@ import {
   extractStructureWithRegex,
 } from './structure-extractor';
 import { ContentChunk, splitContentByStructure } from './content-splitter';
+import {
+  DEFAULT_CHUNK_TOKEN_BUDGET,
+  DEFAULT_SINGLE_CALL_TOKEN_LIMIT,
+  TokenPlan,
+  estimateTokens,
+} from './token-estimator';
 import {
   ChunkProcessingResult,
   buildChunkPrompt,
@@ -31,14 +37,13 @@ import {
   buildAcknowledgementsPrompt,
 } from './prompts';
 
-// Threshold for switching to multi-phase processing
-const LONG_CONTENT_THRESHOLD = 45000;
-
 @Injectable()
 export class LlmService {
   private readonly logger = new Logger(LlmService.name);
   private readonly openai: OpenAI | null = null;
   private readonly useGateway: boolean;
+  private readonly chunkTokenBudget: number;
+  private readonly singleCallTokenLimit: number;
 
   constructor(
     private readonly configService: ConfigService,
@@ -46,6 +51,10 @@ export class LlmService {
     @Optional() private readonly gatewayProxy?: GatewayProxyService,
   ) {
     const defaultModel = this.modelConfigService.getDefaultModel();
+    this.chunkTokenBudget =
+      Number(this.configService.get<string>('LLM_CHUNK_TOKEN_BUDGET')) || DEFAULT_CHUNK_TOKEN_BUDGET;
+    this.singleCallTokenLimit =
+      Number(this.configService.get<string>('LLM_SINGLE_CALL_TOKEN_LIMIT')) || DEFAULT_SINGLE_CALL_TOKEN_LIMIT;
 
     // Check if Gateway is configured
     if (this.gatewayProxy?.isConfigured()) {
@@ -78,12 +87,14 @@ export class LlmService {
    * @param userToken 用户 JWT token（Gateway 模式需要）
    * @param model 指定的 LLM 模型（可选，默认使用配置的模型）
    * @param templateRequiredFields 模板必需字段列表（用于模板感知提取）
+   * @param tokenPlan 提取器给出的 token 估计与分块方案（可选，用于长文档分块）
    */
   async parseThesisContent(
     content: string,
     userToken?: string,
     model?: string,
     templateRequiredFields?: string[],
+    tokenPlan?: TokenPlan,
   ): Promise<ThesisData> {
     const resolvedModel = model || this.modelConfigService.getDefaultModel();
     this.logger.log(`Parsing thesis content with LLM (model: ${resolvedModel})... (${content.length} characters)`);
@@ -92,12 +103,15 @@ export class LlmService {
       this.logger.log(`Template-aware extraction for fields: ${templateRequiredFields.join(', ')}`);
     }
 
-    // Route to appropriate processing method based on content length
-    if (content.length < LONG_CONTENT_THRESHOLD) {
+    // Route on estimated tokens: content within the single-call limit is parsed in one call
+    const estimatedTokens = tokenPlan?.total_tokens ?? estimateTokens(content);
+    if (estimatedTokens <= this.singleCallTokenLimit) {
       return this.parseThesisContentSingleCall(content, userToken, resolvedModel, templateRequiredFields);
     } else {
-      this.logger.log(`Content exceeds ${LONG_CONTENT_THRESHOLD} chars, using two-phase processing`);
-      return this.parseThesisContentMultiPhase(content, userToken, resolvedModel, templateRequiredFields);
+      this.logger.log(
+        `Content estimated at ${estimatedTokens} tokens exceeds the ${this.singleCallTokenLimit}-token single-call limit, using two-phase processing`,
+      );
+      return this.parseThesisContentMultiPhase(content, userToken, resolvedModel, templateRequiredFields, tokenPlan);
     }
   }
 
@@ -146,6 +160,7 @@ export class LlmService {
     userToken?: string,
     model?: string,
     templateRequiredFields?: string[],
+    tokenPlan?: TokenPlan,
   ): Promise<ThesisDataWithWarnings> {
     try {
       // Phase 1: Extract document structure
@@ -163,7 +178,10 @@ export class LlmService {
       }
 
       // Split content into chunks based on structure
-      const chunks = splitContentByStructure(content, structure);
+      const chunks = splitContentByStructure(content, structure, {
+        tokenBudget: this.chunkTokenBudget,
+        tokenPlan,
+      });
       this.logger.log(`Content split into ${chunks.length} chunks for processing`);
 
       // Phase 2: Process chunks in parallel
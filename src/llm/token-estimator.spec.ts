@@ -0,0 +1,56 @@
+import * as fs from 'fs';
+import * as path from 'path';
+import { DEFAULT_TOKEN_RATES, estimateTokens } from './token-estimator';
+
+// Cases shared with scripts/tests/test_token_budget.py, so both estimators give the same counts
+const TEST_FILES = path.join(__dirname, '../../test-files');
+const SHARED_ESTIMATES: Array<{ text?: string; file?: string; tokens: number }> = JSON.parse(
+  fs.readFileSync(path.join(TEST_FILES, 'token-estimates.json'), 'utf-8'),
+);
+
+describe('TokenEstimator', () => {
+  describe('estimateTokens', () => {
+    it('should return 0 for empty text', () => {
+      expect(estimateTokens('')).toBe(0);
+    });
+
+    it('should count CJK characters individually', () => {
+      const text = '深度学习方法在图像识别任务中取得了显著进展';
+
+      expect(estimateTokens(text)).toBe(Math.ceil(text.length * DEFAULT_TOKEN_RATES.cjk));
+    });
+
+    it('should estimate fewer tokens per character for English than for Chinese', () => {
+      const english = 'The proposed method improves the recognition accuracy on several benchmarks.';
+      const chinese = '本文提出的方法在多个基准数据集上提高了识别准确率，同时保持了较低的计算成本。';
+
+      expect(estimateTokens(english) / english.length).toBeLessThan(
+        estimateTokens(chinese) / chinese.length,
+      );
+    });
+
+    it('should count digits in groups of three', () => {
+      expect(estimateTokens('123')).toBe(1);
+      expect(estimateTokens('1234567')).toBe(3);
+    });
+
+    it('should not count the ideographic space or × and ÷ as text', () => {
+      const rates = { cjk: 1, words: 0, letters: 0, digits: 0, symbols: 100, newlines: 0 };
+
+      // 摘 and 要 plus two symbols, as scripts/token_budget.py counts them
+      expect(estimateTokens('摘\u3000要\n3×4÷2', rates)).toBe(202);
+    });
+
+    it('should use the given rates', () => {
+      const rates = { ...DEFAULT_TOKEN_RATES, cjk: 2 };
+
+      expect(estimateTokens('绪论', rates)).toBe(4);
+    });
+
+    it.each(SHARED_ESTIMATES)('should match scripts/token_budget.py on shared case %#', (sample) => {
+      const text = sample.file ? fs.readFileSync(path.join(TEST_FILES, sample.file), 'utf-8') : sample.text!;
+
+      expect(estimateTokens(text)).toBe(sample.tokens);
+    });
+  });
+});
@@ -0,0 +1,106 @@
+/**
+ * CJK-aware token estimates, mirroring scripts/token_budget.py.
+ *
+ * Characters are a poor measure of LLM input on mixed Chinese/English text:
+ * a CJK character is about one token, an English word about one and a third.
+ * Tokens are estimated as a weighted sum of character-class counts; the
+ * rates can be refitted with `python scripts/token_budget.py calibrate`.
+ */
+
+// Chunk calls answer with up to 16000 tokens and reproduce their input,
+// so larger chunks get truncated and retried
+export const DEFAULT_CHUNK_TOKEN_BUDGET = 12000;
+
+// Documents up to this estimate are parsed in a single call: the former
+// 45000-character limit, at the ~0.5 tokens per character of the sample
+// theses in test-files/
+export const DEFAULT_SINGLE_CALL_TOKEN_LIMIT = 22500;
+
+export interface TokenRates {
+  cjk: number; // CJK ideographs, kana, hangul and full-width punctuation
+  words: number; // runs of Latin letters ...
+  letters: number; // ... plus their length
+  digits: number; // groups of up to three digits
+  symbols: number; // other non-space characters
+  newlines: number; // runs of line breaks
+}
+
+export const DEFAULT_TOKEN_RATES: TokenRates = {
+  cjk: 0.8,
+  words: 0.6,
+  letters: 0.12,
+  digits: 1.0,
+  symbols: 0.8,
+  newlines: 1.0,
+};
+
+/**
+ * Block of extracted text with its token estimate; level is set on blocks
+ * that start a heading's section
+ */
+export interface TokenBlock {
+  start: number;
+  end: number;
+  tokens: number;
+  level?: number;
+}
+
+/**
+ * Chunk proposed by the extractor: a text range cut on a heading boundary
+ * (continued when a section had to be cut between paragraphs)
+ */
+export interface PlannedChunk {
+  start: number;
+  end: number;
+  tokens: number;
+  title: string | null; // heading of the section the chunk starts in
+  level: number | null;
+  continued: boolean;
+  oversized: boolean; // a single block over the budget
+}
+
+/**
+ * token_plan of extract_pdf.py / extract_docx.py results
+ */
+export interface TokenPlan {
+  budget: number;
+  total_tokens: number;
+  rates: TokenRates;
+  blocks: TokenBlock[];
+  chunks: PlannedChunk[];
+}
+
+// CJK ideographs, kana, hangul, CJK and full-width punctuation; not the
+// ideographic space U+3000, which counts as whitespace (see symbols)
+const CJK_PATTERN =
+  /[\u{1100}-\u{11ff}\u{2e80}-\u{2fdf}\u{3001}-\u{30ff}\u{3100}-\u{31ff}\u{3400}-\u{4dbf}\u{4e00}-\u{9fff}\u{a960}-\u{a97f}\u{ac00}-\u{d7ff}\u{f900}-\u{faff}\u{fe30}-\u{fe4f}\u{ff00}-\u{ffef}\u{20000}-\u{3134f}]/gu;
+// Latin letters, without the × and ÷ signs in Latin-1
+const WORD_PATTERN = /[A-Za-z\u00c0-\u00d6\u00d8-\u00f6\u00f8-\u024f]+/g;
+const DIGITS_PATTERN = /[0-9]+/g;
+const NEWLINES_PATTERN = /\n+/g;
+const NON_SPACE_PATTERN = /\S/gu;
+
+/**
+ * Estimated number of tokens of text
+ */
+export function estimateTokens(text: string, rates: TokenRates = DEFAULT_TOKEN_RATES): number {
+  if (!text) return 0;
+
+  const cjk = text.match(CJK_PATTERN)?.length ?? 0;
+  const words = text.match(WORD_PATTERN) ?? [];
+  const letters = words.reduce((sum, word) => sum + word.length, 0);
+  const digitRuns = text.match(DIGITS_PATTERN) ?? [];
+  const digits = digitRuns.reduce((sum, run) => sum + run.length, 0);
+  const digitGroups = digitRuns.reduce((sum, run) => sum + Math.ceil(run.length / 3), 0);
+  const symbols = (text.match(NON_SPACE_PATTERN)?.length ?? 0) - cjk - letters - digits;
+  const newlines = text.match(NEWLINES_PATTERN)?.length ?? 0;
+
+  return Math.ceil(
+    rates.cjk * cjk +
+      rates.words * words.length +
+      rates.letters * letters +
+      rates.digits * digitGroups +
+      rates.symbols * symbols +
+      rates.newlines * newlines,
+  );
+}
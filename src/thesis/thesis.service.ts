@@ -4,6 +4,7 @@ import {
   ExtractionService,
   ExtractedImage,
 } from '../document/extraction.service';
+import { TokenPlan } from '../llm/token-estimator';
 import { LlmService } from '../llm/llm.service';
 import { ReferenceFormatterService } from '../reference/reference-formatter.service';
 import { JobService } from '../job/job.service';
@@ -12,6 +13,7 @@ import { TemplateService } from '../template/template.service';
 import { LatexTemplate } from '../template/entities/template.entity';
 import { LatexService } from '../latex/latex.service';
 import { AnalysisService } from './analysis.service';
+import { runWorkerOp } from '../document/python-worker';
 import {
   ThesisData,
   AnalysisResult,
@@ -81,17 +83,20 @@ export class ThesisService {
     // Extract text and images based on format
     let text: string;
     let images = new Map<string, ExtractedImage>();
+    let tokenPlan: TokenPlan | undefined;
 
     if (format === 'docx') {
       const result = await this.extractionService.extractContent(fileBuffer);
       text = result.text;
       images = result.images;
+      tokenPlan = result.tokenPlan;
       this.logger.log(`Extracted ${images.size} images from DOCX`);
     } else if (format === 'pdf') {
       // 使用 PyMuPDF 提取，保留图片位置标记
       const result = await this.extractionService.extractPdfWithLayout(fileBuffer);
       text = result.text;
       images = result.images;
+      tokenPlan = result.tokenPlan;
       this.logger.log(`Extracted ${images.size} images from PDF with layout markers`);
     } else {
       text = fileBuffer.toString('utf-8');
@@ -101,7 +106,7 @@ export class ThesisService {
     const template = this.templateService.findOne(templateId);
 
     // Parse content with LLM
-    const document = await this.parseContent(text, format, images, userToken, model, template);
+    const document = await this.parseContent(text, format, images, userToken, model, template, tokenPlan);
 
     // Create job for async LaTeX rendering
     const job = await this.jobService.createJob(templateId, document, userId);
@@ -117,6 +122,7 @@ export class ThesisService {
    * @param userToken 用户 JWT token（Gateway 模式需要）
    * @param model 指定的 LLM 模型（可选）
    * @param template LaTeX 模板（用于模板感知字段提取）
+   * @param tokenPlan 提取器给出的 token 估计与分块方案（用于长文档分块）
    */
   async parseContent(
     content: string,
@@ -125,6 +131,7 @@ export class ThesisService {
     userToken?: string,
     model?: string,
     template?: LatexTemplate,
+    tokenPlan?: TokenPlan,
   ): Promise<Record<string, any>> {
     this.logger.log(`Parsing content with LLM...${model ? ` (model: ${model})` : ''}`);
 
@@ -135,6 +142,7 @@ export class ThesisService {
       userToken,
       model,
       template?.requiredFields,
+      tokenPlan,
     );
 
     // Format references if present
@@ -228,24 +236,27 @@ export class ThesisService {
     // Extract text and images based on format
     let text: string;
     let images = new Map<string, ExtractedImage>();
+    let tokenPlan: TokenPlan | undefined;
 
     if (format === 'docx') {
       const result = await this.extractionService.extractContent(fileBuffer);
       text = result.text;
       images = result.images;
+      tokenPlan = result.tokenPlan;
       this.logger.log(`Extracted ${images.size} images from DOCX`);
     } else if (format === 'pdf') {
       // 使用 PyMuPDF 提取，保留图片位置标记
       const result = await this.extractionService.extractPdfWithLayout(fileBuffer);
       text = result.text;
       images = result.images;
+      tokenPlan = result.tokenPlan;
       this.logger.log(`Extracted ${images.size} images from PDF with layout markers`);
     } else {
       text = fileBuffer.toString('utf-8');
     }
 
     // Parse content with LLM
-    const document = await this.parseContent(text, format, images, userToken, model);
+    const document = await this.parseContent(text, format, images, userToken, model, undefined, tokenPlan);
 
     // Generate extraction ID and store
     const extractionId = uuidv4();
@@ -364,16 +375,19 @@ export class ThesisService {
     // Extract text and images based on format
     let text: string;
     let images = new Map<string, ExtractedImage>();
+    let tokenPlan: TokenPlan | undefined;
 
     if (format === 'docx') {
       const result = await this.extractionService.extractContent(fileBuffer);
       text = result.text;
       images = result.images;
+      tokenPlan = result.tokenPlan;
       this.logger.log(`Extracted ${images.size} images from DOCX`);
     } else if (format === 'pdf') {
       const result = await this.extractionService.extractPdfWithLayout(fileBuffer);
       text = result.text;
       images = result.images;
+      tokenPlan = result.tokenPlan;
       this.logger.log(`Extracted ${images.size} images from PDF with layout markers`);
     } else {
       text = fileBuffer.toString('utf-8');
@@ -384,7 +398,7 @@ export class ThesisService {
 
     // Use AI parsing to extract content with template awareness
     this.logger.log('Using AI to parse document content...');
-    const parsedDocument = await this.parseContent(text, format, images, userToken, model, template);
+    const parsedDocument = await this.parseContent(text, format, images, userToken, model, template, tokenPlan);
 
     // Convert Record<string, any> to ThesisData type
     const extractedData = parsedDocument as ThesisData;
@@ -684,18 +698,21 @@ export class ThesisService {
     // Extract text, images, and tables
     let text: string;
     let images = new Map<string, ExtractedImage>();
+    let tokenPlan: TokenPlan | undefined;
     let tables: Array<{ id: string; rows: string[][]; rowCount: number; colCount: number }> = [];
 
     if (format === 'docx') {
       const result = await this.extractionService.extractContent(fileBuffer);
       text = result.text;
       images = result.images;
+      tokenPlan = result.tokenPlan;
       tables = result.tables;
       this.logger.log(`Extracted ${images.size} images and ${tables.length} tables from DOCX`);
     } else if (format === 'pdf') {
       const result = await this.extractionService.extractPdfContent(fileBuffer);
       text = result.text;
       images = result.images;
+      tokenPlan = result.tokenPlan;
       tables = result.tables;
       this.logger.log(`Extracted ${images.size} images from PDF`);
     } else {
@@ -703,7 +720,7 @@ export class ThesisService {
     }
 
     // Parse content with LLM
-    const document = await this.parseContent(text, format, images, userToken);
+    const document = await this.parseContent(text, format, images, userToken, undefined, undefined, tokenPlan);
 
     // Add tables to document data
     (document as any).tables = tables;
@@ -712,7 +729,6 @@ export class ThesisService {
     const outputId = uuidv4();
     const outputDir = `/tmp/thesis-docx-${outputId}`;
     const fs = await import('fs');
-    const path = await import('path');
 
     fs.mkdirSync(outputDir, { recursive: true });
 
@@ -732,15 +748,16 @@ export class ThesisService {
     const jsonPath = `${outputDir}/data.json`;
     fs.writeFileSync(jsonPath, JSON.stringify(document, null, 2));
 
-    // Run Python script to generate DOCX
+    // Generate the DOCX in the Python worker
     const docxPath = `${outputDir}/output.docx`;
-    const scriptPath = path.join(__dirname, '../../scripts/generate_docx.py');
 
-    const { execSync } = await import('child_process');
     try {
-      execSync(`python3 "${scriptPath}" "${jsonPath}" "${docxPath}" --images-dir "${imagesDir}"`, {
-        timeout: 60000,
-        encoding: 'utf-8',
+      // Fail early when the script stops reporting progress instead of
+      // waiting for the overall timeout
+      await runWorkerOp('generate_docx', { input: jsonPath, output: docxPath, images_dir: imagesDir }, {
+        timeoutMs: 60000,
+        stallTimeoutMs: 20000,
+        onProgress: (event) => this.logger.debug(`DOCX generation: ${JSON.stringify(event)}`),
       });
     } catch (error) {
       this.logger.error('Python DOCX generation failed', error);
@@ -765,17 +782,20 @@ export class ThesisService {
     // Extract text and images based on format
     let text: string;
     let images = new Map<string, ExtractedImage>();
+    let tokenPlan: TokenPlan | undefined;
 
     if (format === 'docx') {
       const result = await this.extractionService.extractContent(fileBuffer);
       text = result.text;
       images = result.images;
+      tokenPlan = result.tokenPlan;
       this.logger.log(`Extracted ${images.size} images from DOCX`);
     } else if (format === 'pdf') {
       // 使用 PyMuPDF 提取，保留图片位置标记
       const result = await this.extractionService.extractPdfWithLayout(fileBuffer);
       text = result.text;
       images = result.images;
+      tokenPlan = result.tokenPlan;
       this.logger.log(`Extracted ${images.size} images from PDF with layout markers`);
     } else {
       text = fileBuffer.toString('utf-8');
@@ -785,7 +805,7 @@ export class ThesisService {
     const template = this.templateService.findOne(templateId);
 
     // Parse content with LLM
-    const document = await this.parseContent(text, format, images, userToken, undefined, template);
+    const document = await this.parseContent(text, format, images, userToken, undefined, template, tokenPlan);
 
     // Render LaTeX and compile to PDF synchronously
     const jobId = uuidv4();